@@ -22,6 +22,17 @@ PY2 = sys.version[0] == "2"
 PY3 = sys.version[0] == "3"
 del sys
 
-from labelme.label_file import LabelFile
-from labelme import testing
-from labelme import utils
+
+
+def __getattr__(name):
+    # LabelFile, testing и utils тянут за собой numpy, PIL и Qt-виджеты,
+    # поэтому загружаются при первом обращении, а не при import labelme
+    if name == "LabelFile":
+        from labelme.label_file import LabelFile
+
+        return LabelFile
+    if name in ("testing", "utils"):
+        import importlib
+
+        return importlib.import_module("labelme." + name)
+    raise AttributeError("module 'labelme' has no attribute {!r}".format(name))
@@ -5,16 +5,9 @@ import os
 import os.path as osp
 import sys
 
-import yaml
-from qtpy import QtCore
-from qtpy import QtWidgets
-
 from labelme import __appname__
 from labelme import __version__
-from labelme.app import MainWindow
-from labelme.config import get_config
-from labelme.logger import logger
-from labelme.utils import newIcon
+from labelme.profiling import StartupProfiler
 
 
 def main():
@@ -84,12 +77,33 @@ def main():
         help="epsilon to find nearest vertex on canvas",
         default=argparse.SUPPRESS,
     )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print import and initialization times after startup",
+    )
     args = parser.parse_args()
 
     if args.version:
         print("{0} {1}".format(__appname__, __version__))
         sys.exit(0)
 
+    profiler = StartupProfiler()
+    profile_startup = args.profile_startup
+    if profile_startup:
+        profiler.install()
+
+    # Тяжёлые модули импортируются после разбора аргументов: --version и
+    # --help не ждут загрузки Qt-виджетов
+    with profiler.stage("imports"):
+        from qtpy import QtCore
+        from qtpy import QtWidgets
+
+        from labelme.app import MainWindow
+        from labelme.config import get_config
+        from labelme.logger import logger
+        from labelme.utils import newIcon
+
     logger.setLevel(getattr(logging, args.logger_level.upper()))
 
     if hasattr(args, "labels"):
@@ -101,11 +115,13 @@ def main():
 
     config_from_args = args.__dict__
     config_from_args.pop("version")
+    config_from_args.pop("profile_startup")
     reset_config = config_from_args.pop("reset_config")
     filename = config_from_args.pop("filename")
     output = config_from_args.pop("output")
     config_file_or_yaml = config_from_args.pop("config")
-    config = get_config(config_file_or_yaml, config_from_args)
+    with profiler.stage("config"):
+        config = get_config(config_file_or_yaml, config_from_args)
 
     if not config["labels"] and config["validate_label"]:
         logger.error(
@@ -123,29 +139,40 @@ def main():
         else:
             output_dir = output
 
-    translator = QtCore.QTranslator()
-    translator.load(
-        QtCore.QLocale.system().name(),
-        osp.dirname(osp.abspath(__file__)) + "/translate",
-    )
-    app = QtWidgets.QApplication(sys.argv)
-    app.setApplicationName(__appname__)
-    app.setWindowIcon(newIcon("icon"))
-    app.installTranslator(translator)
-    win = MainWindow(
-        config=config,
-        filename=filename,
-        output_file=output_file,
-        output_dir=output_dir,
-    )
+    with profiler.stage("QApplication"):
+        translator = QtCore.QTranslator()
+        translator.load(
+            QtCore.QLocale.system().name(),
+            osp.dirname(osp.abspath(__file__)) + "/translate",
+        )
+        app = QtWidgets.QApplication(sys.argv)
+        app.setApplicationName(__appname__)
+        app.setWindowIcon(newIcon("icon"))
+        app.installTranslator(translator)
+    with profiler.stage("MainWindow"):
+        win = MainWindow(
+            config=config,
+            filename=filename,
+            output_file=output_file,
+            output_dir=output_dir,
+        )
 
     if reset_config:
         logger.info("Resetting Qt config: %s" % win.settings.fileName())
         win.settings.clear()
         sys.exit(0)
 
-    win.show()
-    win.raise_()
+    with profiler.stage("show"):
+        win.show()
+        win.raise_()
+    if profile_startup:
+
+        def report():
+            profiler.uninstall()
+            print(profiler.report(), file=sys.stderr)
+
+        # Отчёт - когда цикл событий обработал первые события (отрисовку)
+        QtCore.QTimer.singleShot(0, report)
     sys.exit(app.exec_())
 
 
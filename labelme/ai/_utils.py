@@ -1,6 +1,4 @@
-import imgviz
 import numpy as np
-import skimage
 
 from labelme.logger import logger
 
@@ -12,6 +10,9 @@ def _get_contour_length(contour):
 
 
 def compute_polygon_from_mask(mask):
+    import imgviz
+    import skimage.measure
+
     contours = skimage.measure.find_contours(np.pad(mask, pad_width=1))
     if len(contours) == 0:
         logger.warning("No contour found, so returning empty polygon.")
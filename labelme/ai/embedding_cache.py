@@ -0,0 +1,150 @@
+import collections
+import hashlib
+import os
+import os.path as osp
+import threading
+
+import numpy as np
+
+from ..logger import logger
+
+
+class EmbeddingCache(object):
+    """
+        Кэш эмбеддингов изображений, общий для всех моделей.
+
+        Ключ - хэш содержимого изображения вместе с названием модели и
+        областью обрезки, поэтому само изображение в кэше не хранится.
+        В памяти держатся последние использованные эмбеддинги в пределах
+        memory_budget байт. Если задан cache_dir, эмбеддинги также
+        сохраняются на диск в .npy и при следующем запуске программы
+        открываются через memory map, а самые старые файлы удаляются при
+        превышении disk_budget.
+    """
+
+    def __init__(self, memory_budget=512 * 1024 * 1024, cache_dir=None,
+                 disk_budget=4 * 1024 * 1024 * 1024):
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+
+    @staticmethod
+    def make_key(image: np.ndarray, model_name, crop_rect=None) -> str:
+        """
+            Ключ эмбеддинга. Вычисляется по содержимому изображения без его
+            копирования, поэтому для больших страниц его стоит считать не в
+            UI-потоке.
+
+            crop_rect - (x, y, width, height) обрезки, если изображение -
+            часть страницы
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        header = "{}|{}|{}|{}".format(model_name, crop_rect, image.shape, image.dtype)
+        digest.update(header.encode())
+        if image.flags.c_contiguous:
+            digest.update(memoryview(image).cast("B"))
+        else:
+            # Вид на память QImage или часть страницы: копируется по строке
+            for row in image:
+                digest.update(np.ascontiguousarray(row))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return osp.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        """Возвращает эмбеддинг или None, если его нет ни в памяти, ни на диске."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        if not osp.exists(path):
+            return None
+        try:
+            embedding = np.load(path, mmap_mode="r")
+            os.utime(path)  # порядок удаления - по времени последнего использования
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load image embedding {}: {}".format(path, e))
+            return None
+        logger.debug("Loaded image embedding from disk: {}".format(path))
+        self._putMemory(key, embedding)
+        return embedding
+
+    def put(self, key, embedding: np.ndarray):
+        self._putMemory(key, embedding)
+        if self.cache_dir is not None:
+            self._putDisk(key, embedding)
+
+    def clear(self):
+        """Очищает кэш в памяти. Файлы на диске остаются."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+
+    def memorySize(self):
+        with self._lock:
+            return self._memory_size
+
+    def _putMemory(self, key, embedding):
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= self._memory.pop(key).nbytes
+            self._memory[key] = embedding
+            self._memory_size += embedding.nbytes
+            while self._memory_size > self.memory_budget and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= evicted.nbytes
+
+    def _putDisk(self, key, embedding):
+        path = self._path(key)
+        if osp.exists(path):
+            return
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(embedding))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to save image embedding {}: {}".format(path, e))
+            if osp.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._pruneDisk()
+
+    def _pruneDisk(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+_cache = EmbeddingCache()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _cache
+
+
+def configure_embedding_cache(memory_budget, cache_dir, disk_budget):
+    """Настраивает общий кэш эмбеддингов (вызывается при запуске из конфига)."""
+    _cache.memory_budget = memory_budget
+    _cache.cache_dir = None if cache_dir is None else osp.expanduser(cache_dir)
+    _cache.disk_budget = disk_budget
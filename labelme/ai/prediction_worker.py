@@ -0,0 +1,140 @@
+import threading
+import time
+
+from qtpy import QtCore
+
+from ..logger import logger
+from . import _utils
+
+STAGES = ["encoder_wait", "decoder", "contour"]
+
+
+class PredictionWorker(QtCore.QObject):
+    """
+        Фоновое построение многоугольника по точкам для предпросмотра
+        ai_polygon.
+
+        Запросы не выстраиваются в очередь: хранится только последний, и
+        поток всегда считает самое свежее положение курсора. Если во время
+        расчёта пришёл новый запрос (или запрос отменён), результат
+        выбрасывается после текущего этапа. Результат доставляется сигналом
+        predicted, поэтому UI-поток никогда не ждёт ни кодировщик, ни
+        декодер.
+    """
+
+    # (номер запроса, многоугольник - массив (N, 2) координат x, y)
+    predicted = QtCore.Signal(int, object)
+    # (номер запроса) - расчёт завершился ошибкой
+    failed = QtCore.Signal(int)
+
+    def __init__(self, model, parent=None):
+        super(PredictionWorker, self).__init__(parent)
+        self._condition = threading.Condition()
+        self._model = model
+        # (номер, points, point_labels) последнего ещё не начатого запроса
+        self._request = None
+        self._last_id = 0
+        # этап -> [количество, суммарное время в мс, последнее время в мс]
+        self._latency = {stage: [0, 0.0, 0.0] for stage in STAGES}
+        self._cancelled = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def setModel(self, model):
+        with self._condition:
+            self._model = model
+            self._last_id += 1
+            self._request = None
+
+    def request(self, points, point_labels) -> int:
+        """
+            Ставит запрос на расчёт, заменяя ещё не начатый.
+            Возвращает номер запроса, который придёт в сигнале predicted.
+        """
+        with self._condition:
+            if self._request is not None:
+                self._cancelled += 1
+            self._last_id += 1
+            self._request = (self._last_id, list(points), list(point_labels))
+            self._condition.notify_all()
+            return self._last_id
+
+    def cancel(self):
+        """Отменяет ожидающий и выполняющийся запросы."""
+        with self._condition:
+            if self._request is not None:
+                self._cancelled += 1
+            self._last_id += 1
+            self._request = None
+
+    def latency(self):
+        """
+            Счётчики задержек по этапам: этап -> (количество, последнее время
+            в мс, среднее время в мс), а также количество отброшенных запросов.
+        """
+        with self._condition:
+            stats = {
+                stage: (count, last, total / count if count else 0.0)
+                for stage, (count, total, last) in self._latency.items()
+            }
+            stats["cancelled"] = self._cancelled
+            return stats
+
+    def _isStale(self, request_id):
+        with self._condition:
+            if request_id != self._last_id:
+                self._cancelled += 1
+                return True
+            return False
+
+    def _record(self, stage, started_at):
+        elapsed = (time.monotonic() - started_at) * 1000
+        with self._condition:
+            counter = self._latency[stage]
+            counter[0] += 1
+            counter[1] += elapsed
+            counter[2] = elapsed
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._request is not None)
+                (request_id, points, point_labels) = self._request
+                self._request = None
+                model = self._model
+
+            try:
+                started_at = time.monotonic()
+                model.wait_for_image_embedding()
+                self._record("encoder_wait", started_at)
+                if self._isStale(request_id):
+                    continue
+
+                started_at = time.monotonic()
+                mask = model.predict_mask_from_points(
+                    points=points, point_labels=point_labels
+                )
+                self._record("decoder", started_at)
+                if self._isStale(request_id):
+                    continue
+
+                started_at = time.monotonic()
+                polygon = _utils.compute_polygon_from_mask(mask=mask)
+                self._record("contour", started_at)
+            except Exception:
+                logger.exception("Failed to predict polygon from points")
+                self.failed.emit(request_id)
+                continue
+
+            if self._isStale(request_id):
+                continue
+            logger.debug(
+                "AI prediction latency (ms): {}".format(
+                    ", ".join(
+                        "{}={:.1f}".format(stage, self._latency[stage][2])
+                        for stage in STAGES
+                    )
+                )
+            )
+            self.predicted.emit(request_id, polygon)
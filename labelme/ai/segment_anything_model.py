@@ -1,16 +1,16 @@
-import collections
 import threading
 
-import imgviz
 import numpy as np
 # import onnxruntime
-import skimage
 
 from ..logger import logger
 from . import _utils
+from .embedding_cache import get_embedding_cache
 
 
 class SegmentAnythingModel:
+    name = "SegmentAnything"
+
     def __init__(self, encoder_path, decoder_path):
         self._image_size = 1024
 
@@ -18,49 +18,65 @@ class SegmentAnythingModel:
         self._decoder_session = None # onnxruntime.InferenceSession(decoder_path)
 
         self._lock = threading.Lock()
-        self._image_embedding_cache = collections.OrderedDict()
 
         self._thread = None
 
-    def set_image(self, image: np.ndarray):
+    def set_image(self, image: np.ndarray, crop_rect=None):
+        """
+            Поиск эмбеддинга в кэше (с хэшированием изображения) и, при
+            необходимости, его расчёт выполняются в отдельном потоке.
+        """
         with self._lock:
             self._image = image
-            self._image_embedding = self._image_embedding_cache.get(
-                self._image.tobytes()
-            )
-
-        if self._image_embedding is None:
+            self._image_embedding = None
+            # Поток ждёт, пока блокировка не будет отпущена
             self._thread = threading.Thread(
-                target=self._compute_and_cache_image_embedding
+                target=self._compute_and_cache_image_embedding,
+                args=(image, crop_rect),
             )
             self._thread.start()
 
-    def _compute_and_cache_image_embedding(self):
+    def _compute_and_cache_image_embedding(self, image, crop_rect):
+        cache = get_embedding_cache()
+        key = cache.make_key(image, self.name, crop_rect)
         with self._lock:
+            if self._image is not image:
+                return  # пока поток ждал, выбрали другое изображение
+            self._image_embedding = cache.get(key)
+            if self._image_embedding is not None:
+                return
             logger.debug("Computing image embedding...")
             self._image_embedding = _compute_image_embedding(
                 image_size=self._image_size,
                 encoder_session=self._encoder_session,
-                image=self._image,
+                image=image,
             )
-            if len(self._image_embedding_cache) > 10:
-                self._image_embedding_cache.popitem(last=False)
-            self._image_embedding_cache[self._image.tobytes()] = self._image_embedding
+            cache.put(key, self._image_embedding)
             logger.debug("Done computing image embedding.")
 
-    def _get_image_embedding(self):
-        if self._thread is not None:
-            self._thread.join()
-            self._thread = None
-        with self._lock:
-            return self._image_embedding
+    def wait_for_image_embedding(self):
+        """
+            Ждёт расчёта эмбеддинга текущего изображения и возвращает его.
+            Можно вызывать из нескольких потоков одновременно.
+        """
+        while True:
+            with self._lock:
+                thread = self._thread
+                if thread is None:
+                    return self._image_embedding
+            thread.join()
+            with self._lock:
+                # Пока ждали, могли выбрать другое изображение
+                if self._thread is thread:
+                    self._thread = None
+                    return self._image_embedding
 
     def predict_mask_from_points(self, points, point_labels):
         return _compute_mask_from_points(
             image_size=self._image_size,
             decoder_session=self._decoder_session,
             image=self._image,
-            image_embedding=self._get_image_embedding(),
+            image_embedding=self.wait_for_image_embedding(),
             points=points,
             point_labels=point_labels,
         )
@@ -84,6 +100,8 @@ def _compute_scale_to_resize_image(image_size, image):
 
 
 def _resize_image(image_size, image):
+    import imgviz
+
     scale, new_height, new_width = _compute_scale_to_resize_image(
         image_size=image_size, image=image
     )
@@ -97,6 +115,8 @@ def _resize_image(image_size, image):
 
 
 def _compute_image_embedding(image_size, encoder_session, image):
+    import imgviz
+
     image = imgviz.asrgb(image)
 
     scale, x = _resize_image(image_size, image)
@@ -122,6 +142,9 @@ def _compute_image_embedding(image_size, encoder_session, image):
 def _compute_mask_from_points(
     image_size, decoder_session, image, image_embedding, points, point_labels
 ):
+    import imgviz
+    import skimage.morphology
+
     input_point = np.array(points, dtype=np.float32)
     input_label = np.array(point_labels, dtype=np.int32)
 
@@ -1,32 +1,39 @@
 # -*- coding: utf-8 -*-
 
+import copy
 import functools
 import html
 import math
 import os
 import os.path as osp
-import re
 import webbrowser
 
-import imgviz
-import natsort
 import numpy as np
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 from qtpy.QtCore import Qt
 
-from labelme import PY2
 from labelme import __appname__
-from labelme import ai
-from labelme.ai import MODELS
+from labelme.autosave import AutoSaver
+from labelme.dir_scanner import DirScanner
+from labelme.dir_scanner import scan_images
+from labelme.prefetch import ImageDecoder
+from labelme.prefetch import PagePrefetcher
+from labelme.prefetch import read_page
 from labelme.config import get_config
 from labelme.label_file import LabelFile
 from labelme.label_file import LabelFileError
+from labelme.label_file import ShapesSnapshot
 from labelme.logger import logger
 from labelme.shape import Shape, ShapeClass
+from labelme.shape import ShapeTree
+from labelme.thumbnails import ThumbnailCache
+from labelme.thumbnails import ThumbnailLoader
+from labelme.undo import RelabelCommand
 from labelme.widgets import Canvas
 from labelme.widgets import FileDialogPreview
+from labelme.widgets import FileListWidget
 from labelme.widgets import LabelDialog
 from labelme.widgets import LabelListWidget
 from labelme.widgets import LabelListWidgetItem
@@ -51,7 +58,12 @@ from labelme import utils
 # - Zoom is too "steppy".
 
 
-LABEL_COLORMAP = imgviz.label_colormap()
+@functools.lru_cache(maxsize=None)
+def _label_colormap():
+    # imgviz загружается при первой раскраске, а не при запуске
+    import imgviz
+
+    return imgviz.label_colormap()
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -130,6 +142,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.shape_dock.setWidget(self.labelList)
 
+        # Цвет метки -> (r, g, b). Метки из uniqLabelList не удаляются, так что
+        # однажды вычисленный цвет не меняется.
+        self._label_rgb = {}
+        # Метка -> цвета фигуры (см. _update_shape_color)
+        self._label_shape_colors = {}
         self.uniqLabelList = UniqueLabelQListWidget()
         if self._config["labels"]:
             for label in self._config["labels"]:
@@ -144,7 +161,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.fileSearch = QtWidgets.QLineEdit()
         self.fileSearch.setPlaceholderText(self.tr("Поиск изображений"))
         self.fileSearch.textChanged.connect(self.fileSearchChanged)
-        self.fileListWidget = QtWidgets.QListWidget()
+        self.fileListWidget = FileListWidget()
         self.fileListWidget.itemSelectionChanged.connect(self.fileSelectionChanged)
         fileListLayout = QtWidgets.QVBoxLayout()
         fileListLayout.setContentsMargins(0, 0, 0, 0)
@@ -163,8 +180,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.canvas = self.labelList.canvas = Canvas(
             epsilon=self._config["epsilon"],
             double_click=self._config["canvas"]["double_click"],
-            num_backups=self._config["canvas"]["num_backups"],
+            undo_budget=self._config["canvas"]["undo_budget_mb"] * 1024 * 1024,
+            tile_cache=self._config["canvas"]["tile_cache_mb"] * 1024 * 1024,
             crosshair=self._config["canvas"]["crosshair"],
+            embedding_cache=self._embeddingCacheConfig(),
         )
         self.canvas.zoomRequest.connect(self.zoomRequest)
         self.canvas.mouseMoved.connect(
@@ -382,6 +401,14 @@ class MainWindow(QtWidgets.QMainWindow):
             self.tr("Отменить последнее изменение"),
             enabled=False,
         )
+        redo = action(
+            self.tr("Повторить\n"),
+            self.redoShapeEdit,
+            shortcuts["redo"],
+            "undo",
+            self.tr("Повторить отменённое изменение"),
+            enabled=False,
+        )
 
         hideAll = action(
             self.tr("&Скрыть\nпрямоугольники"),
@@ -467,6 +494,14 @@ class MainWindow(QtWidgets.QMainWindow):
             checkable=True,
             enabled=False,
         )
+        thumbnailView = action(
+            self.tr("&Миниатюры"),
+            self.setThumbnailView,
+            None,
+            "file",
+            self.tr("Показывать список изображений миниатюрами"),
+            checkable=True,
+        )
         # Group zoom controls into a list for easier toggling.
         zoomActions = (
             self.zoomWidget,
@@ -521,6 +556,7 @@ class MainWindow(QtWidgets.QMainWindow):
             edit=edit,
             undoLastPoint=undoLastPoint,
             undo=undo,
+            redo=redo,
             removePoint=removePoint,
             selectShape=selectShape,
             deSelectShape=deSelectShape,
@@ -534,6 +570,7 @@ class MainWindow(QtWidgets.QMainWindow):
             zoomOrg=zoomOrg,
             fitWindow=fitWindow,
             fitWidth=fitWidth,
+            thumbnailView=thumbnailView,
             zoomActions=zoomActions,
             openNextImg=openNextImg,
             openPrevImg=openPrevImg,
@@ -548,6 +585,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 deSelectShape,
                 None,
                 undo,
+                redo,
                 undoLastPoint,
                 None,
                 removePoint,
@@ -562,6 +600,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 edit,
                 delete,
                 undo,
+                redo,
                 undoLastPoint,
                 removePoint,
             ),
@@ -613,6 +652,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 # self.label_dock.toggleViewAction(),
                 self.shape_dock.toggleViewAction(),
                 self.file_dock.toggleViewAction(),
+                thumbnailView,
                 None,
                 None,
                 hideAll,
@@ -677,6 +717,45 @@ class MainWindow(QtWidgets.QMainWindow):
         self.statusBar().showMessage(str(self.tr("%s запущен.")) % __appname__)
         self.statusBar().show()
 
+        # Автосохранение: правки копятся, пока не истечёт таймер, после чего
+        # снимок разметки записывается на диск в фоновом потоке.
+        self._autoSaver = AutoSaver(self)
+        self._autoSaver.saved.connect(self._autoSaveFinished)
+        self._autoSaver.failed.connect(self._autoSaveFailed)
+        self._autoSaver.statusChanged.connect(self._autoSaveStatusChanged)
+        self._autoSaveTimer = QtCore.QTimer(self)
+        self._autoSaveTimer.setSingleShot(True)
+        self._autoSaveTimer.setInterval(self._config["auto_save_delay"])
+        self._autoSaveTimer.timeout.connect(self._autoSave)
+        self._autoSaveLabel = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self._autoSaveLabel)
+
+        # Папка с изображениями читается в фоне, список файлов заполняется
+        # по мере обхода
+        self._dirScanner = DirScanner(parent=self)
+        self._dirScanner.found.connect(self._importDirBatch)
+        # (номер обхода, load, файл, который нужно выбрать, когда он найдётся)
+        self._dirImport = None
+
+        # Соседние страницы читаются заранее, пока размечается текущая
+        self._prefetcher = PagePrefetcher(
+            budget=self._config["prefetch"]["memory_mb"] * 1024 * 1024,
+            max_image_size=self._maxImageSize(),
+        )
+        # Полное изображение страницы, открытой по уменьшенной копии,
+        # декодируется в фоне, когда оно нужно модели
+        self._imageDecoder = ImageDecoder(self)
+        self._imageDecoder.decoded.connect(self._fullImageDecoded)
+        self._fullImageRequest = None
+        self.canvas.fullImageRequested.connect(self._decodeFullImage)
+
+        # Миниатюры страниц для списка файлов и диалога открытия,
+        # создаются при первом обращении (см. _thumbnails)
+        self._thumbnailLoader = None
+        if self._config["thumbnails"]["show"]:
+            self.actions.thumbnailView.setChecked(True)
+            self.setThumbnailView(True)
+
         if output_file is not None and self._config["auto_save"]:
             logger.warn(
                 "If `auto_save` argument is True, `output_file` argument "
@@ -701,7 +780,8 @@ class MainWindow(QtWidgets.QMainWindow):
         }  # key=filename, value=scroll_value
 
         if filename is not None and osp.isdir(filename):
-            self.importDirImages(filename, load=False)
+            # Первое изображение откроется, как только будет найдено
+            self.importDirImages(filename)
         else:
             self.filename = filename
 
@@ -775,14 +855,12 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def setDirty(self):
         # Even if we autosave the file, we keep the ability to undo
-        self.actions.undo.setEnabled(self.canvas.isShapeRestorable)
+        self._updateUndoActions()
 
         if self._config["auto_save"] or self.actions.saveAuto.isChecked():
-            label_file = osp.splitext(self.imagePath)[0] + ".json"
-            if self.output_dir:
-                label_file_without_path = osp.basename(label_file)
-                label_file = osp.join(self.output_dir, label_file_without_path)
-            self.saveLabels(label_file)
+            # Серия правок (перетаскивание, переименование и т.п.) сохраняется
+            # одной записью по истечении таймера
+            self._autoSaveTimer.start()
             return
         self.dirty = True
         self.actions.save.setEnabled(True)
@@ -791,6 +869,81 @@ class MainWindow(QtWidgets.QMainWindow):
             title = "{} - {}*".format(title, self.filename)
         self.setWindowTitle(title)
 
+    def _autoSave(self):
+        if self.imagePath is None:
+            return
+        label_file = osp.splitext(self.imagePath)[0] + ".json"
+        if self.output_dir:
+            label_file_without_path = osp.basename(label_file)
+            label_file = osp.join(self.output_dir, label_file_without_path)
+        self.saveLabels(label_file, background=True)
+
+    def flushAutoSave(self):
+        """
+            Немедленно сохраняет отложенные правки и дожидается окончания записи.
+
+            Вызывается перед сменой изображения и закрытием окна.
+        """
+        if self._autoSaveTimer.isActive():
+            self._autoSaveTimer.stop()
+            self._autoSave()
+        self._autoSaver.flush()
+
+    def _autoSaveFinished(self, filename, image_path, label_file):
+        if image_path == self.imagePath:
+            self.labelFile = label_file
+        self._markLabeled(image_path)
+
+    def _markLabeled(self, image_path):
+        self.fileListWidget.setChecked(image_path, True)
+        if self._thumbnailLoader is not None and self._thumbnailLoader.overlay:
+            # Рамки на миниатюре берутся из разметки
+            self._thumbnailLoader.invalidate(image_path)
+
+    def _thumbnails(self) -> ThumbnailLoader:
+        """
+            Загрузчик миниатюр. Потоки и файл кэша создаются при первом
+            обращении, а не при запуске: миниатюры могут быть выключены.
+        """
+        if self._thumbnailLoader is None:
+            thumbnails = self._config["thumbnails"]
+            thumbnail_cache = None
+            if thumbnails["disk_path"] is not None:
+                thumbnail_cache = ThumbnailCache(
+                    osp.expanduser(thumbnails["disk_path"]),
+                    disk_budget=thumbnails["disk_mb"] * 1024 * 1024,
+                )
+            self._thumbnailLoader = ThumbnailLoader(
+                thumbnail_cache,
+                size=thumbnails["size"],
+                overlay=thumbnails["overlay"],
+                parent=self,
+            )
+            self._thumbnailLoader.label_file_for = self._labelFileFor
+        return self._thumbnailLoader
+
+    def setThumbnailView(self, value):
+        self.fileListWidget.setThumbnailLoader(self._thumbnails() if value else None)
+
+    def _embeddingCacheConfig(self):
+        """Параметры кэша эмбеддингов для configure_embedding_cache."""
+        embedding_cache = self._config["ai"]["embedding_cache"]
+        return dict(
+            memory_budget=embedding_cache["memory_mb"] * 1024 * 1024,
+            cache_dir=embedding_cache["disk_dir"],
+            disk_budget=embedding_cache["disk_mb"] * 1024 * 1024,
+        )
+
+    def _autoSaveFailed(self, filename, message):
+        self.errorMessage(
+            self.tr("Ошибка сохранения изображения"), self.tr("<b>%s</b>") % message
+        )
+
+    def _autoSaveStatusChanged(self, depth, latency):
+        self._autoSaveLabel.setText(
+            self.tr("Автосохранение: в очереди %d, %d мс") % (depth, latency)
+        )
+
     def setClean(self):
         self.dirty = False
         self.actions.save.setEnabled(False)
@@ -820,10 +973,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.statusBar().showMessage(message, delay)
 
     def _submit_ai_prompt(self, _) -> None:
+        # Модули моделей загружаются при первом запросе, а не при запуске
+        from labelme import ai
+
         texts = self._ai_prompt_widget.get_text_prompt().split(",")
         boxes, scores, labels = ai.get_rectangles_from_texts(
             model="yoloworld",
-            image=utils.img_qt_to_arr(self.image)[:, :, :3],
+            image=utils.img_qt_to_rgb(self._fullImage()),
             texts=texts,
         )
 
@@ -871,11 +1027,9 @@ class MainWindow(QtWidgets.QMainWindow):
                 diacritical=shape_dict["diacritical"],
                 shape_type=shape_dict["shape_type"],
             )
-            for point in shape_dict["points"]:
-                shape.addPoint(QtCore.QPointF(*point))
+            shape.addPoints(shape_dict["points"])
             shapes.append(shape)
 
-        self.canvas.storeShapes()
         self.loadShapes(shapes, replace=False)
         self.setDirty()
 
@@ -886,6 +1040,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.imageData = None
         self.labelFile = None
         self.otherData = None
+        self._imageDecoder.cancel()
+        self._fullImageRequest = None
         self.canvas.resetState()
 
     def currentItem(self):
@@ -903,11 +1059,26 @@ class MainWindow(QtWidgets.QMainWindow):
 
     # Callbacks
 
+    def _updateUndoActions(self):
+        self.actions.undo.setEnabled(self.canvas.isShapeRestorable)
+        self.actions.redo.setEnabled(self.canvas.isShapeRedoable)
+
+    def _reloadLabelList(self):
+        self._noSelectionSlot = True
+        self.labelList.clear()
+        self.addLabels(self.canvas.shapes)
+        self.labelList.clearSelection()
+        self._noSelectionSlot = False
+
     def undoShapeEdit(self):
         self.canvas.restoreShape()
-        self.labelList.clear()
-        self.loadShapes(self.canvas.shapes)
-        self.actions.undo.setEnabled(self.canvas.isShapeRestorable)
+        self._reloadLabelList()
+        self.setDirty()
+
+    def redoShapeEdit(self):
+        self.canvas.redoShape()
+        self._reloadLabelList()
+        self.setDirty()
 
     def tutorial(self):
         Helper(self.helper.get_main_helper()).popUp()
@@ -995,13 +1166,18 @@ class MainWindow(QtWidgets.QMainWindow):
         if text is None:
             return
 
-        self.canvas.storeShapes()
+        shapes = [item.shape() for item in items]
+        old_labels = [(s.label, s.diacritical) for s in shapes]
         for item in items:
             self._update_item(
                 item=item,
                 text=text.letter,
                 diacritical=text.diacritical if text.diacritical is not None else ""
             )
+        new_labels = [(s.label, s.diacritical) for s in shapes]
+        if new_labels != old_labels:
+            self.canvas.undoStack.push(RelabelCommand(shapes, old_labels, new_labels))
+            self._updateUndoActions()
 
     def _update_item(self, item, text, diacritical):
         if not self.validateLabel(text):
@@ -1036,11 +1212,8 @@ class MainWindow(QtWidgets.QMainWindow):
             self.uniqLabelList.setItemLabel(item, shape.label, rgb)
 
     def fileSearchChanged(self):
-        self.importDirImages(
-            self.lastOpenDir,
-            pattern=self.fileSearch.text(),
-            load=False,
-        )
+        # Фильтруется уже загруженный список, папка заново не читается
+        self.fileListWidget.setFilter(self.fileSearch.text())
         
     def updateMurkupLevelLabel(self, parentShape: Shape):
         if parentShape is not None:
@@ -1049,19 +1222,16 @@ class MainWindow(QtWidgets.QMainWindow):
             self._markup_level_wiget.set_markup_level(None)
 
     def fileSelectionChanged(self):
-        items = self.fileListWidget.selectedItems()
-        if not items:
+        filenames = self.fileListWidget.selectedFilenames()
+        if not filenames:
             return
-        item = items[0]
+        self._prefetcher.cancel()
 
         if not self.mayContinue():
             return
 
-        currIndex = self.imageList.index(str(item.text()))
-        if currIndex < len(self.imageList):
-            filename = self.imageList[currIndex]
-            if filename:
-                self.loadFile(filename)
+        if filenames[0]:
+            self.loadFile(filenames[0])
 
     # React to canvas signals.
     def shapeSelectionChanged(self, selected_shapes):
@@ -1070,50 +1240,91 @@ class MainWindow(QtWidgets.QMainWindow):
             shape.selected = False
         self.labelList.clearSelection()
         self.canvas.selectedShapes = selected_shapes
+        items = []
         for shape in self.canvas.selectedShapes:
             shape.selected = True
-            item = self.labelList.findItemByShape(shape)
-            self.labelList.selectItem(item)
-            self.labelList.scrollToItem(item)
+            items.append(self.labelList.findItemByShape(shape))
+        self.labelList.selectItems(items)
+        if items:
+            self.labelList.scrollToItem(items[-1])
         self._noSelectionSlot = False
         n_selected = len(selected_shapes)
         self.actions.delete.setEnabled(n_selected)
         self.actions.edit.setEnabled(n_selected)
 
     def addLabel(self, shape):
-        if shape.group_id is None:
-            text = shape.label
-        else:
-            text = "{} ({})".format(shape.label, shape.group_id)
-        label_list_item = LabelListWidgetItem(text, shape)
-        label_list_item.setCheckState(Qt.Checked if self.canvas.isVisible(shape) else Qt.Unchecked)
-        self.labelList.addItem(label_list_item)
-        if self.uniqLabelList.findItemByLabel(shape.label) is None:
-            item = self.uniqLabelList.createItemFromLabel(shape.label)
-            self.uniqLabelList.addItem(item)
-            rgb = self._get_rgb_by_label(shape.label)
-            self.uniqLabelList.setItemLabel(item, shape.label, rgb)
-        self.labelDialog.addLabelHistory(shape.label)
-        for action in self.actions.onShapesPresent:
-            action.setEnabled(True)
+        self.addLabels([shape])
 
-        self._update_shape_color(shape)
-        label_list_item.setText(
-            '{} <font color="#{:02x}{:02x}{:02x}">●</font>'.format(
-                html.escape(text), *shape.fill_color.getRgb()[:3]
+    def addLabels(self, shapes):
+        """
+            Добавляет фигуры в список меток.
+
+            Строки полностью собираются до вставки и добавляются в список
+            одной операцией, а метки, история и действия обновляются один раз
+            на каждую новую метку, а не на каждую фигуру.
+        """
+        if not shapes:
+            return
+        for label in dict.fromkeys(shape.label for shape in shapes):
+            if self.uniqLabelList.findItemByLabel(label) is None:
+                item = self.uniqLabelList.createItemFromLabel(label)
+                self.uniqLabelList.addItem(item)
+                rgb = self._get_rgb_by_label(label)
+                self.uniqLabelList.setItemLabel(item, label, rgb)
+            self.labelDialog.addLabelHistory(label)
+
+        items = []
+        for shape in shapes:
+            if shape.group_id is None:
+                text = shape.label
+            else:
+                text = "{} ({})".format(shape.label, shape.group_id)
+            self._update_shape_color(shape)
+            label_list_item = LabelListWidgetItem(
+                '{} <font color="#{:02x}{:02x}{:02x}">●</font>'.format(
+                    html.escape(text), *shape.fill_color.getRgb()[:3]
+                ),
+                shape,
             )
-        )
+            label_list_item.setCheckState(
+                Qt.Unchecked if self.canvas.isHidden(shape) else Qt.Checked
+            )
+            items.append(label_list_item)
+        self.labelList.addItems(items)
+
+        for action in self.actions.onShapesPresent:
+            action.setEnabled(True)
 
     def _update_shape_color(self, shape):
-        r, g, b = self._get_rgb_by_label(shape.label)
-        shape.line_color = QtGui.QColor(r, g, b)
-        shape.vertex_fill_color = QtGui.QColor(r, g, b)
-        shape.hvertex_fill_color = QtGui.QColor(255, 255, 255)
-        shape.fill_color = QtGui.QColor(r, g, b, 128)
-        shape.select_line_color = QtGui.QColor(255, 255, 255)
-        shape.select_fill_color = QtGui.QColor(r, g, b, 155)
+        # Цвета одной метки - общие объекты для всех её фигур: фигуры их
+        # только читают
+        colors = self._label_shape_colors.get(shape.label)
+        if colors is None:
+            r, g, b = self._get_rgb_by_label(shape.label)
+            colors = self._label_shape_colors[shape.label] = (
+                QtGui.QColor(r, g, b),
+                QtGui.QColor(r, g, b),
+                QtGui.QColor(255, 255, 255),
+                QtGui.QColor(r, g, b, 128),
+                QtGui.QColor(255, 255, 255),
+                QtGui.QColor(r, g, b, 155),
+            )
+        (
+            shape.line_color,
+            shape.vertex_fill_color,
+            shape.hvertex_fill_color,
+            shape.fill_color,
+            shape.select_line_color,
+            shape.select_fill_color,
+        ) = colors
 
     def _get_rgb_by_label(self, label):
+        rgb = self._label_rgb.get(label)
+        if rgb is None:
+            rgb = self._label_rgb[label] = self._compute_rgb_by_label(label)
+        return rgb
+
+    def _compute_rgb_by_label(self, label):
         if self._config["shape_color"] == "auto":
             item = self.uniqLabelList.findItemByLabel(label)
             if item is None:
@@ -1123,7 +1334,8 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.uniqLabelList.setItemLabel(item, label, rgb)
             label_id = self.uniqLabelList.indexFromItem(item).row() + 1
             label_id += self._config["shift_auto_shape_color"]
-            return LABEL_COLORMAP[label_id % len(LABEL_COLORMAP)]
+            colormap = _label_colormap()
+            return colormap[label_id % len(colormap)]
         elif (
                 self._config["shape_color"] == "manual"
                 and self._config["label_colors"]
@@ -1135,19 +1347,18 @@ class MainWindow(QtWidgets.QMainWindow):
         return (0, 255, 0)
 
     def remLabels(self, shapes):
-        for shape in shapes:
-            item = self.labelList.findItemByShape(shape)
-            self.labelList.removeItem(item)
+        self.labelList.removeItems(
+            [self.labelList.findItemByShape(shape) for shape in shapes]
+        )
 
     def loadShapes(self, shapes, replace=True):
         self._noSelectionSlot = True
-        for shape in shapes:
-            self.addLabel(shape)
+        self.addLabels(shapes)
         self.labelList.clearSelection()
         self._noSelectionSlot = False
         self.canvas.loadShapes(shapes, replace=replace)
 
-    def _loadLabelsRecursive(self, inputList, shapes, parent: Shape = None):
+    def _loadLabelsRecursive(self, inputList, shapes, parent: Shape = None, tree=None):
         for shape_dict in inputList:
             label = shape_dict["label"] if "label" in shape_dict else ""
             diacritical = shape_dict["diacritical"] if "diacritical" in shape_dict else ""
@@ -1164,9 +1375,9 @@ class MainWindow(QtWidgets.QMainWindow):
                 diacritical=diacritical,
                 shape_type=shape_type,
                 parent=parent,
+                tree=tree,
             )
-            for x, y in points:
-                shape.addPoint(QtCore.QPointF(x, y))
+            shape.addPoints(points)
             shape.close()
 
             self._loadLabelsRecursive(shape_dict["shapes"]  if "shapes" in shape_dict else {}, shapes, parent=shape)
@@ -1176,47 +1387,20 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def loadLabels(self, shapes):
         s = []
-        self._loadLabelsRecursive(shapes, s)
+        # Все фигуры страницы - в одном дереве документа
+        self._loadLabelsRecursive(shapes, s, tree=ShapeTree())
         self.loadShapes(s)
 
-    def saveLabels(self, filename):
+    def saveLabels(self, filename, background=False):
         lf = LabelFile()
 
-        def format_shape(s: Shape):
-            data = s.other_data.copy()
-            shape_type = s.getClass()
-            if shape_type == ShapeClass.TEXT:
-                data.update(
-                    dict(
-                        shapes=[format_shape(a) for a in s.getChildren()],
-                        points=[(p.x(), p.y()) for p in s.points],
-                        shape_type=s.shape_type,
-                    )
-                )
-            elif shape_type == ShapeClass.ROW:
-                data.update(
-                    dict(
-                        label=s.label.encode("utf-8") if PY2 else s.label,
-                        shapes=[format_shape(a) for a in s.getChildren()],
-                        points=[(p.x(), p.y()) for p in s.points],
-                        shape_type=s.shape_type,
-                    )
-                )
-            elif shape_type == ShapeClass.LETTER:
-                data.update(
-                    dict(
-                        label=s.label.encode("utf-8") if PY2 else s.label,
-                        diacritical=s.diacritical,
-                        points=[(p.x(), p.y()) for p in s.points],
-                        shape_type=s.shape_type,
-                    )
-                )
-            else:
-                raise Exception("error in shape type in format_shape")
-            
-            return data
-
-        shapes = [format_shape(item.shape()) for item in self.labelList if item.shape().getClass() == ShapeClass.TEXT]
+        # Дешёвый снимок фигур: словари для json строятся уже при записи,
+        # в фоновом сохранении - в потоке AutoSaver
+        shapes = ShapesSnapshot(
+            item.shape()
+            for item in self.labelList
+            if item.shape().getClass() == ShapeClass.TEXT
+        )
 
         empty_rows = [item.shape() for item in self.labelList if item.shape().getClass() == ShapeClass.ROW and item.shape().label == ""]
         
@@ -1235,21 +1419,26 @@ class MainWindow(QtWidgets.QMainWindow):
                 imagePath = osp.relpath(self.imagePath, osp.dirname(filename))
                 if osp.dirname(filename) and not osp.exists(osp.dirname(filename)):
                     os.makedirs(osp.dirname(filename))
-                lf.save(
+                image_size = self.canvas.pageSize()
+                save_kwargs = dict(
                     filename=filename,
                     shapes=shapes,
                     imagePath=imagePath,
-                    imageHeight=self.image.height(),
-                    imageWidth=self.image.width(),
-                    otherData=self.otherData,
+                    imageHeight=image_size.height(),
+                    imageWidth=image_size.width(),
+                    otherData=copy.deepcopy(self.otherData),
                     textType=self.manusctipt_type_wiget.GetCurrentValue(),
                 )
+                if background:
+                    # Снимок и копия otherData не меняются при дальнейших
+                    # правках на холсте
+                    self._autoSaver.enqueue(lf, self.imagePath, save_kwargs)
+                    return True
+                # Иначе более старая фоновая запись может перетереть этот файл
+                self._autoSaver.flush()
+                lf.save(**save_kwargs)
                 self.labelFile = lf
-                items = self.fileListWidget.findItems(self.imagePath, Qt.MatchExactly)
-                if len(items) > 0:
-                    if len(items) != 1:
-                        raise RuntimeError("There are duplicate files.")
-                    items[0].setCheckState(Qt.Checked)
+                self._markLabeled(self.imagePath)
                 # disable allows next and previous image to proceed
                 # self.filename = filename
                 return True
@@ -1305,11 +1494,9 @@ class MainWindow(QtWidgets.QMainWindow):
             self.addLabel(shape)
             self.actions.editMode.setEnabled(True)
             self.actions.undoLastPoint.setEnabled(False)
-            self.actions.undo.setEnabled(True)
             self.setDirty()
         else:
             self.canvas.undoLastLine()
-            self.canvas.shapesBackups.pop()
 
     def scrollRequest(self, delta, orientation):
         units = -delta * 0.1  # natural scroll
@@ -1382,13 +1569,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def togglePolygons(self, value):
         checked = value
-        if self.canvas.parentShape is not None:
-            shapes = self.canvas.parentShape.getAllChildren()
-        else:
-            shapes = self.canvas.shapes
+        parent = self.canvas.parentShape
 
         for item in self.labelList:
-            if not item.shape() in shapes:
+            if parent is not None and not item.shape().isDescendantOf(parent):
                 continue
 
             if value is None:
@@ -1398,12 +1582,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def loadFile(self, filename=None):
         """Load the specified file, or the last opened file if None."""
+        self.flushAutoSave()
         # changing fileListWidget loads file
-        if filename in self.imageList and (
-                self.fileListWidget.currentRow() != self.imageList.index(filename)
-        ):
-            self.fileListWidget.setCurrentRow(self.imageList.index(filename))
-            self.fileListWidget.repaint()
+        row = self.fileListWidget.row(filename)
+        if row >= 0 and self.fileListWidget.currentRow() != row:
+            self.fileListWidget.setCurrentRow(row)
             return
 
         self.resetState()
@@ -1419,24 +1602,28 @@ class MainWindow(QtWidgets.QMainWindow):
             return False
         # assumes same name, but json extension
         self.status(str(self.tr("Загрузка изображения %s...")) % osp.basename(str(filename)))
-        label_file = osp.splitext(filename)[0] + ".json"
-        if self.output_dir:
-            label_file_without_path = osp.basename(label_file)
-            label_file = osp.join(self.output_dir, label_file_without_path)
-        if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
-            try:
-                self.labelFile = LabelFile(label_file)
-            except LabelFileError as e:
-                self.errorMessage(
-                    self.tr("Ошибка при открытии файла разметки"),
-                    self.tr(
-                        "<p><b>%s</b></p>"
-                        "<p>Убедитесь, что <i>%s</i> является корректным файлом разметки."
-                    )
-                    % (e, label_file),
+        label_file = self._labelFileFor(filename)
+        page = self._prefetcher.take(filename, label_file)
+        if page is None:
+            page = read_page(
+                filename,
+                label_file,
+                draft_size=self._draftSize(),
+                max_image_size=self._maxImageSize(),
+            )
+        if page.error is not None:
+            self.errorMessage(
+                self.tr("Ошибка при открытии файла разметки"),
+                self.tr(
+                    "<p><b>%s</b></p>"
+                    "<p>Убедитесь, что <i>%s</i> является корректным файлом разметки."
                 )
-                self.status(self.tr("Ошибка чтения файла разметки %s") % label_file)
-                return False
+                % (page.error, label_file),
+            )
+            self.status(self.tr("Ошибка чтения файла разметки %s") % label_file)
+            return False
+        if page.label_file is not None:
+            self.labelFile = page.label_file
             self.imageData = self.labelFile.imageData
             self.imagePath = osp.join(
                 osp.dirname(label_file),
@@ -1446,11 +1633,11 @@ class MainWindow(QtWidgets.QMainWindow):
             self.texttype = self.labelFile.textType
             self.manusctipt_type_wiget.LoadSetType(self.texttype)
         else:
-            self.imageData = LabelFile.load_image_file(filename)
+            self.imageData = page.image_data
             if self.imageData:
                 self.imagePath = filename
             self.labelFile = None
-        image = QtGui.QImage.fromData(self.imageData)
+        image = page.image
 
         if image.isNull():
             formats = [
@@ -1468,7 +1655,7 @@ class MainWindow(QtWidgets.QMainWindow):
             return False
         self.image = image
         self.filename = filename
-        self.canvas.loadPixmap(QtGui.QPixmap.fromImage(image))
+        self.canvas.loadImage(image, size=page.size, source=page.source)
         if self.labelFile:
             self.loadLabels(self.labelFile.shapes)
         self.setClean()
@@ -1491,8 +1678,68 @@ class MainWindow(QtWidgets.QMainWindow):
         self.toggleActions(True)
         self.canvas.setFocus()
         self.status(str(self.tr("Загружен %s")) % osp.basename(str(filename)))
+        self._prefetchNeighbours()
         return True
 
+    def _draftSize(self):
+        """
+            Размер области показа в пикселях экрана, под который можно
+            декодировать уменьшенную копию JPEG, или None.
+        """
+        if not self._config["draft_decode"]:
+            return None
+        size = self.centralWidget().size() * self.devicePixelRatioF()
+        return size.width(), size.height()
+
+    def _maxImageSize(self):
+        return self._config["canvas"]["max_image_mb"] * 1024 * 1024
+
+    def _decodeFullImage(self):
+        if self._fullImageRequest is None and self.imageData:
+            self._fullImageRequest = self._imageDecoder.decode(self.imageData)
+
+    def _fullImageDecoded(self, request_id, image):
+        if request_id != self._fullImageRequest:
+            return
+        self._fullImageRequest = None
+        self._setFullImage(image)
+
+    def _setFullImage(self, image):
+        if image.isNull():
+            logger.error("Failed decoding the full image: {}".format(self.filename))
+            return
+        self.canvas.setFullImage(image)
+
+    def _fullImage(self):
+        """
+            Полное изображение страницы. Если показана уменьшенная копия,
+            декодирует его заново при каждом вызове и не хранит.
+        """
+        if self.canvas.isPreview():
+            return QtGui.QImage.fromData(self.imageData)
+        return self.image
+
+    def _labelFileFor(self, filename):
+        label_file = osp.splitext(filename)[0] + ".json"
+        if self.output_dir:
+            label_file_without_path = osp.basename(label_file)
+            label_file = osp.join(self.output_dir, label_file_without_path)
+        return label_file
+
+    def _prefetchNeighbours(self):
+        """Ставит в очередь на чтение страницы рядом с текущей."""
+        row = self.fileListWidget.row(self.filename)
+        if row < 0:
+            return
+        config = self._config["prefetch"]
+        count = self.fileListWidget.count()
+        rows = list(range(row + 1, min(row + 1 + config["next"], count)))
+        rows += list(range(row - 1, max(row - 1 - config["prev"], -1), -1))
+        filenames = [self.fileListWidget.filename(r) for r in rows]
+        self._prefetcher.prefetch(
+            [(filename, self._labelFileFor(filename)) for filename in filenames]
+        )
+
     def resizeEvent(self, event):
         if (
                 self.canvas
@@ -1521,17 +1768,18 @@ class MainWindow(QtWidgets.QMainWindow):
         h1 = self.centralWidget().height() - e
         a1 = w1 / h1
         # Calculate a new scale value based on the pixmap's aspect ratio.
-        w2 = self.canvas.cropped_image.width() - 0.0
-        h2 = self.canvas.cropped_image.height() - 0.0
+        w2 = self.canvas.imageSize().width() - 0.0
+        h2 = self.canvas.imageSize().height() - 0.0
         a2 = w2 / h2
         return w1 / w2 if a2 >= a1 else h1 / h2
 
     def scaleFitWidth(self):
         # The epsilon does not seem to work too well here.
         w = self.centralWidget().width() - 2.0
-        return w / self.canvas.cropped_image.width()
+        return w / self.canvas.imageSize().width()
 
     def closeEvent(self, event):
+        self.flushAutoSave()
         if not self.mayContinue():
             event.ignore()
         self.settings.setValue("filename", self.filename if self.filename else "")
@@ -1572,15 +1820,15 @@ class MainWindow(QtWidgets.QMainWindow):
         if not self.mayContinue():
             return
 
-        if len(self.imageList) <= 0:
+        if self.fileListWidget.count() <= 0:
             return
 
         if self.filename is None:
             return
 
-        currIndex = self.imageList.index(self.filename)
+        currIndex = self.fileListWidget.row(self.filename)
         if currIndex - 1 >= 0:
-            filename = self.imageList[currIndex - 1]
+            filename = self.fileListWidget.filename(currIndex - 1)
             if filename:
                 self.loadFile(filename)
 
@@ -1589,18 +1837,19 @@ class MainWindow(QtWidgets.QMainWindow):
         if not self.mayContinue():
             return
 
-        if len(self.imageList) <= 0:
+        count = self.fileListWidget.count()
+        if count <= 0:
             return
 
         filename = None
         if self.filename is None:
-            filename = self.imageList[0]
+            filename = self.fileListWidget.filename(0)
         else:
-            currIndex = self.imageList.index(self.filename)
-            if currIndex + 1 < len(self.imageList):
-                filename = self.imageList[currIndex + 1]
+            currIndex = self.fileListWidget.row(self.filename)
+            if currIndex + 1 < count:
+                filename = self.fileListWidget.filename(currIndex + 1)
             else:
-                filename = self.imageList[-1]
+                filename = self.fileListWidget.filename(count - 1)
         self.filename = filename
 
         if self.filename and load:
@@ -1618,6 +1867,7 @@ class MainWindow(QtWidgets.QMainWindow):
             formats + ["*%s" % LabelFile.suffix]
         )
         fileDialog = FileDialogPreview(self)
+        fileDialog.setThumbnailLoader(self._thumbnails())
         fileDialog.setDirectory(path)
         fileDialog.setFileMode(FileDialogPreview.ExistingFile)
         fileDialog.setNameFilter(filters)
@@ -1659,13 +1909,8 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         self.statusBar().show()
 
-        current_filename = self.filename
-        self.importDirImages(self.lastOpenDir, load=False)
-
-        if current_filename in self.imageList:
-            # retain currently selected file
-            self.fileListWidget.setCurrentRow(self.imageList.index(current_filename))
-            self.fileListWidget.repaint()
+        # retain currently selected file
+        self.importDirImages(self.lastOpenDir, load=False, current=self.filename)
 
     def saveFile(self, _value=False):
         assert not self.image.isNull(), "cannot save empty image"
@@ -1718,6 +1963,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.setClean()
 
     def closeFile(self, _value=False):
+        self.flushAutoSave()
         if not self.mayContinue():
             return
         self.resetState()
@@ -1749,13 +1995,13 @@ class MainWindow(QtWidgets.QMainWindow):
         if result != 0:
             return
 
+        self.flushAutoSave()
         label_file = self.getLabelFile()
         if osp.exists(label_file):
             os.remove(label_file)
             logger.info("Label file is removed: {}".format(label_file))
 
-            item = self.fileListWidget.currentItem()
-            item.setCheckState(Qt.Unchecked)
+            self.fileListWidget.setChecked(self.filename, False)
 
             self.resetState()
 
@@ -1851,8 +2097,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def copyShape(self):
         self.canvas.endMove(copy=True)
-        for shape in self.canvas.selectedShapes:
-            self.addLabel(shape)
+        self.addLabels(self.canvas.selectedShapes)
         self.labelList.clearSelection()
         self.setDirty()
 
@@ -1883,14 +2128,6 @@ class MainWindow(QtWidgets.QMainWindow):
         self.settings.setValue('lastOpenedDirectory', targetDirPath)
         self.importDirImages(targetDirPath)
 
-    @property
-    def imageList(self):
-        lst = []
-        for i in range(self.fileListWidget.count()):
-            item = self.fileListWidget.item(i)
-            lst.append(item.text())
-        return lst
-
     def importDroppedImageFiles(self, imageFiles):
         extensions = [
             ".%s" % fmt.data().decode().lower()
@@ -1898,67 +2135,73 @@ class MainWindow(QtWidgets.QMainWindow):
         ]
 
         self.filename = None
+        files = []
         for file in imageFiles:
-            if file in self.imageList or not file.lower().endswith(tuple(extensions)):
+            if not file.lower().endswith(tuple(extensions)):
                 continue
-            label_file = osp.splitext(file)[0] + ".json"
-            if self.output_dir:
-                label_file_without_path = osp.basename(label_file)
-                label_file = osp.join(self.output_dir, label_file_without_path)
-            item = QtWidgets.QListWidgetItem(file)
-            if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
-                item.setCheckState(Qt.Checked)
-            else:
-                item.setCheckState(Qt.Unchecked)
-            self.fileListWidget.addItem(item)
+            label_file = self._labelFileFor(file)
+            files.append(
+                (file, osp.exists(label_file) and LabelFile.is_label_file(label_file))
+            )
+        self.fileListWidget.addFiles(files)
 
-        if len(self.imageList) > 1:
+        if self.fileListWidget.count() > 1:
             self.actions.openNextImg.setEnabled(True)
             self.actions.openPrevImg.setEnabled(True)
 
         self.openNextImg()
 
-    def importDirImages(self, dirpath, pattern=None, load=True):
+    def importDirImages(self, dirpath, pattern=None, load=True, current=None):
+        """
+            Заполняет список файлов изображениями из папки.
+
+            Папка обходится в фоновом потоке (DirScanner), строки добавляются
+            пачками в _importDirBatch. Первое найденное изображение
+            становится текущим (и открывается, если load), а если задан
+            current, то после его нахождения выбирается он.
+        """
         self.actions.openNextImg.setEnabled(True)
         self.actions.openPrevImg.setEnabled(True)
 
+        self.flushAutoSave()
         if not self.mayContinue() or not dirpath:
             return
 
         self.lastOpenDir = dirpath
         self.filename = None
+        self._prefetcher.cancel()
+        if self._thumbnailLoader is not None:
+            self._thumbnailLoader.cancel()
         self.fileListWidget.clear()
+        if pattern is not None:
+            self.fileListWidget.setFilter(pattern)
 
-        filenames = self.scanAllImages(dirpath)
-        if pattern:
-            try:
-                filenames = [f for f in filenames if re.search(pattern, f)]
-            except re.error:
-                pass
-        for filename in filenames:
-            label_file = osp.splitext(filename)[0] + ".json"
-            if self.output_dir:
-                label_file_without_path = osp.basename(label_file)
-                label_file = osp.join(self.output_dir, label_file_without_path)
-            item = QtWidgets.QListWidgetItem(filename)
-            if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
-                item.setCheckState(Qt.Checked)
-            else:
-                item.setCheckState(Qt.Unchecked)
-            self.fileListWidget.addItem(item)
-        self.openNextImg(load=load)
+        scan_id = self._dirScanner.scan(
+            dirpath, self._imageExtensions(), output_dir=self.output_dir
+        )
+        self._dirImport = (scan_id, load, current)
 
-    def scanAllImages(self, folderPath):
-        extensions = [
+    def _importDirBatch(self, scan_id, batch):
+        if self._dirImport is None or self._dirImport[0] != scan_id:
+            return
+        _, load, current = self._dirImport
+        is_first = self.fileListWidget.count() == 0
+
+        self.fileListWidget.addFiles(batch)
+
+        if is_first and self.fileListWidget.count() > 0:
+            self.openNextImg(load=load)
+        row = self.fileListWidget.row(current) if current is not None else -1
+        if row >= 0:
+            self._dirImport = (scan_id, load, None)
+            self.fileListWidget.setCurrentRow(row)
+
+    def _imageExtensions(self):
+        return [
             ".%s" % fmt.data().decode().lower()
             for fmt in QtGui.QImageReader.supportedImageFormats()
         ]
 
-        images = []
-        for root, dirs, files in os.walk(folderPath):
-            for file in files:
-                if file.lower().endswith(tuple(extensions)):
-                    relativePath = os.path.normpath(osp.join(root, file))
-                    images.append(relativePath)
-        images = natsort.os_sorted(images)
-        return images
+    def scanAllImages(self, folderPath):
+        images = scan_images(folderPath, self._imageExtensions())
+        return [filename for filename, _ in images]
@@ -0,0 +1,100 @@
+import collections
+import threading
+import time
+
+from qtpy import QtCore
+
+from labelme.label_file import LabelFileError
+from labelme.logger import logger
+
+
+class AutoSaver(QtCore.QObject):
+    """
+        Фоновая запись файлов разметки.
+
+        UI-поток кладёт в очередь готовый снимок документа (словари, которые
+        передаются в LabelFile.save), а запись json на диск выполняется в
+        отдельном потоке. Повторные запросы на сохранение одного и того же
+        файла, пришедшие до начала записи, схлопываются в один: записывается
+        только последний снимок.
+    """
+
+    # (filename, image_path, label_file) после успешной записи
+    saved = QtCore.Signal(str, str, object)
+    # (filename, текст ошибки)
+    failed = QtCore.Signal(str, str)
+    # (глубина очереди, время последнего сохранения в мс)
+    statusChanged = QtCore.Signal(int, float)
+
+    def __init__(self, parent=None):
+        super(AutoSaver, self).__init__(parent)
+        self._condition = threading.Condition()
+        # filename -> (label_file, image_path, save_kwargs, время постановки)
+        self._pending = collections.OrderedDict()
+        self._writing = False
+        self._latency = 0.0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def depth(self):
+        with self._condition:
+            return len(self._pending) + int(self._writing)
+
+    def enqueue(self, label_file, image_path, save_kwargs):
+        """
+            Ставит снимок документа в очередь на запись.
+
+            -------
+            Параметры
+
+            label_file
+                LabelFile, через который будет выполнена запись
+            image_path
+                Путь к изображению, к которому относится разметка
+            save_kwargs
+                Аргументы LabelFile.save (filename, shapes, ...)
+        """
+        filename = save_kwargs["filename"]
+        with self._condition:
+            enqueued_at = time.monotonic()
+            if filename in self._pending:
+                # Схлопываем: сохраняем время первого запроса, чтобы задержка
+                # в строке состояния отражала реальное ожидание.
+                enqueued_at = self._pending.pop(filename)[3]
+            self._pending[filename] = (label_file, image_path, save_kwargs, enqueued_at)
+            self._condition.notify_all()
+        self._emitStatus()
+
+    def flush(self, timeout=None):
+        """
+            Блокирует вызывающий поток, пока очередь не будет записана на диск.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._writing, timeout=timeout
+            )
+
+    def _emitStatus(self):
+        self.statusChanged.emit(self.depth(), self._latency)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                filename, job = self._pending.popitem(last=False)
+                self._writing = True
+            label_file, image_path, save_kwargs, enqueued_at = job
+            try:
+                label_file.save(**save_kwargs)
+            except LabelFileError as e:
+                logger.error("Failed to autosave {}: {}".format(filename, e))
+                self.failed.emit(filename, str(e))
+            else:
+                self.saved.emit(filename, image_path, label_file)
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._latency = (time.monotonic() - enqueued_at) * 1000
+                    self._condition.notify_all()
+                self._emitStatus()
@@ -0,0 +1,141 @@
+import os
+import os.path as osp
+import threading
+import time
+
+from qtpy import QtCore
+
+from labelme.label_file import LabelFile
+from labelme.logger import logger
+
+
+def _label_names(entries):
+    return {
+        entry.name for entry in entries if LabelFile.is_label_file(entry.name)
+    }
+
+
+def scan_images(dirpath, extensions, output_dir=None):
+    """
+        Обходит папку рекурсивно и выдаёт пары (путь к изображению, есть ли
+        у него файл разметки) в естественном порядке сортировки.
+
+        Вместо проверки существования json для каждого изображения
+        используется одно чтение каждой папки: файлы разметки берутся из того
+        же списка, что и изображения (или из списка output_dir, если он
+        задан). Как и os.walk, не заходит в ссылки на папки.
+    """
+    import natsort
+
+    extensions = tuple(ext.lower() for ext in extensions)
+    output_labels = None
+    if output_dir:
+        try:
+            with os.scandir(output_dir) as it:
+                output_labels = _label_names(list(it))
+        except OSError as e:
+            logger.warning("Failed to list {}: {}".format(output_dir, e))
+            output_labels = set()
+
+    def walk(path):
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.warning("Failed to list {}: {}".format(path, e))
+            return
+        labels = output_labels if output_labels is not None else _label_names(entries)
+        # Сортировка - самая долгая часть обхода, поэтому сортируем только
+        # изображения и папки
+        entries = [
+            entry
+            for entry in entries
+            if entry.name.lower().endswith(extensions)
+            or (entry.is_dir() and not entry.is_symlink())
+        ]
+        for entry in natsort.os_sorted(entries, key=lambda e: e.name):
+            if entry.is_dir():
+                yield from walk(entry.path)
+            else:
+                label_name = osp.splitext(entry.name)[0] + LabelFile.suffix
+                yield osp.normpath(entry.path), label_name in labels
+
+    yield from walk(dirpath)
+
+
+class DirScanner(QtCore.QObject):
+    """
+        Чтение папки с изображениями в фоновом потоке.
+
+        Найденные изображения отправляются сигналом found пачками, чтобы
+        список файлов заполнялся по мере обхода, а первая страница
+        открывалась, не дожидаясь конца обхода большой (в том числе сетевой)
+        папки. Первая пачка отправляется сразу после первого найденного
+        изображения, следующие - по batch_size штук или раз в interval
+        секунд.
+
+        Каждый вызов scan получает номер, который передаётся в сигналах:
+        результаты отменённого или заменённого новым обхода нужно
+        пропускать.
+    """
+
+    # (номер обхода, список пар (путь к изображению, размечено ли))
+    found = QtCore.Signal(int, object)
+    # (номер обхода, количество найденных изображений)
+    finished = QtCore.Signal(int, int)
+
+    def __init__(self, batch_size=500, interval=0.1, parent=None):
+        super(DirScanner, self).__init__(parent)
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._scan_id = 0
+
+    def scan(self, dirpath, extensions, output_dir=None, pattern=None) -> int:
+        """
+            Запускает обход папки, отменяя предыдущий.
+            pattern - регулярное выражение, которому должен соответствовать
+            путь к изображению
+        """
+        with self._lock:
+            self._scan_id += 1
+            scan_id = self._scan_id
+        thread = threading.Thread(
+            target=self._run,
+            args=(scan_id, dirpath, extensions, output_dir, pattern),
+            daemon=True,
+        )
+        thread.start()
+        return scan_id
+
+    def cancel(self):
+        with self._lock:
+            self._scan_id += 1
+
+    def _isCancelled(self, scan_id):
+        with self._lock:
+            return scan_id != self._scan_id
+
+    def _run(self, scan_id, dirpath, extensions, output_dir, pattern):
+        batch = []
+        count = 0
+        flushed_at = time.monotonic()
+        for filename, labeled in scan_images(dirpath, extensions, output_dir):
+            if self._isCancelled(scan_id):
+                return
+            if pattern is not None and not pattern.search(filename):
+                continue
+            batch.append((filename, labeled))
+            count += 1
+            now = time.monotonic()
+            if (
+                count == 1
+                or len(batch) >= self.batch_size
+                or now - flushed_at >= self.interval
+            ):
+                self.found.emit(scan_id, batch)
+                batch = []
+                flushed_at = now
+        if batch:
+            self.found.emit(scan_id, batch)
+        self.finished.emit(scan_id, count)
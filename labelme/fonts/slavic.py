@@ -1,5 +1,4 @@
 from qtpy.QtGui import QFontDatabase, QFont
-import labelme.fonts.font_rc
 from labelme.logger import logger
 
 class SlavicFont:
@@ -13,6 +12,9 @@ class SlavicFont:
     @classmethod
     def load_font(cls):
         if cls.__font_family is None:
+            # Ресурс со шрифтом регистрируется при первом обращении
+            import labelme.fonts.font_rc  # noqa: F401
+
             font_id = QFontDatabase.addApplicationFont(":/Hirmos_with_t_titlo.ttf")
             if font_id >= 0:
                 cls.__font_family = QFontDatabase.applicationFontFamilies(font_id)[0]
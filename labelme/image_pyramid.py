@@ -0,0 +1,256 @@
+import collections
+import math
+
+from qtpy import QtCore
+from qtpy import QtGui
+
+
+class ImagePyramid(object):
+    """
+        Многоуровневое представление изображения страницы для отрисовки.
+
+        Уровень k - изображение, уменьшенное в 2**k раз и разбитое на тайлы
+        tile_size x tile_size. Уровень 0 - само изображение, он не копируется.
+        Тайлы остальных уровней строятся при первом обращении из четырёх
+        тайлов предыдущего уровня и хранятся в LRU-кэше, объём которого
+        ограничен budget байтами.
+
+        Вместо полного изображения можно передать его уменьшенную копию
+        (например, быстро прочитанную из JPEG) и полный размер size. Копия
+        становится уровнем base_level и хранится целиком. Тайлы более
+        подробных уровней, от 0 до base_level - 1, читаются из source
+        (ImageSource) полосами во всю ширину уровня: draw возвращает
+        полосы, которых не хватило, их нужно прочитать в фоне и передать
+        в addStrip. Тайлы из source лежат в том же LRU-кэше, поэтому
+        память ограничена копией и budget при любом размере скана. Без
+        source при крупном масштабе рисуется растянутая копия.
+
+        При отрисовке выбирается уровень, соответствующий масштабу, и
+        рисуются только тайлы, попадающие в видимую область, поэтому
+        уменьшенная страница не пересчитывается из полного изображения
+        на каждом кадре.
+    """
+
+    def __init__(
+        self,
+        image: QtGui.QImage,
+        tile_size=512,
+        budget=256 * 1024 * 1024,
+        size: QtCore.QSize = None,
+        source=None,
+    ):
+        if size is None:
+            size = image.size()
+        self._width, self._height = size.width(), size.height()
+        self.tile_size = tile_size
+        self.budget = budget
+        # (уровень, столбец, строка) -> QImage
+        self._tiles = collections.OrderedDict()
+        self._size = 0
+        self.base_level = 0
+        if image.width() < self._width:
+            self.base_level = max(
+                int(round(math.log2(self._width / max(image.width(), 1)))), 0
+            )
+            width, height = self.levelSize(self.base_level)
+            if (image.width(), image.height()) != (width, height):
+                image = image.scaled(
+                    width,
+                    height,
+                    QtCore.Qt.IgnoreAspectRatio,
+                    QtCore.Qt.SmoothTransformation,
+                )
+        self._image = image
+        self.source = source
+        # Полосы (уровень, строка), запрошенные у source и ещё не
+        # полученные или не прочитавшиеся
+        self._requested = set()
+        # Последний уровень - первый, который целиком помещается в один тайл
+        levels = self.base_level
+        while max(self.levelSize(levels)) > tile_size:
+            levels += 1
+        self.max_level = levels
+
+    def image(self) -> QtGui.QImage:
+        """Изображение уровня base_level."""
+        return self._image
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def memorySize(self):
+        """Объём закэшированных тайлов в байтах."""
+        return self._size
+
+    def clear(self):
+        self._tiles.clear()
+        self._size = 0
+
+    def levelSize(self, level):
+        """(ширина, высота) уровня в его пикселях."""
+        factor = 1 << level
+        return -(-self._width // factor), -(-self._height // factor)
+
+    def levelFor(self, scale):
+        """Самый грубый уровень, уменьшение которого не больше 1 / scale."""
+        if scale >= 0.5:
+            return 0
+        return min(int(math.floor(math.log2(1.0 / scale))), self.max_level)
+
+    def tile(self, level, column, row) -> QtGui.QImage:
+        """Тайл уровня level > base_level, из кэша или построенный заново."""
+        key = (level, column, row)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        tile = self._buildTile(level, column, row)
+        self._put(key, tile)
+        return tile
+
+    def _put(self, key, tile: QtGui.QImage):
+        self._tiles[key] = tile
+        self._size += tile.sizeInBytes()
+        while self._size > self.budget and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self._size -= evicted.sizeInBytes()
+
+    def stripRegion(self, level, row):
+        """
+            Что читать из source для полосы тайлов (level, row): область
+            в пикселях полного изображения и размер полосы на уровне.
+        """
+        factor = 1 << level
+        width, height = self.levelSize(level)
+        y = row * self.tile_size
+        strip_height = min(self.tile_size, height - y)
+        rect = QtCore.QRect(
+            0,
+            y * factor,
+            self._width,
+            min(strip_height * factor, self._height - y * factor),
+        )
+        return rect, QtCore.QSize(width, strip_height)
+
+    def addStrip(self, level, row, image: QtGui.QImage):
+        """Режет прочитанную из source полосу на тайлы и кладёт их в кэш."""
+        if image.isNull():
+            # Ошибка уже в логе, повторно полоса не запрашивается
+            return
+        self._requested.discard((level, row))
+        width = self.levelSize(level)[0]
+        for column in range(-(-width // self.tile_size)):
+            rect = self._tileRect(level, column, row)
+            tile = image.copy(rect.x(), 0, rect.width(), rect.height())
+            self._put((level, column, row), tile)
+
+    def _tileRect(self, level, column, row) -> QtCore.QRect:
+        """Область тайла в пикселях его уровня."""
+        width, height = self.levelSize(level)
+        x, y = column * self.tile_size, row * self.tile_size
+        return QtCore.QRect(
+            x, y, min(self.tile_size, width - x), min(self.tile_size, height - y)
+        )
+
+    def _buildTile(self, level, column, row) -> QtGui.QImage:
+        rect = self._tileRect(level, column, row)
+        # та же область на предыдущем уровне
+        width, height = self.levelSize(level - 1)
+        source_rect = QtCore.QRect(
+            rect.x() * 2,
+            rect.y() * 2,
+            min(rect.width() * 2, width - rect.x() * 2),
+            min(rect.height() * 2, height - rect.y() * 2),
+        )
+        if level == self.base_level + 1:
+            source = self._image.copy(source_rect)
+        else:
+            source = QtGui.QImage(
+                source_rect.size(), QtGui.QImage.Format_ARGB32_Premultiplied
+            )
+            painter = QtGui.QPainter(source)
+            for dy in (0, 1):
+                for dx in (0, 1):
+                    child = (level - 1, column * 2 + dx, row * 2 + dy)
+                    child_rect = self._tileRect(*child)
+                    if child_rect.isEmpty():
+                        continue
+                    painter.drawImage(
+                        child_rect.topLeft() - source_rect.topLeft(),
+                        self.tile(*child),
+                    )
+            painter.end()
+        return source.scaled(
+            rect.size(), QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+        )
+
+    def _drawBase(self, painter: QtGui.QPainter, rect: QtCore.QRectF):
+        factor = 1 << self.base_level
+        source = QtCore.QRectF(
+            rect.x() / factor,
+            rect.y() / factor,
+            rect.width() / factor,
+            rect.height() / factor,
+        )
+        painter.drawImage(rect, self._image, source)
+
+    def draw(self, painter: QtGui.QPainter, rect: QtCore.QRectF, scale):
+        """
+            Рисует часть изображения rect (в координатах изображения, в них же
+            настроен painter) уровнем, подходящим для масштаба scale.
+
+            Возвращает список полос (уровень, строка), которые нужно
+            прочитать из source (см. stripRegion и addStrip). Пока их нет,
+            на их месте рисуется растянутый уровень base_level.
+        """
+        missing = []
+        rect = rect.intersected(QtCore.QRectF(0, 0, self.width(), self.height()))
+        if rect.isEmpty():
+            return missing
+        level = self.levelFor(scale)
+        if self.source is None:
+            level = max(level, self.base_level)
+        factor = 1 << level
+        if level == self.base_level:
+            self._drawBase(painter, rect)
+            return missing
+        size = self.tile_size * factor
+        first_column, last_column = int(rect.left() // size), int(rect.right() // size)
+        first_row, last_row = int(rect.top() // size), int(rect.bottom() // size)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                tile_rect = self._tileRect(level, column, row)
+                if tile_rect.isEmpty():
+                    continue
+                # область тайла в координатах изображения
+                target = QtCore.QRectF(
+                    tile_rect.x() * factor,
+                    tile_rect.y() * factor,
+                    tile_rect.width() * factor,
+                    tile_rect.height() * factor,
+                )
+                target = target.intersected(rect)
+                if target.isEmpty():
+                    continue
+                source = QtCore.QRectF(
+                    target.x() / factor - tile_rect.x(),
+                    target.y() / factor - tile_rect.y(),
+                    target.width() / factor,
+                    target.height() / factor,
+                )
+                if level > self.base_level:
+                    tile = self.tile(level, column, row)
+                else:
+                    tile = self._tiles.get((level, column, row))
+                    if tile is None:
+                        self._drawBase(painter, target)
+                        if (level, row) not in self._requested:
+                            self._requested.add((level, row))
+                            missing.append((level, row))
+                        continue
+                    self._tiles.move_to_end((level, column, row))
+                painter.drawImage(target, tile, source)
+        return missing
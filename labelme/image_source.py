@@ -0,0 +1,190 @@
+import collections
+import tempfile
+import threading
+
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme import utils
+from labelme.logger import logger
+
+# Сколько строк результата уменьшается за раз при чтении из временного файла
+_BAND_ROWS = 64
+
+
+def _normalized(image: QtGui.QImage) -> QtGui.QImage:
+    """Изображение в 32-битном формате, в котором рисуются тайлы."""
+    if image.hasAlphaChannel():
+        fmt = QtGui.QImage.Format_ARGB32_Premultiplied
+    else:
+        fmt = QtGui.QImage.Format_RGB32
+    if image.format() == fmt:
+        return image
+    return image.convertToFormat(fmt)
+
+
+class ImageSource(object):
+    """
+        Полное изображение страницы, области которого декодируются по
+        запросу из байтов файла, без хранения всей страницы в памяти.
+
+        Если формат умеет декодировать часть изображения (ClipRect у
+        QImageReader, это JPEG), каждая область читается прямо из байтов,
+        а уменьшение делается при декодировании (ScaledSize). PNG, TIFF и
+        остальные форматы Qt читает только целиком: при первом запросе
+        страница декодируется один раз, пиксели переписываются во
+        временный файл, и дальше области читаются из него. Пока идёт это
+        первое чтение, в памяти одно полное изображение.
+
+        Методы можно вызывать из любого потока.
+    """
+
+    def __init__(self, image_data):
+        self._data = QtCore.QByteArray(image_data)
+        reader, _ = self._reader()
+        self._size = reader.size()
+        self._clip = reader.supportsOption(QtGui.QImageIOHandler.ClipRect)
+        self._lock = threading.Lock()
+        # Временный файл со строками пикселей (ширина * 4 байт) и их формат
+        self._pixels = None
+        self._format = None
+
+    def _reader(self):
+        # QImageReader не владеет устройством, поэтому буфер возвращается
+        # вместе с ним
+        buffer = QtCore.QBuffer()
+        buffer.setData(self._data)
+        buffer.open(QtCore.QIODevice.ReadOnly)
+        return QtGui.QImageReader(buffer), buffer
+
+    def size(self) -> QtCore.QSize:
+        """Размер полного изображения, без декодирования."""
+        return QtCore.QSize(self._size)
+
+    def isValid(self):
+        return self._size.isValid()
+
+    def read(self, rect: QtCore.QRect, size: QtCore.QSize = None) -> QtGui.QImage:
+        """
+            Область rect полного изображения, уменьшенная до size (если он
+            задан). При ошибке декодирования возвращает пустой QImage.
+        """
+        if size is None:
+            size = rect.size()
+        if self._clip:
+            reader, _buffer = self._reader()
+            if rect != QtCore.QRect(QtCore.QPoint(0, 0), self._size):
+                reader.setClipRect(rect)
+            if size != rect.size():
+                reader.setScaledSize(size)
+            image = reader.read()
+            if image.isNull():
+                logger.error(
+                    "Failed to decode image region: {}".format(reader.errorString())
+                )
+                return image
+            return _normalized(image)
+        with self._lock:
+            if self._pixels is None and not self._spill():
+                return QtGui.QImage()
+        if size == rect.size():
+            return self._region(rect)
+        # Уменьшение полосами, чтобы не читать всю область сразу
+        image = QtGui.QImage(size, self._format)
+        painter = QtGui.QPainter(image)
+        for top in range(0, size.height(), _BAND_ROWS):
+            bottom = min(top + _BAND_ROWS, size.height())
+            y1 = rect.y() + top * rect.height() // size.height()
+            y2 = rect.y() + bottom * rect.height() // size.height()
+            band = self._region(QtCore.QRect(rect.x(), y1, rect.width(), y2 - y1))
+            painter.drawImage(
+                0,
+                top,
+                band.scaled(
+                    size.width(),
+                    bottom - top,
+                    QtCore.Qt.IgnoreAspectRatio,
+                    QtCore.Qt.SmoothTransformation,
+                ),
+            )
+        painter.end()
+        return image
+
+    def _spill(self):
+        reader, _buffer = self._reader()
+        image = reader.read()
+        if image.isNull():
+            logger.error("Failed to decode image: {}".format(reader.errorString()))
+            return False
+        image = _normalized(image)
+        # Файл читается обычным read, а не отображается в память: его
+        # страницы остаются в кэше ОС и не считаются памятью процесса
+        pixels = tempfile.TemporaryFile()
+        for row in utils.img_qt_to_arr(image):
+            pixels.write(row)
+        pixels.flush()
+        self._format = image.format()
+        self._pixels = pixels
+        return True
+
+    def _region(self, rect: QtCore.QRect) -> QtGui.QImage:
+        line = self._size.width() * 4
+        with self._lock:
+            if rect.width() == self._size.width():
+                self._pixels.seek(line * rect.y())
+                data = self._pixels.read(line * rect.height())
+            else:
+                rows = []
+                for y in range(rect.y(), rect.y() + rect.height()):
+                    self._pixels.seek(line * y + rect.x() * 4)
+                    rows.append(self._pixels.read(rect.width() * 4))
+                data = b"".join(rows)
+        image = QtGui.QImage(
+            data, rect.width(), rect.height(), rect.width() * 4, self._format
+        )
+        return image.copy()
+
+
+class TileReader(QtCore.QObject):
+    """
+        Чтение областей ImageSource в фоновом потоке.
+
+        Первыми читаются последние запросы: при прокрутке и смене масштаба
+        сначала нужно то, что видно сейчас. cancel отменяет ещё не
+        начатые запросы.
+    """
+
+    # (источник, ключ запроса, QImage)
+    loaded = QtCore.Signal(object, object, object)
+
+    def __init__(self, parent=None):
+        super(TileReader, self).__init__(parent)
+        self._condition = threading.Condition()
+        # (источник, ключ) -> (область, размер)
+        self._pending = collections.OrderedDict()
+        self._thread = None
+
+    def read(self, source: ImageSource, key, rect: QtCore.QRect, size=None):
+        with self._condition:
+            self._pending[(source, key)] = (rect, size)
+            self._pending.move_to_end((source, key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._pending.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: bool(self._pending))
+                (source, key), (rect, size) = self._pending.popitem(last=True)
+            try:
+                image = source.read(rect, size)
+            except Exception:
+                logger.exception("Failed to read image region")
+                image = QtGui.QImage()
+            self.loaded.emit(source, key, image)
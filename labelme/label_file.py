@@ -1,8 +1,10 @@
-import base64
 import contextlib
+import copy
 import io
 import json
+import os
 import os.path as osp
+import threading
 
 import PIL.Image
 
@@ -34,6 +36,55 @@ class LabelFileError(Exception):
     pass
 
 
+class ShapesSnapshot(object):
+    """
+        Снимок фигур документа для сохранения в фоне.
+
+        Создаётся в UI-потоке и только копирует ссылки: класс, метку,
+        диакритику, тип и неизменяемый массив вершин каждой фигуры, а также
+        снимки её потомков. Словари для json (toDicts) строятся уже в потоке
+        записи, поэтому правки на холсте после создания снимка его не меняют.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, shapes):
+        self._items = tuple(self._snapshot(shape) for shape in shapes)
+
+    @classmethod
+    def _snapshot(cls, shape: Shape):
+        shape_class = shape.getClass()
+        if shape_class not in (ShapeClass.TEXT, ShapeClass.ROW, ShapeClass.LETTER):
+            raise Exception("error in shape type in format_shape")
+        return (
+            shape_class,
+            shape.label,
+            shape.diacritical,
+            shape.shape_type,
+            shape.coords,
+            copy.deepcopy(shape.other_data) if shape.other_data else None,
+            tuple(cls._snapshot(child) for child in shape.getChildren()),
+        )
+
+    @classmethod
+    def _format(cls, item):
+        shape_class, label, diacritical, shape_type, coords, other_data, children = item
+        data = dict(other_data) if other_data else {}
+        if shape_class != ShapeClass.TEXT:
+            data["label"] = label
+        if shape_class == ShapeClass.LETTER:
+            data["diacritical"] = diacritical
+        else:
+            data["shapes"] = [cls._format(child) for child in children]
+        data["points"] = coords.tolist()
+        data["shape_type"] = shape_type
+        return data
+
+    def toDicts(self):
+        """Фигуры в виде словарей файла разметки."""
+        return [self._format(item) for item in self._items]
+
+
 class LabelFile(object):
     suffix = ".json"
 
@@ -53,20 +104,32 @@ class LabelFile(object):
             logger.error("Failed opening image file: {}".format(filename))
             return
 
-        # apply orientation to image according to exif
-        image_pil = utils.apply_exif_orientation(image_pil)
+        with image_pil:
+            # apply orientation to image according to exif
+            oriented_pil = utils.apply_exif_orientation(image_pil)
 
-        with io.BytesIO() as f:
-            ext = osp.splitext(filename)[1].lower()
-            if PY2 and QT4:
-                format = "PNG"
-            elif ext in [".jpg", ".jpeg"]:
-                format = "JPEG"
-            else:
-                format = "PNG"
-            image_pil.save(f, format=format)
-            f.seek(0)
-            return f.read()
+            # Если поворачивать нечего, а формат Qt читает сам, отдаём исходные
+            # байты файла: PIL прочитал только заголовок, картинка будет
+            # декодирована один раз в QImage.fromData.
+            if (
+                oriented_pil is image_pil
+                and image_pil.format in ["JPEG", "PNG"]
+                and not (PY2 and QT4)
+            ):
+                with io.open(filename, "rb") as f:
+                    return f.read()
+
+            with io.BytesIO() as f:
+                ext = osp.splitext(filename)[1].lower()
+                if PY2 and QT4:
+                    format = "PNG"
+                elif ext in [".jpg", ".jpeg"]:
+                    format = "JPEG"
+                else:
+                    format = "PNG"
+                oriented_pil.save(f, format=format)
+                f.seek(0)
+                return f.read()
 
     def _loadRecursice(self, data):
         """
@@ -155,7 +218,7 @@ class LabelFile(object):
                 
             imagePath = data["imagePath"]
             self._check_image_height_and_width(
-                base64.b64encode(imageData).decode("utf-8"),
+                imageData,
                 data.get("imageHeight"),
                 data.get("imageWidth"),
             )
@@ -178,19 +241,20 @@ class LabelFile(object):
 
     @staticmethod
     def _check_image_height_and_width(imageData, imageHeight, imageWidth):
-        img_arr = utils.img_b64_to_arr(imageData)
-        if imageHeight is not None and img_arr.shape[0] != imageHeight:
+        # Размеры берутся из заголовка, изображение целиком не декодируется
+        img_height, img_width = utils.img_data_to_size(imageData)
+        if imageHeight is not None and img_height != imageHeight:
             logger.error(
                 "imageHeight does not match with imageData or imagePath, "
                 "so getting imageHeight from actual image."
             )
-            imageHeight = img_arr.shape[0]
-        if imageWidth is not None and img_arr.shape[1] != imageWidth:
+            imageHeight = img_height
+        if imageWidth is not None and img_width != imageWidth:
             logger.error(
                 "imageWidth does not match with imageData or imagePath, "
                 "so getting imageWidth from actual image."
             )
-            imageWidth = img_arr.shape[1]
+            imageWidth = img_width
         return imageHeight, imageWidth
 
     def save(
@@ -205,6 +269,8 @@ class LabelFile(object):
     ):
         if otherData is None:
             otherData = {}
+        if isinstance(shapes, ShapesSnapshot):
+            shapes = shapes.toDicts()
         if textType is None:
             textType = ManuscriptType.USTAV
         data = dict(
@@ -217,11 +283,21 @@ class LabelFile(object):
         for key, value in otherData.items():
             assert key not in data
             data[key] = value
+        # Пишем во временный файл рядом с целевым и атомарно подменяем его,
+        # чтобы прерванная запись не оставляла обрезанный json. Файл
+        # закрывается (и сбрасывается на диск) до подмены: open() этого
+        # модуля его не закрывает.
+        tmp_filename = "{}.{}.tmp".format(filename, threading.get_ident())
         try:
-            with open(filename, "w") as f:
+            with io.open(tmp_filename, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, filename)
             self.filename = filename
         except Exception as e:
+            if osp.exists(tmp_filename):
+                os.remove(tmp_filename)
             raise LabelFileError(e)
 
     @staticmethod
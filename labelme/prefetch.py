@@ -0,0 +1,260 @@
+import collections
+import os.path as osp
+import threading
+
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme import utils
+from labelme.image_source import ImageSource
+from labelme.label_file import LabelFile
+from labelme.label_file import LabelFileError
+from labelme.logger import logger
+
+
+def _stamp(filename, label_file):
+    """Отметки (utils.file_stamp) изображения и файла разметки."""
+    return utils.file_stamp(filename), utils.file_stamp(label_file)
+
+
+class Page(object):
+    """
+        Прочитанная с диска страница: разобранный файл разметки (если он
+        есть), байты изображения и готовый к показу QImage.
+
+        image может быть уменьшенной копией изображения (см. read_page),
+        тогда size - размер полного изображения, больший размера image,
+        а source - ImageSource, из которого читаются его области.
+    """
+
+    def __init__(
+        self,
+        filename,
+        label_file,
+        image_data,
+        image,
+        error,
+        stamp,
+        size=None,
+        source=None,
+    ):
+        self.filename = filename
+        # LabelFile или None, если у изображения нет разметки
+        self.label_file = label_file
+        self.image_data = image_data
+        self.image = image
+        self.size = image.size() if size is None else size
+        self.source = source
+        # LabelFileError, если файл разметки не удалось прочитать
+        self.error = error
+        self.stamp = stamp
+
+    @property
+    def nbytes(self):
+        return self.image.sizeInBytes() + len(self.image_data or b"")
+
+    def isPreview(self):
+        return self.size != self.image.size()
+
+
+def read_page(filename, label_file, draft_size=None, max_image_size=None) -> Page:
+    """
+        Читает страницу так же, как MainWindow.loadFile: из файла разметки,
+        если он есть, иначе из самого изображения.
+
+        draft_size - (ширина, высота) области показа: если изображение -
+        JPEG, больший этой области, декодируется только уменьшенная копия
+        (utils.img_data_to_qt_draft).
+
+        max_image_size - байт на декодированное изображение: страница
+        больше этого декодируется уменьшенной в 2, 4, 8... раз.
+
+        Области полного изображения уменьшенной копии потом читаются
+        из page.source.
+
+        Может вызываться не из UI-потока: QImage, в отличие от QPixmap,
+        можно создавать в любом потоке.
+    """
+    stamp = _stamp(filename, label_file)
+    lf = None
+    error = None
+    if osp.exists(label_file) and LabelFile.is_label_file(label_file):
+        try:
+            lf = LabelFile(label_file)
+        except LabelFileError as e:
+            error = e
+        image_data = lf.imageData if lf is not None else None
+    else:
+        image_data = LabelFile.load_image_file(filename)
+    draft = None
+    if draft_size is not None and image_data:
+        draft = utils.img_data_to_qt_draft(image_data, draft_size)
+    if draft is not None:
+        image, (width, height) = draft
+        size = QtCore.QSize(width, height)
+        source = ImageSource(image_data)
+        return Page(filename, lf, image_data, image, error, stamp, size, source)
+    if max_image_size is not None and image_data:
+        source = ImageSource(image_data)
+        size = source.size()
+        width, height = size.width(), size.height()
+        factor = 1
+        while -(-width // factor) * -(-height // factor) * 4 > max_image_size:
+            factor *= 2
+        if factor > 1:
+            reduced = QtCore.QSize(-(-width // factor), -(-height // factor))
+            image = source.read(QtCore.QRect(QtCore.QPoint(0, 0), size), reduced)
+            if not image.isNull():
+                return Page(
+                    filename, lf, image_data, image, error, stamp, size, source
+                )
+    image = QtGui.QImage.fromData(image_data) if image_data else QtGui.QImage()
+    return Page(filename, lf, image_data, image, error, stamp)
+
+
+class ImageDecoder(QtCore.QObject):
+    """
+        Декодирование полного изображения страницы в фоновом потоке,
+        когда оно понадобилось модели, а показана уменьшенная копия.
+
+        Каждый вызов decode получает номер, который передаётся в сигнале:
+        результат отменённого или заменённого новым запроса нужно
+        пропускать.
+    """
+
+    # (номер запроса, QImage)
+    decoded = QtCore.Signal(int, object)
+
+    def __init__(self, parent=None):
+        super(ImageDecoder, self).__init__(parent)
+        self._lock = threading.Lock()
+        self._request_id = 0
+
+    def decode(self, image_data) -> int:
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+        thread = threading.Thread(
+            target=self._run, args=(request_id, image_data), daemon=True
+        )
+        thread.start()
+        return request_id
+
+    def cancel(self):
+        with self._lock:
+            self._request_id += 1
+
+    def _run(self, request_id, image_data):
+        image = QtGui.QImage.fromData(image_data)
+        with self._lock:
+            if request_id != self._request_id:
+                return
+        self.decoded.emit(request_id, image)
+
+
+class PagePrefetcher(object):
+    """
+        Фоновое чтение соседних страниц.
+
+        Пока пользователь размечает текущую страницу, несколько потоков
+        читают следующие и предыдущие страницы списка файлов (read_page) и
+        держат результат в кэше, ограниченном budget байт. При переходе на
+        страницу она забирается из кэша (take), и вместо чтения и
+        декодирования остаётся только показать картинку.
+
+        prefetch заменяет очередь целиком, cancel её очищает: страницы,
+        которые уже читаются, дочитываются и остаются в кэше. Страница из
+        кэша не отдаётся, если изображение или разметка изменились на диске
+        после чтения.
+    """
+
+    def __init__(self, workers=2, budget=512 * 1024 * 1024, max_image_size=None):
+        self.budget = budget
+        # см. read_page
+        self.max_image_size = max_image_size
+        self._condition = threading.Condition()
+        # (filename, label_file) в порядке приоритета
+        self._pending = collections.deque()
+        self._loading = set()
+        self._pages = collections.OrderedDict()
+        self._size = 0
+
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def prefetch(self, pages):
+        """
+            Ставит страницы в очередь на чтение вместо прежней очереди.
+
+            pages - пары (путь к изображению, путь к файлу разметки),
+            сначала самые нужные
+        """
+        with self._condition:
+            self._pending = collections.deque(
+                (filename, label_file)
+                for filename, label_file in pages
+                if filename not in self._pages and filename not in self._loading
+            )
+            self._condition.notify_all()
+
+    def cancel(self):
+        """Отменяет ещё не начатое чтение."""
+        with self._condition:
+            self._pending.clear()
+
+    def clear(self):
+        with self._condition:
+            self._pending.clear()
+            self._pages.clear()
+            self._size = 0
+
+    def take(self, filename, label_file, timeout=5.0):
+        """
+            Забирает страницу из кэша. Если она как раз читается, ждёт
+            окончания чтения, а не читает её второй раз.
+            Возвращает None, если страницы нет или она устарела.
+        """
+        with self._condition:
+            self._pending = collections.deque(
+                p for p in self._pending if p[0] != filename
+            )
+            self._condition.wait_for(
+                lambda: filename not in self._loading, timeout=timeout
+            )
+            page = self._pages.pop(filename, None)
+            if page is not None:
+                self._size -= page.nbytes
+        if page is None or page.stamp != _stamp(filename, label_file):
+            return None
+        return page
+
+    def _store(self, page):
+        self._pages[page.filename] = page
+        self._size += page.nbytes
+        while self._size > self.budget and self._pages:
+            _, evicted = self._pages.popitem(last=False)
+            self._size -= evicted.nbytes
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: bool(self._pending))
+                filename, label_file = self._pending.popleft()
+                self._loading.add(filename)
+
+            try:
+                page = read_page(
+                    filename, label_file, max_image_size=self.max_image_size
+                )
+            except Exception:
+                logger.exception("Failed to prefetch {}".format(filename))
+                page = None
+
+            with self._condition:
+                self._loading.discard(filename)
+                if page is not None:
+                    self._store(page)
+                self._condition.notify_all()
@@ -0,0 +1,82 @@
+import builtins
+import collections
+import contextlib
+import sys
+import time
+
+
+class StartupProfiler(object):
+    """
+        Замер запуска программы (--profile-startup).
+
+        stage() замеряет этапы запуска. Пока профайлер установлен (install),
+        каждый импорт нового модуля замеряется через builtins.__import__:
+        время импорта без вложенных импортов прибавляется к пакету верхнего
+        уровня, поэтому в отчёте видно, какие зависимости грузятся дольше.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._stages = []
+        # пакет верхнего уровня -> (собственное время импорта, число модулей)
+        self._imports = collections.defaultdict(lambda: [0.0, 0])
+        # [время, число модулей] вложенных импортов для каждого уровня
+        self._stack = []
+        self._original_import = None
+
+    def install(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules and not fromlist:
+            return self._original_import(name, globals, locals, fromlist, level)
+        before = len(sys.modules)
+        start = time.perf_counter()
+        self._stack.append([0.0, 0])
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            loaded = len(sys.modules) - before
+            nested_time, nested_loaded = self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += elapsed
+                self._stack[-1][1] += loaded
+            if loaded:
+                if level and globals:
+                    name = globals.get("__package__") or name
+                stat = self._imports[name.split(".")[0]]
+                stat[0] += elapsed - nested_time
+                stat[1] += loaded - nested_loaded
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages.append((name, time.perf_counter() - start))
+
+    def report(self, top=15):
+        lines = ["Startup profile:"]
+        for name, elapsed in self._stages:
+            lines.append("  {:<32} {:8.1f} ms".format(name, elapsed * 1000))
+        lines.append(
+            "  {:<32} {:8.1f} ms".format(
+                "total", (time.perf_counter() - self._start) * 1000
+            )
+        )
+        if self._imports:
+            lines.append("Imports by package (self time, modules):")
+            imports = sorted(self._imports.items(), key=lambda item: -item[1][0])
+            for package, (elapsed, count) in imports[:top]:
+                lines.append(
+                    "  {:<32} {:8.1f} ms {:6d}".format(package, elapsed * 1000, count)
+                )
+        return "\n".join(lines)
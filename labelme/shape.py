@@ -1,11 +1,11 @@
 from typing import List
+import array
+import collections.abc
 import math
 
-import copy
 from enum import Enum
 
 import numpy as np
-import skimage.measure
 from qtpy import QtCore
 from qtpy import QtGui
 
@@ -13,15 +13,202 @@ import labelme.utils
 from labelme.logger import logger
 
 
-# TODO(unknown):
-# - [opt] Store paths instead of creating new ones at each paint.
-
 class ShapeClass(Enum):
     TEXT = 0
     ROW = 1
     LETTER = 2
 
 
+# ShapeClass по номеру, без поиска по значению в Enum
+_SHAPE_CLASSES = list(ShapeClass)
+
+
+class ShapeTree(object):
+    """
+        Иерархия фигур документа (страницы): текст -> строки -> буквы.
+
+        Фигура - узел дерева, её номер хранится в Shape._node. Для узлов
+        хранятся номер родителя (-1 у корней), класс фигуры (ShapeClass.value)
+        и списки номеров прямых потомков. Удалённая у родителя фигура
+        (Shape.delete) остаётся в дереве и помнит родителя, чтобы отмена
+        могла вернуть её на место.
+
+        Потомки фигуры всегда в дереве её родителя. Фигура без родителя
+        создаётся в переданном ей дереве или в новом; при добавлении на холст
+        она переносится в его дерево (adopt).
+    """
+
+    __slots__ = ("_shapes", "_parents", "_classes", "_children")
+
+    def __init__(self):
+        self._shapes: List["Shape"] = []
+        self._parents = array.array("i")
+        self._classes = bytearray()
+        self._children: List[List[int]] = []
+
+    @classmethod
+    def of(cls, shapes: List["Shape"]) -> "ShapeTree":
+        """Общее дерево фигур shapes или новое, в которое перенесены их корни."""
+        trees = {id(shape._tree): shape._tree for shape in shapes}
+        if len(trees) == 1:
+            return next(iter(trees.values()))
+        tree = cls()
+        for shape in shapes:
+            if shape.parent is None:
+                tree.adopt(shape)
+        return tree
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def add(self, shape: "Shape", parent: int, shape_class: ShapeClass) -> int:
+        node = len(self._shapes)
+        self._shapes.append(shape)
+        self._parents.append(parent)
+        self._classes.append(shape_class.value)
+        self._children.append([])
+        if parent >= 0:
+            self._children[parent].append(node)
+        return node
+
+    def adopt(self, shape: "Shape"):
+        """Переносит фигуру вместе с потомками из её дерева в это."""
+        old = shape._tree
+        if old is self:
+            return
+        parent = old._parents[shape._node]
+        if parent >= 0:
+            old.unlink(shape._node)
+        nodes = {}
+        for node in [shape._node] + old.subtree(shape._node):
+            moved = old._shapes[node]
+            new_parent = nodes.get(old._parents[node], -1)
+            nodes[node] = self.add(
+                moved, new_parent, _SHAPE_CLASSES[old._classes[node]]
+            )
+            moved._tree = self
+            moved._node = nodes[node]
+            old._shapes[node] = None
+        # Корень переносится без родителя: родитель из другого документа
+        # задаётся отдельно (Shape.parent)
+
+    def shape(self, node: int) -> "Shape":
+        return self._shapes[node]
+
+    def parent(self, node: int) -> int:
+        return self._parents[node]
+
+    def setParent(self, node: int, parent: int):
+        """Меняет родителя узла, не добавляя его в список потомков."""
+        self._parents[node] = parent
+
+    def shapeClass(self, node: int) -> ShapeClass:
+        return _SHAPE_CLASSES[self._classes[node]]
+
+    def children(self, node: int) -> List[int]:
+        return self._children[node]
+
+    def link(self, node: int, index: int = None):
+        """Добавляет узел в список потомков его родителя (в конец или на index)."""
+        children = self._children[self._parents[node]]
+        if node in children:
+            return
+        if index is None:
+            children.append(node)
+        else:
+            children.insert(index, node)
+
+    def unlink(self, node: int):
+        """Убирает узел из списка потомков родителя, сохраняя ссылку на родителя."""
+        parent = self._parents[node]
+        if parent >= 0 and node in self._children[parent]:
+            self._children[parent].remove(node)
+
+    def subtree(self, node: int) -> List[int]:
+        """Все потомки узла (без него самого), уровень за уровнем."""
+        children = self._children
+        nodes = list(children[node])
+        i = 0
+        while i < len(nodes):
+            nodes.extend(children[nodes[i]])
+            i += 1
+        return nodes
+
+    def isDescendant(self, node: int, ancestor: int) -> bool:
+        """Является ли node узлом ancestor или его потомком."""
+        parents = self._parents
+        while node >= 0:
+            if node == ancestor:
+                return True
+            node = parents[node]
+        return False
+
+    def filterDescendants(self, shapes: List["Shape"], ancestor: "Shape"):
+        """
+            Фигуры из shapes, которые являются потомками ancestor (на любом
+            уровне), в том же порядке. Подъём к корням идёт по массиву
+            родителей сразу для всех фигур, по одному шагу на уровень.
+        """
+        shapes = [shape for shape in shapes if shape._tree is self]
+        if not shapes or ancestor._tree is not self:
+            return []
+        parents = self.parents()
+        node = parents[np.fromiter((s._node for s in shapes), np.intc, len(shapes))]
+        mask = node == ancestor._node
+        while True:
+            alive = node >= 0
+            if not alive.any():
+                break
+            node = np.where(alive, parents[np.maximum(node, 0)], -1)
+            mask |= node == ancestor._node
+        return [shape for shape, keep in zip(shapes, mask.tolist()) if keep]
+
+    def parents(self) -> np.ndarray:
+        """Номера родителей всех узлов (-1 у корней), без копирования."""
+        return np.frombuffer(self._parents, dtype=np.intc)
+
+    def classes(self) -> np.ndarray:
+        """Классы всех узлов (ShapeClass.value), без копирования."""
+        return np.frombuffer(self._classes, dtype=np.uint8)
+
+
+class _Style(object):
+    """
+        Атрибут отрисовки фигуры: значение, заданное самой фигуре, или
+        общее для всех фигур значение класса (Shape.line_color = ...).
+        Значение фигуры хранится в слоте с тем же именем с подчёркиванием,
+        None в нём означает значение класса.
+    """
+
+    __slots__ = ("default", "slot")
+
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, shape, owner=None):
+        if shape is None:
+            return self.default
+        value = getattr(shape, self.slot)
+        return self.default if value is None else value
+
+    def __set__(self, shape, value):
+        setattr(shape, self.slot, value)
+
+
+class _ShapeType(type):
+    """Присваивание классу Shape атрибута отрисовки меняет значение по умолчанию."""
+
+    def __setattr__(cls, name, value):
+        style = cls.__dict__.get(name)
+        if isinstance(style, _Style):
+            style.default = value
+        else:
+            super(_ShapeType, cls).__setattr__(name, value)
+
+
 class IdController:
     _count: int = 0
 
@@ -36,7 +223,128 @@ class IdController:
         return tmp
 
 
-class Shape(object):
+def _to_coords(points) -> np.ndarray:
+    """
+        Массив (N, 2) float64 из списка QPointF, пар (x, y), массива или
+        вершин другой фигуры. Массив помечается неизменяемым: все изменения
+        вершин создают новый массив, поэтому его можно разделять между
+        фигурами и сохранять для отмены.
+    """
+    if isinstance(points, ShapePoints):
+        return points._shape._coords
+    if isinstance(points, np.ndarray):
+        if points.dtype == np.float64 and not points.flags.writeable:
+            return points.reshape(-1, 2)
+        coords = np.array(points, dtype=np.float64).reshape(-1, 2)
+    else:
+        coords = np.array(
+            [
+                (p.x(), p.y()) if isinstance(p, (QtCore.QPointF, QtCore.QPoint)) else p
+                for p in points
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+    coords.flags.writeable = False
+    return coords
+
+
+class ShapePoints(collections.abc.MutableSequence):
+    """
+        Вершины фигуры в виде списка QPointF для кода, который работает
+        с points как со списком.
+
+        Координаты хранятся в массиве Shape.coords, элементы этого списка -
+        новые QPointF при каждом обращении, поэтому изменение полученной
+        точки не меняет фигуру. Изменения через сам список (присваивание
+        по индексу, append, insert, pop) идут в массив фигуры и сбрасывают
+        её кэши.
+    """
+
+    __slots__ = ("_shape",)
+
+    def __init__(self, shape: "Shape"):
+        self._shape = shape
+
+    def __len__(self):
+        return len(self._shape._coords)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [QtCore.QPointF(x, y) for x, y in self._shape._coords[key].tolist()]
+        x, y = self._shape._coords[key].tolist()
+        return QtCore.QPointF(x, y)
+
+    def __iter__(self):
+        for x, y in self._shape._coords.tolist():
+            yield QtCore.QPointF(x, y)
+
+    def __setitem__(self, key, value):
+        coords = self._shape._coords.copy()
+        if isinstance(key, slice):
+            coords = np.delete(coords, np.arange(len(coords))[key], axis=0)
+            start = key.indices(len(self))[0]
+            coords = np.insert(coords, start, _to_coords(value), axis=0)
+        else:
+            coords[key] = (value.x(), value.y())
+        self._shape.coords = coords
+
+    def __delitem__(self, key):
+        indices = np.arange(len(self))[key]
+        self._shape.coords = np.delete(self._shape._coords, indices, axis=0)
+
+    def insert(self, index, value):
+        self._shape.coords = np.insert(
+            self._shape._coords, index, (value.x(), value.y()), axis=0
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, ShapePoints):
+            return np.array_equal(self._shape._coords, other._shape._coords)
+        return list(self) == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Shape(object, metaclass=_ShapeType):
+    # Фигур на странице тысячи, поэтому атрибуты хранятся в слотах,
+    # а иерархия - в ShapeTree документа
+    __slots__ = (
+        "_path",
+        "_bounds",
+        "_paint_cache",
+        "_mask_version",
+        "_mask_images",
+        "_mask_contour",
+        "_mask_paint_cache",
+        "_mask",
+        "_id",
+        "label",
+        "diacritical",
+        "group_id",
+        "_coords",
+        "point_labels",
+        "_shape_type",
+        "_shape_raw",
+        "fill",
+        "selected",
+        "description",
+        "other_data",
+        "_tree",
+        "_node",
+        "_highlightIndex",
+        "_highlightMode",
+        "_closed",
+        # значения атрибутов отрисовки (_Style), заданные самой фигуре
+        "_line_color",
+        "_fill_color",
+        "_select_line_color",
+        "_select_fill_color",
+        "_vertex_fill_color",
+        "_hvertex_fill_color",
+        "_scale",
+    )
+
     # Render handles as squares
     P_SQUARE = 0
 
@@ -55,15 +363,20 @@ class Shape(object):
     text_color = None
     row_color = None
     # The following class variables influence the drawing of all shape objects.
-    line_color = None
-    fill_color = None
-    select_line_color = None
-    select_fill_color = None
-    vertex_fill_color = None
-    hvertex_fill_color = None
+    line_color = _Style()
+    fill_color = _Style()
+    select_line_color = _Style()
+    select_fill_color = _Style()
+    vertex_fill_color = _Style()
+    hvertex_fill_color = _Style()
     point_type = P_ROUND
     point_size = 8
-    scale = 1.0
+    scale = _Style(1.0)
+
+    _highlightSettings = {
+        NEAR_VERTEX: (4, P_ROUND),
+        MOVE_VERTEX: (1.5, P_SQUARE),
+    }
 
     def __init__(
         self,
@@ -77,7 +390,30 @@ class Shape(object):
         description=None,
         mask=None,
         parent : "Shape" = None,
+        tree : ShapeTree = None,
     ):
+        """
+            tree - дерево документа для фигуры без родителя; если не задано,
+            создаётся новое. Потомки всегда добавляются в дерево родителя.
+        """
+        self._line_color = self._fill_color = None
+        self._select_line_color = self._select_fill_color = None
+        self._vertex_fill_color = self._hvertex_fill_color = None
+        self._scale = None
+        # Кэши геометрии, сбрасываются при любом изменении вершин (_invalidate)
+        self._path = None
+        self._bounds = None
+        # (ключ, контур, вершины) в экранных координатах, ключ учитывает масштаб
+        self._paint_cache = None
+        # Кэши отрисовки маски, сбрасываются при замене маски
+        self._mask_version = 0
+        # цвет -> (массив RGBA, QImage поверх него) в координатах изображения
+        self._mask_images = None
+        # контур маски относительно points[0], в координатах изображения
+        self._mask_contour = None
+        # (ключ, изображение, контур) в экранном масштабе
+        self._mask_paint_cache = None
+
         if id is None:
             self._id: int = IdController.getId()
         else:
@@ -85,42 +421,34 @@ class Shape(object):
         self.label = label
         self.diacritical = diacritical
         self.group_id = group_id
-        self.points: List[QtCore.QPoint] = []
+        self.points = []
         self.point_labels = []
         self.shape_type = shape_type
         self._shape_raw = None
-        self._points_raw = []
-        self._shape_type_raw = None
         self.fill = False
         self.selected = False
         self.description = description
         self.other_data = {}
         self.mask = mask
 
-        # self.parent - родительский элемент по отношению к текущему.
-        # В зависимости от класса родителя автоматически подбирается класс потомка
-        # self._shape_class - класс элемента (текст, строка, буква)
+        # Родитель, потомки и класс элемента (текст, строка, буква) хранятся
+        # в дереве документа. В зависимости от класса родителя автоматически
+        # подбирается класс потомка
         if parent is None:
-            self.parent = None
-            self._shape_class = ShapeClass.TEXT
+            self._tree = ShapeTree() if tree is None else tree
+            self._node = self._tree.add(self, -1, ShapeClass.TEXT)
         else:
-            self.parent = parent
             if parent.getClass() == ShapeClass.TEXT:
-                self._shape_class = ShapeClass.ROW
+                shape_class = ShapeClass.ROW
             # elif parent.getClass() == ShapeClass.ROW:
-                # self._shape_class = ShapeClass.LETTER
+                # shape_class = ShapeClass.LETTER
             else:
                 raise Exception(f"Shape wrong parent shape_class: {parent.getClass()}")
-            parent._addChild(self)
-        # self._children - список потомков элемента
-        self._children: List[Shape] = []
+            self._tree = parent._tree
+            self._node = self._tree.add(self, parent._node, shape_class)
 
         self._highlightIndex = None
         self._highlightMode = self.NEAR_VERTEX
-        self._highlightSettings = {
-            self.NEAR_VERTEX: (4, self.P_ROUND),
-            self.MOVE_VERTEX: (1.5, self.P_SQUARE),
-        }
 
         self._closed = False
 
@@ -134,37 +462,74 @@ class Shape(object):
         """
             Удаляет элемент и также стирает его из списка потомков родителя
         """
-        if self.parent is not None:
-            self.parent._deleteChild(self)
+        self._tree.unlink(self._node)
+
+    @property
+    def parent(self) -> "Shape":
+        """
+            Родительский элемент по отношению к текущему
+        """
+        parent = self._tree.parent(self._node)
+        return None if parent < 0 else self._tree.shape(parent)
+
+    @parent.setter
+    def parent(self, parent: "Shape"):
+        # Только ссылка на родителя, в список его потомков фигуру
+        # добавляет _addChild
+        if parent is None:
+            self._tree.setParent(self._node, -1)
+            return
+        parent._tree.adopt(self)
+        self._tree.setParent(self._node, parent._node)
+
+    @property
+    def tree(self) -> ShapeTree:
+        return self._tree
 
     def _addChild(self, shape: "Shape"):
-        if self._shape_class in [ShapeClass.LETTER, ShapeClass.ROW]:
-            Exception("Letter can't be parent.")
-        self._children.append(shape)
+        self._insertChild(None, shape)
+
+    def _insertChild(self, index, shape: "Shape"):
+        """Добавляет фигуру в список потомков (в конец, если index is None)."""
+        if shape.parent is not self:
+            shape.parent = self
+        self._tree.link(shape._node, index)
 
     def _deleteChild(self, shape: "Shape"):
-        if shape in self._children:
-            self._children.remove(shape)
+        if shape.parent is self:
+            self._tree.unlink(shape._node)
 
-    def _childrenRecursive(self, list: List["Shape"]):
-        for a in self._children:
-            list.append(a)
-        for a in self._children:
-            a._childrenRecursive(list)
+    def isDescendantOf(self, shape: "Shape") -> bool:
+        """
+            Является ли элемент потомком shape (на любом уровне). Проверка
+            идёт по массиву родителей в дереве, без обхода потомков shape
+        """
+        tree = self._tree
+        if tree is not shape._tree:
+            return False
+        parents = tree._parents
+        ancestor = shape._node
+        node = parents[self._node]
+        while node >= 0:
+            if node == ancestor:
+                return True
+            node = parents[node]
+        return False
 
     def getAllChildren(self) -> List["Shape"]:
         """
             Возвращает всех потомков
         """
-        list = []
-        self._childrenRecursive(list)
-        return list
+        shapes = self._tree._shapes
+        return [shapes[node] for node in self._tree.subtree(self._node)]
 
-    def getChildren(self):
+    def getChildren(self) -> List["Shape"]:
         """
-            Возвращает прямых потомков
+            Возвращает прямых потомков. Список новый, для изменения
+            используются _insertChild и _deleteChild
         """
-        return self._children
+        shapes = self._tree._shapes
+        return [shapes[node] for node in self._tree.children(self._node)]
 
     def getId(self):
         return self._id
@@ -173,13 +538,61 @@ class Shape(object):
         """
             Возвращает класс элемента (Текст, Строка, Буква)
         """
-        return self._shape_class
+        return self._tree.shapeClass(self._node)
+
+    @property
+    def points(self) -> ShapePoints:
+        """
+            Вершины в виде списка QPointF (см. ShapePoints). Присвоить можно
+            список QPointF, пар (x, y) или массив (N, 2).
+        """
+        return ShapePoints(self)
+
+    @points.setter
+    def points(self, value):
+        self._coords = _to_coords(value)
+        self._invalidate()
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+            Вершины массивом (N, 2) float64 в координатах изображения.
+            Массив только для чтения, для изменения присваивается новый.
+        """
+        return self._coords
+
+    @coords.setter
+    def coords(self, value):
+        self.points = value
+
+    @property
+    def mask(self):
+        return self._mask
+
+    @mask.setter
+    def mask(self, value):
+        # Маску заменяют целиком, изменения на месте кэш не увидит
+        self._mask = value
+        self._mask_version += 1
+        self._mask_images = None
+        self._mask_contour = None
+        self._mask_paint_cache = None
+
+    def _invalidate(self):
+        """
+            Сбрасывает закэшированные контуры и границы. Вызывается всеми
+            методами, которые меняют вершины; массив coords нельзя менять
+            на месте.
+        """
+        self._path = None
+        self._bounds = None
+        self._paint_cache = None
 
     def _scale_point(self, point: QtCore.QPointF) -> QtCore.QPointF:
         return QtCore.QPointF(point.x() * self.scale, point.y() * self.scale)
 
     def setShapeRefined(self, shape_type, points, point_labels, mask=None):
-        self._shape_raw = (self.shape_type, self.points, self.point_labels)
+        self._shape_raw = (self.shape_type, self._coords, self.point_labels)
         self.shape_type = shape_type
         self.points = points
         self.point_labels = point_labels
@@ -197,13 +610,14 @@ class Shape(object):
             
             (xmin,ymin,xmax,ymax)
         """
-        xmin, ymin, xmax, ymax  = math.inf, math.inf, 0, 0
-        for point in self.points:
-            xmin = min(xmin, point.x())
-            xmax = max(xmax, point.x())
-            ymin = min(ymin, point.y())
-            ymax = max(ymax, point.y())
-        return (xmin, ymin, xmax, ymax)
+        if self._bounds is None:
+            if len(self._coords):
+                xmin, ymin = self._coords.min(axis=0).tolist()
+                xmax, ymax = self._coords.max(axis=0).tolist()
+                self._bounds = (xmin, ymin, xmax, ymax)
+            else:
+                self._bounds = (math.inf, math.inf, 0, 0)
+        return self._bounds
         
     def getMinimumBounds(self):
         """
@@ -213,7 +627,7 @@ class Shape(object):
         """
         
         xmin, ymin, xmax, ymax  = math.inf, math.inf, 0, 0
-        for shape in self._children:
+        for shape in self.getChildren():
             bound = shape.getBounds()
             xmin = min(xmin,bound[0])
             ymin = min(ymin,bound[1])
@@ -247,20 +661,45 @@ class Shape(object):
             "polygon",
             "rectangle",
             "mask",
+            # вершины-подсказки ai_polygon, до преобразования в многоугольник
+            "points",
         ]:
             raise ValueError("Unexpected shape_type: {}".format(value))
         self._shape_type = value
+        self._invalidate()
 
     def close(self):
         self._closed = True
+        self._paint_cache = None
 
     def addPoint(self, point, label=1):
-        if self.points and point == self.points[0]:
+        if len(self._coords) and point == self[0]:
             self.close()
         else:
             self.points.append(point)
             self.point_labels.append(label)
 
+    def addPoints(self, points, label=1):
+        """
+            Добавляет вершины одним присваиванием массива, как подряд
+            вызванный addPoint: вершина, совпадающая с первой, не
+            добавляется, а замыкает фигуру. Используется при загрузке
+            разметки, где addPoint в цикле копировал бы массив на каждой
+            вершине.
+        """
+        coords = _to_coords(points)
+        if not len(coords):
+            return
+        first = self._coords[0] if len(self._coords) else coords[0]
+        repeats = np.all(coords == first, axis=1)
+        if not len(self._coords):
+            repeats[0] = False
+        if repeats.any():
+            coords = coords[~repeats]
+            self.close()
+        self.points = np.concatenate([self._coords, coords])
+        self.point_labels.extend([label] * len(coords))
+
     def getCropBox(self) -> QtCore.QRect:
         """
             Находит обрамляющий прямоугольник для обрезки изображения
@@ -305,7 +744,7 @@ class Shape(object):
             )
             return
 
-        self.points.pop(i)
+        del self.points[i]
         self.point_labels.pop(i)
 
     def isClosed(self):
@@ -313,8 +752,13 @@ class Shape(object):
 
     def setOpen(self):
         self._closed = False
+        self._paint_cache = None
 
-    def paint(self, painter):
+    def paint(self, painter, vertices=True):
+        """
+            Рисует фигуру. При vertices=False маркеры вершин не рисуются
+            (используется холстом при сильном уменьшении).
+        """
         if self.mask is None and not self.points:
             return
 
@@ -325,68 +769,25 @@ class Shape(object):
         painter.setPen(pen)
 
         if self.mask is not None:
-            image_to_draw = np.zeros(self.mask.shape + (4,), dtype=np.uint8)
-            fill_color = (
-                self.select_fill_color.getRgb()
-                if self.selected
-                else self.fill_color.getRgb()
-            )
-            image_to_draw[self.mask] = fill_color
-            qimage = QtGui.QImage.fromData(labelme.utils.img_arr_to_data(image_to_draw))
-            qimage = qimage.scaled(
-                qimage.size() * self.scale,
-                QtCore.Qt.IgnoreAspectRatio,
-                QtCore.Qt.SmoothTransformation,
-            )
-
-            painter.drawImage(self._scale_point(point=self.points[0]), qimage)
-
-            line_path = QtGui.QPainterPath()
-            contours = skimage.measure.find_contours(np.pad(self.mask, pad_width=1))
-            for contour in contours:
-                contour += [self.points[0].y(), self.points[0].x()]
-                line_path.moveTo(
-                    self._scale_point(QtCore.QPointF(contour[0, 1], contour[0, 0]))
-                )
-                for point in contour[1:]:
-                    line_path.lineTo(
-                        self._scale_point(QtCore.QPointF(point[1], point[0]))
-                    )
+            qimage, line_path = self._maskPaintCache()
+            origin = self._scale_point(point=self[0])
+            painter.translate(origin)
+            painter.drawImage(0, 0, qimage)
             painter.drawPath(line_path)
+            painter.translate(-origin)
 
         if self.points:
-            line_path = QtGui.QPainterPath()
-            vrtx_path = QtGui.QPainterPath()
+            line_path, vrtx_path = self._paintPaths(vertices)
             negative_vrtx_path = QtGui.QPainterPath()
-
-            if self.shape_type in ["rectangle", "mask"]:
-                assert len(self.points) in [1, 2]
-                if len(self.points) == 2:
-                    rectangle = QtCore.QRectF(
-                        self._scale_point(self.points[0]),
-                        self._scale_point(self.points[1]),
-                    )
-                    line_path.addRect(rectangle)
-                if self.shape_type == "rectangle":
-                    for i in range(len(self.points)):
-                        self.drawVertex(vrtx_path, i)
+            if self._highlightIndex is not None:
+                vertex_fill_color = self.hvertex_fill_color
             else:
-                line_path.moveTo(self._scale_point(self.points[0]))
-                # Uncommenting the following line will draw 2 paths
-                # for the 1st vertex, and make it non-filled, which
-                # may be desirable.
-                # self.drawVertex(vrtx_path, 0)
-
-                for i, p in enumerate(self.points):
-                    line_path.lineTo(self._scale_point(p))
-                    self.drawVertex(vrtx_path, i)
-                if self.isClosed():
-                    line_path.lineTo(self._scale_point(self.points[0]))
+                vertex_fill_color = self.vertex_fill_color
 
             painter.drawPath(line_path)
-            if vrtx_path.length() > 0:
+            if vrtx_path is not None and vrtx_path.length() > 0:
                 painter.drawPath(vrtx_path)
-                painter.fillPath(vrtx_path, self._vertex_fill_color)
+                painter.fillPath(vrtx_path, vertex_fill_color)
             if self.fill and self.mask is None:
                 color = self.select_fill_color if self.selected else self.fill_color
                 painter.fillPath(line_path, color)
@@ -396,17 +797,149 @@ class Shape(object):
             painter.drawPath(negative_vrtx_path)
             painter.fillPath(negative_vrtx_path, QtGui.QColor(255, 0, 0, 255))
 
+    def paintBounds(self, painter):
+        """
+            Упрощённая отрисовка: обрамляющий прямоугольник без вершин.
+            Используется для фигур, которые на экране меньше нескольких
+            пикселей.
+        """
+        if not self.points:
+            return
+        color = self.select_line_color if self.selected else self.line_color
+        xmin, ymin, xmax, ymax = self.getBounds()
+        rect = QtCore.QRectF(
+            xmin * self.scale,
+            ymin * self.scale,
+            (xmax - xmin) * self.scale,
+            (ymax - ymin) * self.scale,
+        )
+        if self.fill:
+            painter.fillRect(
+                rect, self.select_fill_color if self.selected else self.fill_color
+            )
+        painter.setPen(QtGui.QPen(color, 1))
+        painter.drawRect(rect)
+
+    def _paintPaths(self, vertices=True):
+        """
+            Контур и вершины фигуры в экранных координатах.
+
+            Контур пересобирается при изменении вершин или масштаба, вершины -
+            ещё и при смене подсвеченной вершины. Если vertices=False, путь
+            вершин не строится и возвращается None.
+        """
+        cache = self._paint_cache
+        if cache is None or cache[0] != self.scale:
+            cache = (self.scale, self._makeLinePath(), None, None)
+        vrtx_path = None
+        if vertices:
+            key = (self.point_size, self._highlightIndex, self._highlightMode)
+            if cache[2] != key:
+                cache = cache[:2] + (key, self._makeVertexPath())
+            vrtx_path = cache[3]
+        self._paint_cache = cache
+        return cache[1], vrtx_path
+
+    def _makeLinePath(self):
+        line_path = QtGui.QPainterPath()
+        points = (self._coords * self.scale).tolist()
+        if self.shape_type in ["rectangle", "mask"]:
+            assert len(points) in [1, 2]
+            if len(points) == 2:
+                (x1, y1), (x2, y2) = points
+                line_path.addRect(
+                    QtCore.QRectF(QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2))
+                )
+        else:
+            line_path.moveTo(*points[0])
+            for x, y in points:
+                line_path.lineTo(x, y)
+            if self.isClosed():
+                line_path.lineTo(*points[0])
+        return line_path
+
+    def _makeVertexPath(self):
+        vrtx_path = QtGui.QPainterPath()
+        if self.shape_type == "mask":
+            return vrtx_path
+        # Uncommenting the following line will draw 2 paths
+        # for the 1st vertex, and make it non-filled, which
+        # may be desirable.
+        # self.drawVertex(vrtx_path, 0)
+        for i in range(len(self._coords)):
+            self.drawVertex(vrtx_path, i)
+        return vrtx_path
+
+    def _maskImage(self, color) -> QtGui.QImage:
+        """
+            Маска, закрашенная цветом color (r, g, b, a). QImage ссылается на
+            память массива без копирования, поэтому массив хранится рядом.
+        """
+        if self._mask_images is None:
+            self._mask_images = {}
+        if color not in self._mask_images:
+            height, width = self.mask.shape
+            array = np.zeros((height, width, 4), dtype=np.uint8)
+            array[self.mask] = color
+            self._mask_images[color] = (array, labelme.utils.img_arr_to_qt(array))
+        return self._mask_images[color][1]
+
+    def _maskContourPath(self) -> QtGui.QPainterPath:
+        if self._mask_contour is None:
+            import skimage.measure
+
+            path = QtGui.QPainterPath()
+            contours = skimage.measure.find_contours(np.pad(self.mask, pad_width=1))
+            for contour in contours:
+                path.moveTo(QtCore.QPointF(contour[0, 1], contour[0, 0]))
+                for point in contour[1:]:
+                    path.lineTo(QtCore.QPointF(point[1], point[0]))
+            self._mask_contour = path
+        return self._mask_contour
+
+    def _maskPaintCache(self):
+        """
+            Закрашенная маска и её контур в экранном масштабе относительно
+            points[0]. Пересчитываются только при смене маски, цвета
+            (выделения) или масштаба.
+        """
+        fill_color = self.select_fill_color if self.selected else self.fill_color
+        color = fill_color.getRgb()
+        key = (self._mask_version, color, self.scale)
+        cache = self._mask_paint_cache
+        if cache is None or cache[0] != key:
+            qimage = self._maskImage(color)
+            qimage = qimage.scaled(
+                qimage.size() * self.scale,
+                QtCore.Qt.IgnoreAspectRatio,
+                QtCore.Qt.SmoothTransformation,
+            )
+            line_path = QtGui.QTransform.fromScale(self.scale, self.scale).map(
+                self._maskContourPath()
+            )
+            cache = self._mask_paint_cache = (key, qimage, line_path)
+        return cache[1], cache[2]
+
+    def _nearBounds(self, point, epsilon):
+        """
+            Быстрая проверка по закэшированным границам: может ли точка
+            оказаться на расстоянии epsilon (в экранных координатах)
+            от фигуры.
+        """
+        xmin, ymin, xmax, ymax = self.getBounds()
+        margin = epsilon / self.scale
+        return (
+            xmin - margin <= point.x() <= xmax + margin
+            and ymin - margin <= point.y() <= ymax + margin
+        )
+
     def drawVertex(self, path, i):
         d = self.point_size
         shape = self.point_type
-        point = self._scale_point(self.points[i])
+        point = self._scale_point(self[i])
         if i == self._highlightIndex:
             size, shape = self._highlightSettings[self._highlightMode]
             d *= size
-        if self._highlightIndex is not None:
-            self._vertex_fill_color = self.hvertex_fill_color
-        else:
-            self._vertex_fill_color = self.vertex_fill_color
         if shape == self.P_SQUARE:
             path.addRect(point.x() - d / 2, point.y() - d / 2, d, d)
         elif shape == self.P_ROUND:
@@ -415,70 +948,89 @@ class Shape(object):
             assert False, "unsupported vertex shape"
 
     def nearestVertex(self, point, epsilon):
-        min_distance = float("inf")
-        min_i = None
-        point = QtCore.QPointF(point.x() * self.scale, point.y() * self.scale)
-        for i, p in enumerate(self.points):
-            p = QtCore.QPointF(p.x() * self.scale, p.y() * self.scale)
-            dist = labelme.utils.distance(p - point)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                min_i = i
-        return min_i
+        """
+            Номер ближайшей к point вершины, если она ближе epsilon
+            (в экранных координатах), иначе None.
+        """
+        if not len(self._coords) or not self._nearBounds(point, epsilon):
+            return None
+        delta = (self._coords - (point.x(), point.y())) * self.scale
+        distances = np.hypot(delta[:, 0], delta[:, 1])
+        i = int(np.argmin(distances))
+        return i if distances[i] <= epsilon else None
 
     def nearestEdge(self, point, epsilon):
-        min_distance = float("inf")
-        post_i = None
-        point = QtCore.QPointF(point.x() * self.scale, point.y() * self.scale)
-        for i in range(len(self.points)):
-            start = self.points[i - 1]
-            end = self.points[i]
-            start = QtCore.QPointF(start.x() * self.scale, start.y() * self.scale)
-            end = QtCore.QPointF(end.x() * self.scale, end.y() * self.scale)
-            line = [start, end]
-            dist = labelme.utils.distancetoline(point, line)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                post_i = i
-        return post_i
+        """
+            Номер i ближайшего к point ребра (points[i - 1], points[i]), если
+            оно ближе epsilon (в экранных координатах), иначе None.
+        """
+        if not len(self._coords) or not self._nearBounds(point, epsilon):
+            return None
+        end = self._coords * self.scale
+        start = np.roll(end, 1, axis=0)
+        edge = end - start
+        to_point = np.array((point.x(), point.y())) * self.scale - start
+        # проекция точки на отрезок, для вырожденных рёбер - на начало
+        length2 = np.einsum("ij,ij->i", edge, edge)
+        t = np.einsum("ij,ij->i", to_point, edge)
+        t = np.divide(t, length2, out=np.zeros_like(t), where=length2 > 0)
+        t = np.clip(t, 0, 1)
+        delta = to_point - edge * t[:, None]
+        distances = np.hypot(delta[:, 0], delta[:, 1])
+        i = int(np.argmin(distances))
+        return i if distances[i] <= epsilon else None
 
     def containsPoint(self, point):
         if self.mask is not None:
             y = np.clip(
-                int(round(point.y() - self.points[0].y())),
+                int(round(point.y() - self._coords[0, 1])),
                 0,
                 self.mask.shape[0] - 1,
             )
             x = np.clip(
-                int(round(point.x() - self.points[0].x())),
+                int(round(point.x() - self._coords[0, 0])),
                 0,
                 self.mask.shape[1] - 1,
             )
             return self.mask[y, x]
-        return self.makePath().contains(point)
+        return self._scenePath().contains(point)
+
+    def _scenePath(self):
+        if self._path is None:
+            points = self._coords.tolist()
+            if self.shape_type in ["rectangle", "mask"]:
+                path = QtGui.QPainterPath()
+                if len(points) == 2:
+                    (x1, y1), (x2, y2) = points
+                    path.addRect(
+                        QtCore.QRectF(QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2))
+                    )
+            else:
+                path = QtGui.QPainterPath(QtCore.QPointF(*points[0]))
+                for x, y in points[1:]:
+                    path.lineTo(x, y)
+                path.lineTo(*points[0])
+            self._path = path
+        return self._path
 
     def makePath(self):
-        if self.shape_type in ["rectangle", "mask"]:
-            path = QtGui.QPainterPath()
-            if len(self.points) == 2:
-                path.addRect(QtCore.QRectF(self.points[0], self.points[1]))
-        else:
-            path = QtGui.QPainterPath(self.points[0])
-            for p in self.points[1:]:
-                path.lineTo(p)
-            path.lineTo(self.points[0])
-        return path
+        # Копия, чтобы вызывающий код не испортил кэш
+        return QtGui.QPainterPath(self._scenePath())
 
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        return self._scenePath().boundingRect()
 
     def moveBy(self, offset):
-        self.points = [p + offset for p in self.points]
-        for child in self._children:
-            child.moveBy(offset)
+        """Сдвигает фигуру и всех потомков, по одному сложению массивов на фигуру."""
+        offset = (offset.x(), offset.y())
+        self.coords = self._coords + offset
+        for child in self.getAllChildren():
+            child.coords = child._coords + offset
 
     def moveVertexBy(self, i, offset):
-        self.points[i] = self.points[i] + offset
+        coords = self._coords.copy()
+        coords[i] += (offset.x(), offset.y())
+        self.coords = coords
 
     def highlightVertex(self, i, action):
         """Highlight a vertex appropriately based on the current action
@@ -499,25 +1051,9 @@ class Shape(object):
         shape = Shape(parent=self.parent, id=self._id)
         shape.label = self.label
         shape.diacritical = self.diacritical
-        shape.points = copy.deepcopy(self.points)
-        shape.shape_type = self.shape_type
-        shape.description = self.description
-
-    def _copyWithChildren(self, list: List["Shape"], parent: "Shape" = None):
-        shape = Shape(parent=parent, id=self._id)
-        shape.label = self.label
-        shape.diacritical = self.diacritical
-        shape.points = copy.deepcopy(self.points)
+        shape.points = self._coords
         shape.shape_type = self.shape_type
         shape.description = self.description
-        list.append(shape)
-        for child in self._children:
-            child._copyWithChildren(list, shape)
-
-    def copyWithChildren(self):
-        allShapes: List[Shape] = []
-        self._copyWithChildren(allShapes, None)
-        return allShapes
 
     def __len__(self):
         return len(self.points)
@@ -0,0 +1,158 @@
+import collections
+import math
+from typing import Dict
+from typing import List
+
+from labelme.shape import Shape
+
+
+def shape_bounds(shape: Shape):
+    """
+        Обрамляющий прямоугольник фигуры (xmin, ymin, xmax, ymax)
+        или None, если у фигуры нет вершин.
+    """
+    if not len(shape):
+        return None
+    xmin, ymin, xmax, ymax = shape.getBounds()
+    if shape.mask is not None:
+        xmax = max(xmax, xmin + shape.mask.shape[1])
+        ymax = max(ymax, ymin + shape.mask.shape[0])
+    return xmin, ymin, xmax, ymax
+
+
+class ShapeGridIndex(object):
+    """
+        Равномерная сетка над обрамляющими прямоугольниками фигур.
+
+        Нужна, чтобы при наведении и выборе мышью проверять только фигуры
+        рядом с курсором, а не все фигуры страницы. Крупные фигуры (блоки
+        текста), которые покрывают больше max_cells ячеек, хранятся отдельным
+        списком и проверяются всегда: их немного, а раскладывать их по сотням
+        ячеек при каждом перетаскивании дорого.
+
+        Индекс не отслеживает изменения фигур сам: холст вызывает update для
+        сдвинутых фигур (вместе с потомками, т.к. Shape.moveBy двигает всё
+        поддерево), insert/remove при создании и удалении и rebuild при
+        замене списка фигур.
+    """
+
+    def __init__(self, cell_size=256, max_cells=64):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self._cells: Dict[tuple, set] = collections.defaultdict(set)
+        self._bounds: Dict[Shape, tuple] = {}
+        self._shape_cells: Dict[Shape, list] = {}
+        self._large = set()
+        self._shapes: List[Shape] = []
+        # Порядок фигур на холсте (z-order), пересчитывается лениво
+        self._order = None
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def __contains__(self, shape):
+        return shape in self._bounds
+
+    def rebuild(self, shapes: List[Shape]):
+        self._cells.clear()
+        self._bounds.clear()
+        self._shape_cells.clear()
+        self._large.clear()
+        self._shapes = shapes
+        self._order = None
+        for shape in shapes:
+            self._add(shape)
+
+    def insert(self, shape: Shape):
+        self._discard(shape)
+        self._add(shape)
+        self._order = None
+
+    def remove(self, shape: Shape):
+        self._discard(shape)
+        self._order = None
+
+    def update(self, shapes):
+        """Пересчитывает положение фигур, у которых изменились вершины."""
+        for shape in shapes:
+            if shape in self._bounds:
+                self._discard(shape)
+                self._add(shape)
+
+    def _cellRange(self, xmin, ymin, xmax, ymax):
+        size = self.cell_size
+        return (
+            int(math.floor(xmin / size)),
+            int(math.floor(ymin / size)),
+            int(math.floor(xmax / size)),
+            int(math.floor(ymax / size)),
+        )
+
+    def _add(self, shape):
+        bounds = shape_bounds(shape)
+        if bounds is None:
+            return
+        self._bounds[shape] = bounds
+        cx1, cy1, cx2, cy2 = self._cellRange(*bounds)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.max_cells:
+            self._large.add(shape)
+            self._shape_cells[shape] = []
+            return
+        keys = [
+            (cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)
+        ]
+        for key in keys:
+            self._cells[key].add(shape)
+        self._shape_cells[shape] = keys
+
+    def _discard(self, shape):
+        if shape not in self._bounds:
+            return
+        del self._bounds[shape]
+        self._large.discard(shape)
+        for key in self._shape_cells.pop(shape):
+            cell = self._cells[key]
+            cell.discard(shape)
+            if not cell:
+                del self._cells[key]
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        cx1, cy1, cx2, cy2 = self._cellRange(xmin, ymin, xmax, ymax)
+        candidates = set(self._large)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell:
+                    candidates.update(cell)
+
+        found = []
+        for shape in candidates:
+            sxmin, symin, sxmax, symax = self._bounds[shape]
+            if sxmin <= xmax and xmin <= sxmax and symin <= ymax and ymin <= symax:
+                found.append(shape)
+        return found
+
+    def _sorted(self, shapes, reverse):
+        if self._order is None:
+            self._order = {shape: i for i, shape in enumerate(self._shapes)}
+        order = self._order
+        shapes = [shape for shape in shapes if shape in order]
+        shapes.sort(key=order.__getitem__, reverse=reverse)
+        return shapes
+
+    def query(self, point, margin=0.0) -> List[Shape]:
+        """
+            Фигуры, чей обрамляющий прямоугольник, расширенный на margin,
+            содержит точку. Отсортированы так же, как их проверяет холст:
+            сначала верхние (добавленные позже).
+        """
+        x, y = point.x(), point.y()
+        found = self._candidates(x - margin, y - margin, x + margin, y + margin)
+        return self._sorted(found, reverse=True)
+
+    def intersecting(self, xmin, ymin, xmax, ymax) -> List[Shape]:
+        """
+            Фигуры, пересекающие прямоугольник, в порядке отрисовки
+            (сначала нижние).
+        """
+        return self._sorted(self._candidates(xmin, ymin, xmax, ymax), reverse=False)
@@ -1,12 +1,12 @@
 import json
 import os.path as osp
 
-import imgviz
-
 import labelme.utils
 
 
 def assert_labelfile_sanity(filename):
+    import imgviz
+
     assert osp.exists(filename)
 
     data = json.load(open(filename))
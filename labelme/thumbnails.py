@@ -0,0 +1,343 @@
+import collections
+import json
+import os
+import os.path as osp
+import sqlite3
+import threading
+import time
+
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme import utils
+from labelme.logger import logger
+
+
+def _overlay_boxes(label_file):
+    """
+        Прямоугольники текстов и строк из файла разметки: список пар
+        (ShapeClass.value, (x1, y1, x2, y2)). Буквы не возвращаются.
+    """
+    with open(label_file, "r") as f:
+        data = json.load(f)
+    boxes = []
+
+    def walk(shapes, depth):
+        for s in shapes:
+            if "diacritical" in s or depth > 1:
+                continue
+            xs = [point[0] for point in s["points"]]
+            ys = [point[1] for point in s["points"]]
+            if xs:
+                boxes.append((depth, (min(xs), min(ys), max(xs), max(ys))))
+            walk(s.get("shapes", []), depth + 1)
+
+    walk(data.get("shapes", []), 0)
+    return boxes
+
+
+# Цвета рамок текста и строки на миниатюре
+_OVERLAY_COLORS = {
+    0: QtGui.QColor(255, 0, 0, 200),
+    1: QtGui.QColor(0, 160, 255, 200),
+}
+
+
+def make_thumbnail(filename, size, label_file=None) -> QtGui.QImage:
+    """
+        Миниатюра изображения, вписанная в квадрат size x size.
+        QImageReader для JPEG декодирует сразу уменьшенное изображение.
+
+        Если задан label_file, поверх рисуются рамки текстов и строк
+        из разметки.
+    """
+    reader = QtGui.QImageReader(filename)
+    full_size = reader.size()
+    if full_size.isValid():
+        scaled = full_size.scaled(size, size, QtCore.Qt.KeepAspectRatio)
+        reader.setScaledSize(scaled.expandedTo(QtCore.QSize(1, 1)))
+    image = reader.read()
+    if image.isNull():
+        return image
+    if image.width() > size or image.height() > size:
+        image = image.scaled(
+            size, size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation
+        )
+    if label_file is None or not full_size.isValid():
+        return image
+
+    try:
+        boxes = _overlay_boxes(label_file)
+    except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+        logger.warning("Failed to read {} for thumbnail: {}".format(label_file, e))
+        return image
+    image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+    painter = QtGui.QPainter(image)
+    painter.scale(
+        image.width() / full_size.width(), image.height() / full_size.height()
+    )
+    for shape_class, (x1, y1, x2, y2) in boxes:
+        pen = QtGui.QPen(_OVERLAY_COLORS[shape_class])
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        painter.drawRect(QtCore.QRectF(x1, y1, x2 - x1, y2 - y1))
+    painter.end()
+    return image
+
+
+class ThumbnailCache(object):
+    """
+        Миниатюры на диске в одном файле SQLite.
+
+        Запись хранится по пути к изображению вместе с его временем
+        изменения и размером, а также variant - параметрами миниатюры
+        (размер, время изменения разметки для рамок). Запись с другими
+        значениями считается устаревшей и перезаписывается. При превышении
+        disk_budget байт удаляются записи, созданные раньше других.
+
+        Ошибки SQLite не прерывают работу: кэш ведёт себя как пустой.
+    """
+
+    def __init__(self, path, disk_budget=1024 * 1024 * 1024):
+        self.path = path
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+
+    def _connection(self):
+        if self._db is None:
+            os.makedirs(osp.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, "
+                "variant TEXT, data BLOB, created REAL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def get(self, filename, stamp, variant):
+        """Байты миниатюры или None, если её нет или она устарела."""
+        if stamp is None:
+            return None
+        with self._lock:
+            try:
+                row = (
+                    self._connection()
+                    .execute(
+                        "SELECT mtime, size, variant, data FROM thumbnails "
+                        "WHERE path = ?",
+                        (filename,),
+                    )
+                    .fetchone()
+                )
+            except sqlite3.Error as e:
+                logger.warning("Failed to read thumbnail cache: {}".format(e))
+                return None
+        if row is None or tuple(row[:3]) != (stamp[0], stamp[1], variant):
+            return None
+        return bytes(row[3])
+
+    def put(self, filename, stamp, variant, data):
+        if stamp is None:
+            return
+        with self._lock:
+            try:
+                db = self._connection()
+                db.execute(
+                    "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?)",
+                    (filename, stamp[0], stamp[1], variant, data, time.time()),
+                )
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._prune(db)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Failed to write thumbnail cache: {}".format(e))
+
+    def _prune(self, db):
+        (total,) = db.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbnails"
+        ).fetchone()
+        while total > self.disk_budget:
+            rows = db.execute(
+                "SELECT path, LENGTH(data) FROM thumbnails ORDER BY created LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            db.executemany(
+                "DELETE FROM thumbnails WHERE path = ?", [(row[0],) for row in rows]
+            )
+            total -= sum(row[1] for row in rows)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class ThumbnailLoader(QtCore.QObject):
+    """
+        Миниатюры страниц для списка файлов и диалога открытия.
+
+        icon() сразу возвращает готовую миниатюру или None и ставит файл
+        в очередь. Несколько потоков берут из очереди сначала последние
+        запрошенные файлы (видимые сейчас строки), читают миниатюру из
+        ThumbnailCache или делают её (make_thumbnail) и сохраняют в кэш.
+        Готовность сообщается сигналом ready(путь к изображению).
+
+        Последние max_icons миниатюр держатся в памяти. Если overlay,
+        на миниатюрах размеченных страниц рисуются рамки текстов и строк.
+        Файлы, которые не удалось прочитать, повторно не запрашиваются,
+        пока не изменятся.
+    """
+
+    ready = QtCore.Signal(str)
+    # (путь, QImage, utils.file_stamp файла) из рабочего потока в UI-поток
+    _loaded = QtCore.Signal(str, object, object)
+
+    def __init__(
+        self,
+        cache: ThumbnailCache = None,
+        size=256,
+        overlay=False,
+        workers=2,
+        max_icons=2000,
+        max_pending=256,
+        parent=None,
+    ):
+        super(ThumbnailLoader, self).__init__(parent)
+        self.cache = cache
+        self.size = size
+        self.overlay = overlay
+        self.max_icons = max_icons
+        self.max_pending = max_pending
+        # Путь к файлу разметки изображения
+        self.label_file_for = lambda filename: osp.splitext(filename)[0] + ".json"
+        self._icons = collections.OrderedDict()
+        self._stale = set()
+        # путь -> отметка файла, который не удалось прочитать
+        self._failed = {}
+        self._condition = threading.Condition()
+        self._pending = collections.OrderedDict()
+        self._loading = set()
+        # Файлы, изменившиеся во время построения миниатюры: их результат
+        # устарел, и после построения они снова ставятся в очередь
+        self._requeue = set()
+        self._loaded.connect(self._store)
+
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def icon(self, filename):
+        """Миниатюра (QIcon) или None, если она ещё не готова."""
+        icon = self._icons.get(filename)
+        if icon is not None:
+            self._icons.move_to_end(filename)
+            if filename not in self._stale:
+                return icon
+        elif filename in self._failed:
+            if self._failed[filename] == utils.file_stamp(filename):
+                return None
+            del self._failed[filename]
+        self.request(filename)
+        return icon
+
+    def request(self, filename):
+        with self._condition:
+            if filename in self._loading:
+                return
+            self._pending.pop(filename, None)
+            self._pending[filename] = None
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+            self._condition.notify()
+
+    def invalidate(self, filename):
+        """Миниатюра изменилась (например, разметка): старая показывается до новой."""
+        self._failed.pop(filename, None)
+        if filename in self._icons:
+            self._stale.add(filename)
+            with self._condition:
+                if filename in self._loading:
+                    self._requeue.add(filename)
+            self.ready.emit(filename)
+
+    def cancel(self):
+        with self._condition:
+            self._pending.clear()
+            self._requeue.clear()
+
+    def clear(self):
+        self.cancel()
+        self._icons.clear()
+        self._stale.clear()
+        self._failed.clear()
+
+    def _store(self, filename, image, stamp):
+        self._stale.discard(filename)
+        if image.isNull():
+            self._failed[filename] = stamp
+            return
+        self._icons[filename] = QtGui.QIcon(QtGui.QPixmap.fromImage(image))
+        self._icons.move_to_end(filename)
+        while len(self._icons) > self.max_icons:
+            self._icons.popitem(last=False)
+        self.ready.emit(filename)
+
+    def load(self, filename) -> QtGui.QImage:
+        """Миниатюра из кэша или сделанная заново. Можно вызывать из любого потока."""
+        stamp = utils.file_stamp(filename)
+        label_file = None
+        variant = str(self.size)
+        if self.overlay:
+            label_file = self.label_file_for(filename)
+            label_stamp = utils.file_stamp(label_file)
+            if label_stamp is None:
+                label_file = None
+            else:
+                variant = "{}|{}|{}".format(self.size, *label_stamp)
+        if self.cache is not None:
+            data = self.cache.get(filename, stamp, variant)
+            if data is not None:
+                image = QtGui.QImage.fromData(data)
+                if not image.isNull():
+                    return image
+        image = make_thumbnail(filename, self.size, label_file)
+        if self.cache is not None and not image.isNull():
+            buffer = QtCore.QBuffer()
+            buffer.open(QtCore.QIODevice.WriteOnly)
+            image.save(buffer, "JPEG", 90)
+            self.cache.put(filename, stamp, variant, bytes(buffer.data()))
+        return image
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: bool(self._pending))
+                filename, _ = self._pending.popitem(last=True)
+                self._loading.add(filename)
+            stamp = utils.file_stamp(filename)
+            try:
+                image = self.load(filename)
+            except Exception:
+                logger.exception("Failed to make thumbnail {}".format(filename))
+                image = QtGui.QImage()
+            with self._condition:
+                self._loading.discard(filename)
+                requeue = filename in self._requeue
+                if requeue:
+                    self._requeue.discard(filename)
+                    self._pending.pop(filename, None)
+                    self._pending[filename] = None
+                    self._condition.notify()
+            if not requeue:
+                self._loaded.emit(filename, image, stamp)
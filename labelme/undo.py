@@ -0,0 +1,315 @@
+import collections
+import itertools
+from typing import List
+
+from qtpy import QtCore
+
+from labelme.shape import Shape
+
+# Грубые оценки занимаемой памяти, по которым ограничивается история правок
+_COMMAND_SIZE = 64
+_POINT_SIZE = 48
+_SHAPE_SIZE = 512
+
+
+def _shape_size(shape: Shape) -> int:
+    return _SHAPE_SIZE + _POINT_SIZE * len(shape.points)
+
+
+class UndoCommand(object):
+    """
+        Обратимая правка разметки.
+
+        Команда хранит только то, что изменилось, поэтому её размер зависит от
+        правки, а не от количества фигур на странице. Команды записываются в
+        UndoStack уже после того, как правка применена на холсте.
+    """
+
+    def undo(self):
+        raise NotImplementedError
+
+    def redo(self):
+        raise NotImplementedError
+
+    def size(self) -> int:
+        """Оценка занимаемой командой памяти в байтах."""
+        return _COMMAND_SIZE
+
+
+class MacroCommand(UndoCommand):
+    """Несколько команд, которые отменяются и повторяются как одна."""
+
+    def __init__(self, commands: List[UndoCommand]):
+        self.commands = list(commands)
+
+    def undo(self):
+        for command in reversed(self.commands):
+            command.undo()
+
+    def redo(self):
+        for command in self.commands:
+            command.redo()
+
+    def size(self):
+        return _COMMAND_SIZE + sum(command.size() for command in self.commands)
+
+
+class MoveShapesCommand(UndoCommand):
+    """Сдвиг фигур (вместе с потомками) на offset."""
+
+    def __init__(self, shapes: List[Shape], offset: QtCore.QPointF):
+        self.shapes = list(shapes)
+        self.offset = QtCore.QPointF(offset)
+
+    def undo(self):
+        for shape in self.shapes:
+            shape.moveBy(-self.offset)
+
+    def redo(self):
+        for shape in self.shapes:
+            shape.moveBy(self.offset)
+
+    def size(self):
+        return _COMMAND_SIZE + 8 * len(self.shapes)
+
+
+class MoveVertexCommand(UndoCommand):
+    """Перемещение одной вершины фигуры."""
+
+    def __init__(self, shape: Shape, index: int, old_point, new_point):
+        self.shape = shape
+        self.index = index
+        self.old_point = QtCore.QPointF(old_point)
+        self.new_point = QtCore.QPointF(new_point)
+
+    def undo(self):
+        self.shape[self.index] = QtCore.QPointF(self.old_point)
+
+    def redo(self):
+        self.shape[self.index] = QtCore.QPointF(self.new_point)
+
+    def size(self):
+        return _COMMAND_SIZE + 2 * _POINT_SIZE
+
+
+class InsertPointCommand(UndoCommand):
+    """Добавление вершины в фигуру."""
+
+    def __init__(self, shape: Shape, index: int, point, label=1):
+        self.shape = shape
+        self.index = index
+        self.point = QtCore.QPointF(point)
+        self.label = label
+
+    def undo(self):
+        # Не через removePoint: он не даёт удалять вершины прямоугольника
+        points = list(self.shape.points)
+        points.pop(self.index)
+        self.shape.points = points
+        self.shape.point_labels.pop(self.index)
+
+    def redo(self):
+        self.shape.insertPoint(self.index, QtCore.QPointF(self.point), self.label)
+
+    def size(self):
+        return _COMMAND_SIZE + _POINT_SIZE
+
+
+class RemovePointCommand(InsertPointCommand):
+    """Удаление вершины из фигуры."""
+
+    def undo(self):
+        super(RemovePointCommand, self).redo()
+
+    def redo(self):
+        super(RemovePointCommand, self).undo()
+
+
+class SetPointsCommand(UndoCommand):
+    """Замена всех вершин фигуры."""
+
+    def __init__(self, shape: Shape, old_points, new_points):
+        self.shape = shape
+        self.old_points = [QtCore.QPointF(p) for p in old_points]
+        self.new_points = [QtCore.QPointF(p) for p in new_points]
+
+    def undo(self):
+        self.shape.points = [QtCore.QPointF(p) for p in self.old_points]
+
+    def redo(self):
+        self.shape.points = [QtCore.QPointF(p) for p in self.new_points]
+
+    def size(self):
+        return _COMMAND_SIZE + _POINT_SIZE * (
+            len(self.old_points) + len(self.new_points)
+        )
+
+
+class RelabelCommand(UndoCommand):
+    """Изменение метки (и диакритики) фигур."""
+
+    def __init__(self, shapes: List[Shape], old_labels, new_labels):
+        """
+            old_labels, new_labels - списки пар (label, diacritical)
+        """
+        self.shapes = list(shapes)
+        self.old_labels = list(old_labels)
+        self.new_labels = list(new_labels)
+
+    def _apply(self, labels):
+        for shape, (label, diacritical) in zip(self.shapes, labels):
+            shape.label = label
+            shape.diacritical = diacritical
+
+    def undo(self):
+        self._apply(self.old_labels)
+
+    def redo(self):
+        self._apply(self.new_labels)
+
+    def size(self):
+        return _COMMAND_SIZE + sum(
+            len(label or "") + len(diacritical or "")
+            for label, diacritical in self.old_labels + self.new_labels
+        )
+
+
+class DeleteShapesCommand(UndoCommand):
+    """
+        Удаление фигур вместе со всеми потомками.
+
+        Запоминает позиции фигур в списке холста и у родителей, чтобы отмена
+        вернула их на прежние места.
+    """
+
+    def __init__(self, shapes: List[Shape], all_shapes: List[Shape]):
+        """
+            shapes - удаляемые фигуры
+            all_shapes - список фигур холста, из которого они удаляются
+        """
+        self.all_shapes = all_shapes
+        # dict вместо set, чтобы сохранить порядок фигур
+        removed = {}
+        for shape in shapes:
+            for s in [shape] + shape.getAllChildren():
+                removed[s] = None
+        # Индексы считаются один раз, а не поиском по списку для каждой фигуры
+        indices = {s: i for i, s in enumerate(all_shapes) if s in removed}
+        child_indices = {}
+        # (фигура, индекс в all_shapes, индекс среди потомков родителя)
+        self.entries = []
+        for shape in removed:
+            child_index = None
+            if shape.parent is not None:
+                if shape.parent not in child_indices:
+                    child_indices[shape.parent] = {
+                        child: i for i, child in enumerate(shape.parent.getChildren())
+                    }
+                child_index = child_indices[shape.parent].get(shape)
+            self.entries.append((shape, indices.get(shape), child_index))
+
+    @property
+    def shapes(self) -> List[Shape]:
+        return [shape for shape, index, _ in self.entries if index is not None]
+
+    def redo(self):
+        removed = {shape for shape, _, _ in self.entries}
+        # Список холста меняется на месте: на него ссылаются другие объекты
+        self.all_shapes[:] = [s for s in self.all_shapes if s not in removed]
+        for shape, index, child_index in self.entries:
+            shape.delete()
+
+    def undo(self):
+        restored = sorted(
+            ((index, shape) for shape, index, _ in self.entries if index is not None),
+            key=lambda entry: entry[0],
+        )
+        # Слияние за один проход вместо insert для каждой фигуры
+        shapes = iter(self.all_shapes)
+        result = []
+        for index, shape in restored:
+            result.extend(itertools.islice(shapes, index - len(result)))
+            result.append(shape)
+        result.extend(shapes)
+        self.all_shapes[:] = result
+        for shape, index, child_index in sorted(
+            self.entries, key=lambda e: -1 if e[2] is None else e[2]
+        ):
+            if child_index is not None:
+                shape.parent._insertChild(child_index, shape)
+
+    def size(self):
+        return _COMMAND_SIZE + sum(_shape_size(e[0]) for e in self.entries)
+
+
+class CreateShapesCommand(DeleteShapesCommand):
+    """Добавление фигур: обратная операция к удалению."""
+
+    def undo(self):
+        super(CreateShapesCommand, self).redo()
+
+    def redo(self):
+        super(CreateShapesCommand, self).undo()
+
+
+class UndoStack(object):
+    """
+        История правок с возможностью отмены и повтора.
+
+        Количество шагов не ограничено, ограничен суммарный объём команд:
+        при превышении budget самые старые команды отбрасываются.
+    """
+
+    def __init__(self, budget=16 * 1024 * 1024):
+        self.budget = budget
+        self._undo = collections.deque()
+        self._redo: List[UndoCommand] = []
+        self._size = 0
+
+    def __len__(self):
+        return len(self._undo)
+
+    def canUndo(self):
+        return bool(self._undo)
+
+    def canRedo(self):
+        return bool(self._redo)
+
+    def byteSize(self):
+        return self._size
+
+    def clear(self):
+        self._undo = collections.deque()
+        self._redo = []
+        self._size = 0
+
+    def push(self, command: UndoCommand):
+        """Записывает уже применённую правку. Сбрасывает историю повтора."""
+        self._redo = []
+        self._undo.append(command)
+        self._size += command.size()
+        while self._size > self.budget and len(self._undo) > 1:
+            self._size -= self._undo.popleft().size()
+
+    def pop(self):
+        """Удаляет последнюю команду из истории, не отменяя её."""
+        command = self._undo.pop()
+        self._size -= command.size()
+        return command
+
+    def undo(self):
+        if not self._undo:
+            return None
+        command = self.pop()
+        command.undo()
+        self._redo.append(command)
+        return command
+
+    def redo(self):
+        if not self._redo:
+            return None
+        command = self._redo.pop()
+        command.redo()
+        self._undo.append(command)
+        self._size += command.size()
+        return command
@@ -1,5 +1,6 @@
 # flake8: noqa
 
+from ._io import file_stamp
 from ._io import lblsave
 
 from .image import apply_exif_orientation
@@ -9,8 +10,13 @@ from .image import img_b64_to_arr
 from .image import img_data_to_arr
 from .image import img_data_to_pil
 from .image import img_data_to_png_data
+from .image import img_data_to_size
 from .image import img_pil_to_data
-from .image import img_qt_to_arr
+
+from .qimage import img_arr_to_qt
+from .qimage import img_data_to_qt_draft
+from .qimage import img_qt_to_arr
+from .qimage import img_qt_to_rgb
 
 from .shape import labelme_shapes_to_label
 from .shape import masks_to_bboxes
@@ -1,12 +1,25 @@
 # MIT License
 # Copyright (c) Kentaro Wada
 
+import os
 import os.path as osp
 
 import numpy as np
 import PIL.Image
 
 
+def file_stamp(path):
+    """
+        (время изменения в нс, размер) файла или None, если его нет. По нему
+        кэши проверяют, не изменился ли файл.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
 def lblsave(filename, lbl):
     import imgviz
 
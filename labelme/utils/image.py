@@ -23,6 +23,14 @@ def img_data_to_arr(img_data):
     return img_arr
 
 
+def img_data_to_size(img_data):
+    """Return (height, width) of encoded image data reading only its header."""
+    with io.BytesIO(img_data) as f:
+        with PIL.Image.open(f) as img_pil:
+            width, height = img_pil.size
+    return height, width
+
+
 def img_b64_to_arr(img_b64):
     img_data = base64.b64decode(img_b64)
     img_arr = img_data_to_arr(img_data)
@@ -59,13 +67,6 @@ def img_data_to_png_data(img_data):
             return f.read()
 
 
-def img_qt_to_arr(img_qt):
-    w, h, d = img_qt.size().width(), img_qt.size().height(), img_qt.depth()
-    bytes_ = img_qt.bits().asstring(w * h * d // 8)
-    img_arr = np.frombuffer(bytes_, dtype=np.uint8).reshape((h, w, d // 8))
-    return img_arr
-
-
 def apply_exif_orientation(image):
     try:
         exif = image._getexif()
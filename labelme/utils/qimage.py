@@ -0,0 +1,173 @@
+import io
+import sys
+
+import numpy as np
+import PIL.Image
+from qtpy import QtGui
+
+# Форматы с 32-битными пикселями 0xAARRGGBB: порядок байт в памяти
+# зависит от порядка байт платформы
+_ARGB32_FORMATS = (
+    QtGui.QImage.Format_RGB32,
+    QtGui.QImage.Format_ARGB32,
+    QtGui.QImage.Format_ARGB32_Premultiplied,
+)
+_RGBA8888_FORMATS = (
+    QtGui.QImage.Format_RGBA8888,
+    QtGui.QImage.Format_RGBX8888,
+    QtGui.QImage.Format_RGBA8888_Premultiplied,
+)
+# Формат QImage по числу каналов массива
+_ARR_FORMATS = {
+    1: QtGui.QImage.Format_Grayscale8,
+    3: QtGui.QImage.Format_RGB888,
+    4: QtGui.QImage.Format_RGBA8888,
+}
+
+
+class _QImageBuffer(object):
+    """
+        Описание памяти QImage для numpy. Массив, созданный через
+        np.asarray, хранит ссылку на этот объект, а он - на изображение,
+        поэтому память не освободится, пока жив массив.
+    """
+
+    def __init__(self, img_qt, shape, strides, offset, writable):
+        self.img_qt = img_qt
+        bits = img_qt.bits() if writable else img_qt.constBits()
+        if isinstance(bits, memoryview):  # PySide
+            address = np.frombuffer(bits, dtype=np.uint8).ctypes.data
+        else:
+            address = int(bits)
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": shape,
+            "strides": strides,
+            "typestr": "|u1",
+            "data": (address + offset, not writable),
+        }
+
+
+def _to_qimage(img_qt):
+    if isinstance(img_qt, QtGui.QPixmap):
+        return img_qt.toImage()
+    return img_qt
+
+
+def img_qt_to_arr(img_qt, writable=False):
+    """
+        Массив (высота, ширина, байт на пиксель) поверх памяти QImage, без
+        копирования. Учитывает выравнивание строк (bytesPerLine), поэтому
+        массив может быть не непрерывным. Порядок байт в пикселе - как
+        в памяти изображения (для Format_RGB32 - BGRA).
+
+        По умолчанию массив только для чтения и не вызывает копирования
+        разделяемых данных QImage; writable=True даёт доступ на запись
+        (QImage при этом отделяется от своих копий).
+    """
+    img_qt = _to_qimage(img_qt)
+    if img_qt.depth() < 8:
+        img_qt = img_qt.convertToFormat(QtGui.QImage.Format_Grayscale8)
+    channels = img_qt.depth() // 8
+    return np.asarray(
+        _QImageBuffer(
+            img_qt,
+            shape=(img_qt.height(), img_qt.width(), channels),
+            strides=(img_qt.bytesPerLine(), channels, 1),
+            offset=0,
+            writable=writable,
+        )
+    )
+
+
+def img_qt_to_rgb(img_qt):
+    """
+        Массив RGB (высота, ширина, 3) только для чтения поверх памяти
+        QImage. Для 32-битных форматов и RGB888 копирования нет: порядок
+        каналов BGRA переставляется шагами массива. Остальные форматы
+        сначала преобразуются в RGB888.
+    """
+    img_qt = _to_qimage(img_qt)
+    fmt = img_qt.format()
+    shape = (img_qt.height(), img_qt.width(), 3)
+    if fmt in _ARGB32_FORMATS:
+        if sys.byteorder == "little":  # B, G, R, A
+            offset, step = 2, -1
+        else:  # A, R, G, B
+            offset, step = 1, 1
+        strides = (img_qt.bytesPerLine(), 4, step)
+    elif fmt in _RGBA8888_FORMATS:
+        offset = 0
+        strides = (img_qt.bytesPerLine(), 4, 1)
+    else:
+        if fmt != QtGui.QImage.Format_RGB888:
+            img_qt = img_qt.convertToFormat(QtGui.QImage.Format_RGB888)
+        offset = 0
+        strides = (img_qt.bytesPerLine(), 3, 1)
+    return np.asarray(
+        _QImageBuffer(img_qt, shape, strides, offset=offset, writable=False)
+    )
+
+
+def img_arr_to_qt(img_arr):
+    """
+        QImage поверх памяти массива uint8 (высота, ширина[, каналы]) без
+        копирования: 1 канал - Grayscale8, 3 - RGB888, 4 - RGBA8888.
+        Пиксели в строке должны идти подряд, строки - с любым шагом.
+
+        QImage не владеет памятью: массив сохраняется в атрибуте обёртки
+        и живёт, пока жива она. Изображение, которое должно пережить
+        обёртку, нужно скопировать (QImage.copy).
+    """
+    if img_arr.ndim == 2:
+        img_arr = img_arr[:, :, None]
+    height, width, channels = img_arr.shape
+    if channels not in _ARR_FORMATS:
+        raise ValueError("Unsupported number of channels: {}".format(channels))
+    if (
+        img_arr.dtype != np.uint8
+        or img_arr.strides[0] <= 0
+        or img_arr.strides[1:] != (channels, 1)
+    ):
+        img_arr = np.ascontiguousarray(img_arr, dtype=np.uint8)
+    img_qt = QtGui.QImage(
+        img_arr.ctypes.data,
+        width,
+        height,
+        img_arr.strides[0],
+        _ARR_FORMATS[channels],
+    )
+    img_qt._array = img_arr
+    return img_qt
+
+
+def img_data_to_qt_draft(img_data, size):
+    """
+        Быстрое чтение уменьшенной копии JPEG: в режиме draft PIL
+        декодирует изображение сразу в 2, 4 или 8 раз меньше средствами
+        самого JPEG. Копия не меньше изображения, вписанного в
+        size = (ширина, высота).
+
+        Возвращает (QImage, (ширина, высота) полного изображения) или None,
+        если это не JPEG или уменьшать не нужно.
+    """
+    if not img_data or not img_data.startswith(b"\xff\xd8"):
+        return None
+    try:
+        image_pil = PIL.Image.open(io.BytesIO(img_data))
+        width, height = image_pil.size
+        fit = min(size[0] / width, size[1] / height)
+        if fit > 0.5:
+            return None
+        image_pil.draft(
+            "RGB", (max(int(width * fit), 1), max(int(height * fit), 1))
+        )
+        if image_pil.size == (width, height):
+            return None
+        if image_pil.mode not in ("RGB", "L"):
+            image_pil = image_pil.convert("RGB")
+        img_arr = np.asarray(image_pil)
+    except OSError:
+        return None
+    img_qt = img_arr_to_qt(img_arr).convertToFormat(QtGui.QImage.Format_RGB32)
+    return img_qt, (width, height)
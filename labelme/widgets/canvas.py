@@ -1,15 +1,26 @@
-from typing import List, Dict
+from typing import List
 
-import imgviz
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 
-import labelme.ai
 import labelme.utils
 from labelme import QT5
+from labelme.image_pyramid import ImagePyramid
+from labelme.image_source import TileReader
 from labelme.logger import logger
 from labelme.shape import Shape,ShapeClass,IdController
+from labelme.shape import ShapeTree
+from labelme.spatial_index import ShapeGridIndex
+from labelme.undo import CreateShapesCommand
+from labelme.undo import DeleteShapesCommand
+from labelme.undo import InsertPointCommand
+from labelme.undo import MacroCommand
+from labelme.undo import MoveShapesCommand
+from labelme.undo import MoveVertexCommand
+from labelme.undo import RemovePointCommand
+from labelme.undo import SetPointsCommand
+from labelme.undo import UndoStack
 
 # TODO(unknown):
 # - [maybe] Find optimal epsilon value.
@@ -23,6 +34,13 @@ CURSOR_GRAB = QtCore.Qt.OpenHandCursor
 
 MOVE_SPEED = 5.0
 
+# Уровни детализации при отрисовке:
+# при масштабе меньше LOD_VERTEX_SCALE маркеры вершин рисуются только у
+# выделенных и подсвеченных фигур, а фигуры меньше LOD_MIN_SHAPE_SIZE
+# экранных пикселей рисуются обрамляющим прямоугольником.
+LOD_VERTEX_SCALE = 0.5
+LOD_MIN_SHAPE_SIZE = 3.0
+
 
 class Canvas(QtWidgets.QWidget):
     zoomRequest = QtCore.Signal(int, QtCore.QPoint)
@@ -35,6 +53,9 @@ class Canvas(QtWidgets.QWidget):
     mouseMoved = QtCore.Signal(QtCore.QPointF)
     scrollDragRequest = QtCore.Signal(float, int) # Сигнал для панорамирования
     parentShapeChanged = QtCore.Signal(object) # Сигнал для панорамирования
+    # Показана уменьшенная копия, а нужно полное изображение (setFullImage):
+    # модели или для отрисовки, если тайлы не из чего читать
+    fullImageRequested = QtCore.Signal()
 
 
     CREATE, EDIT = 0, 1
@@ -51,7 +72,13 @@ class Canvas(QtWidgets.QWidget):
             raise ValueError(
                 "Unexpected value for double_click event: {}".format(self.double_click)
             )
-        self.num_backups = kwargs.pop("num_backups", 10)
+        # Объём истории правок в байтах
+        self.undo_budget = kwargs.pop("undo_budget", 16 * 1024 * 1024)
+        # Размер тайла и объём кэша уменьшенных копий изображения в байтах
+        self.tile_size = kwargs.pop("tile_size", 512)
+        self.tile_cache = kwargs.pop("tile_cache", 256 * 1024 * 1024)
+        # Аргументы configure_embedding_cache, применяются при выборе модели
+        self.embedding_cache = kwargs.pop("embedding_cache", None)
         self._crosshair = kwargs.pop(
             "crosshair",
             {
@@ -62,8 +89,16 @@ class Canvas(QtWidgets.QWidget):
         super(Canvas, self).__init__(*args, **kwargs)
         # Initialise local state.
         self.mode = self.EDIT
+        # Индекс для поиска фигур под курсором
+        self._shapeIndex = ShapeGridIndex()
         self.shapes : List[Shape] = []
-        self.shapesBackups : List[Shape] = []
+        self.undoStack = UndoStack(budget=self.undo_budget)
+        # Начало текущего перетаскивания: (фигуры, индекс вершины, исходная точка)
+        self._moveOrigin = None
+        # Правки, сделанные в начале перетаскивания (например, новая вершина)
+        self._pendingCommands = []
+        # Кэш неподвижной части сцены на время перетаскивания
+        self._staticLayerCache = None
         self.current = None
         self.selectedShapes : List[Shape] = []  # save the selected shapes here
         self.selectedShapesCopy = []
@@ -77,13 +112,23 @@ class Canvas(QtWidgets.QWidget):
         self.prevMovePoint = QtCore.QPoint()
         self.offsets = QtCore.QPoint(), QtCore.QPoint()
         self.scale = 1.0
-        # Полное изоображение
-        self.full_image = QtGui.QPixmap()
-        # Обрезанное изоображение
-        self.cropped_image = QtGui.QPixmap()
+        # Полное изоображение; рисуется через пирамиду уменьшенных копий
+        self._image = QtGui.QImage()
+        self._pyramid = None
+        self._fullImageRequested = False
+        # Подробные тайлы уменьшенной копии читаются из ImageSource в фоне
+        self._tileReader = TileReader(self)
+        self._tileReader.loaded.connect(self._tileLoaded)
+        # Показываемая область изображения при переходе к элементу,
+        # None - показана вся страница. Пиксели при этом не копируются:
+        # область только ограничивает отрисовку и задаёт сдвиг
+        self._cropRect = None
         # Сдвиг обрезанного изообоажения относительно полного
         self.image_offsets = (0 , 0)
-        self.visible : Dict[int,bool] = {} # TODO: change visible logic. Use shape id
+        # Фигуры, скрытые пользователем (галочкой в списке разметки). Кроме
+        # них скрыты все фигуры вне элемента, к которому выполнен переход
+        # (parentShape), см. isVisible
+        self._hiddenShapes = set()
         self._hideBackround = False
         self.hideBackround = False
         self.hShape = None
@@ -110,6 +155,35 @@ class Canvas(QtWidgets.QWidget):
         self.setFocusPolicy(QtCore.Qt.WheelFocus)
 
         self._ai_model = None
+        # Фоновый расчёт предпросмотра ai_polygon
+        self._aiWorker = None
+        # (номер, points, point_labels) последнего запроса предпросмотра
+        self._aiRequest = None
+        # (points, point_labels, многоугольник) последнего полученного ответа
+        self._aiPreview = None
+        # Номер запроса, по результату которого завершится фигура ai_polygon
+        self._aiFinalising = None
+
+    @property
+    def shapes(self) -> List[Shape]:
+        return self._shapes
+
+    @shapes.setter
+    def shapes(self, value: List[Shape]):
+        self._shapes = value
+        # Иерархия фигур документа: общее дерево загруженных фигур или новое
+        self.shapeTree = ShapeTree.of(value)
+        self._shapeIndex.rebuild(value)
+
+    def updateShapeIndex(self, shapes=None):
+        """
+            Обновляет положение фигур в индексе после изменения их вершин.
+            Без аргументов индекс перестраивается целиком.
+        """
+        if shapes is None:
+            self._shapeIndex.rebuild(self._shapes)
+        else:
+            self._shapeIndex.update(shapes)
 
     def fillDrawing(self):
         return self._fill_drawing
@@ -132,6 +206,11 @@ class Canvas(QtWidgets.QWidget):
         self._createMode = value
 
     def initializeAiModel(self, name):
+        # Модули моделей загружаются при первом выборе режима с моделью
+        import labelme.ai
+
+        if self.embedding_cache is not None:
+            labelme.ai.configure_embedding_cache(**self.embedding_cache)
         if name not in [model.name for model in labelme.ai.MODELS]:
             raise ValueError("Unsupported ai model: %s" % name)
         model = [model for model in labelme.ai.MODELS if model.name == name][0]
@@ -141,55 +220,122 @@ class Canvas(QtWidgets.QWidget):
         else:
             logger.debug("Initializing AI model: %r" % model.name)
             self._ai_model = model()
+            if self._aiWorker is None:
+                self._aiWorker = labelme.ai.PredictionWorker(self._ai_model, self)
+                self._aiWorker.predicted.connect(self._aiPredicted)
+                self._aiWorker.failed.connect(self._aiFailed)
+            else:
+                self._aiWorker.setModel(self._ai_model)
+            self._cancelAiPreview()
 
-        if self.cropped_image is None:
+        if self._image.isNull():
             logger.warning("Pixmap is not set yet")
             return
+        if self.isPreview():
+            # Модели нужно полное изображение, оно передастся в setFullImage
+            self._requestFullImage()
+            return
+
+        self._setAiImage()
 
+    def _setAiImage(self, image: QtGui.QImage = None):
+        """
+            Передаёт модели текущее (возможно, обрезанное) изображение:
+            вид на память полного QImage (по умолчанию показанного), без
+            копирования пикселей.
+        """
+        x, y = self.image_offsets
+        width, height = self.imageSize().width(), self.imageSize().height()
+        image = labelme.utils.img_qt_to_rgb(self._image if image is None else image)
         self._ai_model.set_image(
-            image=labelme.utils.img_qt_to_arr(self.cropped_image.toImage())
+            image=image[y : y + height, x : x + width],
+            crop_rect=(x, y, width, height),
         )
 
-    def storeShapes(self):
-        shapesBackup = []
-        for shape in self.shapes:
-            if shape.getClass() == ShapeClass.TEXT:
-                list = shape.copyWithChildren()
-                for shap in list:
-                    shapesBackup.append(shap)
-        if len(self.shapesBackups) > self.num_backups:
-            self.shapesBackups = self.shapesBackups[-self.num_backups - 1 :]
-        self.shapesBackups.append(shapesBackup)
-
     @property
     def isShapeRestorable(self):
-        # We save the state AFTER each edit (not before) so for an
-        # edit to be undoable, we expect the CURRENT and the PREVIOUS state
-        # to be in the undo stack.
-        if len(self.shapesBackups) < 2:
-            return False
-        return True
+        return self.undoStack.canUndo()
+
+    @property
+    def isShapeRedoable(self):
+        return self.undoStack.canRedo()
 
     def restoreShape(self):
-        # This does _part_ of the job of restoring shapes.
-        # The complete process is also done in app.py::undoShapeEdit
-        # and app.py::loadShapes and our own Canvas::loadShapes function.
-        if not self.isShapeRestorable:
-            return
-        self.shapesBackups.pop()  # latest
+        """
+            Отменяет последнюю правку.
+        """
+        if self.undoStack.undo() is not None:
+            self._afterUndoRedo()
 
-        # The application will eventually call Canvas.loadShapes which will
-        # push this right back onto the stack.
-        shapesBackup = self.shapesBackups.pop()
-        self.shapes = shapesBackup
-        self.selectedShapes : List[Shape] = []
-        for shape in self.shapes:
+    def redoShape(self):
+        """
+            Повторяет последнюю отменённую правку.
+        """
+        if self.undoStack.redo() is not None:
+            self._afterUndoRedo()
+
+    def _afterUndoRedo(self):
+        # Команда могла сдвинуть, добавить или удалить любые фигуры
+        self.updateShapeIndex()
+        self._invalidateStaticLayer()
+        for shape in self.selectedShapes:
             shape.selected = False
-            if shape.getId() == self._parentShapeId:
-                self.parentShape = shape
-                self.parentShapeChanged.emit(self.parentShape)
+        self.selectedShapes : List[Shape] = []
+        self.hShape = self.hVertex = self.hEdge = None
+        self.prevhShape = self.prevhVertex = self.prevhEdge = None
+        # Элемент, к которому был выполнен "переход", мог быть удалён отменой
+        parentShape = self.parentShape
+        while parentShape is not None and parentShape not in self.shapes:
+            parentShape = parentShape.parent
+        if parentShape is not self.parentShape:
+            self.parentShape = parentShape
+            self._parentShapeId = -1 if parentShape is None else parentShape.getId()
+            self.parentShapeChanged.emit(self.parentShape)
         self.update()
 
+    def _beginMove(self, shapes=None):
+        """
+            Запоминает положение перед перетаскиванием вершины или фигур,
+            чтобы по его окончании записать одну команду в историю правок.
+        """
+        if shapes is None and self.selectedVertex():
+            shape, index = self.hShape, self.hVertex
+            if index < len(shape):
+                self._moveOrigin = ([shape], index, QtCore.QPointF(shape[index]))
+                return
+        if shapes is None:
+            shapes = self.selectedShapes
+        if shapes and len(shapes[0]):
+            self._moveOrigin = (list(shapes), None, QtCore.QPointF(shapes[0][0]))
+        else:
+            self._moveOrigin = None
+
+    def _endMove(self):
+        """
+            Записывает в историю правки, сделанные за время перетаскивания.
+
+            Возвращает True, если что-то изменилось.
+        """
+        commands = self._pendingCommands
+        self._pendingCommands = []
+        self._invalidateStaticLayer()
+        if self._moveOrigin is not None:
+            shapes, index, origin = self._moveOrigin
+            self._moveOrigin = None
+            if index is not None:
+                if index < len(shapes[0]) and shapes[0][index] != origin:
+                    commands.append(
+                        MoveVertexCommand(shapes[0], index, origin, shapes[0][index])
+                    )
+            elif len(shapes[0]) and shapes[0][0] != origin:
+                commands.append(MoveShapesCommand(shapes, shapes[0][0] - origin))
+        if not commands:
+            return False
+        if len(commands) > 1:
+            commands = [MacroCommand(commands)]
+        self.undoStack.push(commands[0])
+        return True
+
     def enterEvent(self, ev):
         self.overrideCursor(self._cursor)
 
@@ -201,7 +347,31 @@ class Canvas(QtWidgets.QWidget):
         self.restoreCursor()
 
     def isVisible(self, shape : Shape):
-        return self.visible.get(shape.getId(), True)
+        """
+            Видна ли фигура: она не скрыта пользователем и, если выполнен
+            переход к элементу, является его потомком. Переход ничего не
+            перезаписывает, поэтому скрытые пользователем фигуры остаются
+            скрытыми и после возврата.
+        """
+        if self._hiddenShapes and shape in self._hiddenShapes:
+            return False
+        return self.parentShape is None or shape.isDescendantOf(self.parentShape)
+
+    def _visibleShapes(self, shapes: List[Shape]) -> List[Shape]:
+        """
+            Видимые фигуры из shapes (см. isVisible). Без перехода и скрытых
+            фигур список возвращается как есть, переход проверяется сразу
+            для всех фигур по дереву документа.
+        """
+        if self.parentShape is not None:
+            shapes = self.parentShape.tree.filterDescendants(shapes, self.parentShape)
+        if self._hiddenShapes:
+            shapes = [s for s in shapes if s not in self._hiddenShapes]
+        return shapes
+
+    def isHidden(self, shape : Shape):
+        """Скрыта ли фигура пользователем, без учёта перехода к элементу."""
+        return shape in self._hiddenShapes
 
     def drawing(self):
         return self.mode == self.CREATE
@@ -241,8 +411,8 @@ class Canvas(QtWidgets.QWidget):
         """
         if ev.buttons() & QtCore.Qt.MiddleButton:
             QtGui.QCursor.setPos(self.mapToGlobal(self._pan_start))
-            deltaX = - (ev.x() - self._pan_start.x()) / self.cropped_image.width() / self.scale 
-            deltaY = - (ev.y() - self._pan_start.y()) / self.cropped_image.height() / self.scale 
+            deltaX = - (ev.x() - self._pan_start.x()) / self.imageSize().width() / self.scale 
+            deltaY = - (ev.y() - self._pan_start.y()) / self.imageSize().height() / self.scale 
             self.scrollDragRequest.emit(deltaX, QtCore.Qt.Horizontal)
             self.scrollDragRequest.emit(deltaY, QtCore.Qt.Vertical)
             # self._pan_start = ev.pos() # Позволяет панорамировать относительно зажатого курсора
@@ -295,6 +465,8 @@ class Canvas(QtWidgets.QWidget):
                 self.line.point_labels = [1, 1]
                 self.line.close()
             assert len(self.line.points) == len(self.line.point_labels)
+            if self.createMode == "ai_polygon":
+                self._requestAiPreview()
             self.repaint()
             self.current.highlightClear()
             return
@@ -317,7 +489,10 @@ class Canvas(QtWidgets.QWidget):
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
         self.setToolTip(self.tr("Image"))
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        # nearestVertex и nearestEdge сравнивают расстояние на экране,
+        # поэтому в координатах изображения допуск равен epsilon / scale
+        candidates = self._shapeIndex.query(pos, self.epsilon / self.scale)
+        for shape in self._visibleShapes(candidates):
             # Look for a nearby vertex to highlight. If that fails,
             # check if we happen to be inside a shape.
             index = shape.nearestVertex(pos, self.epsilon)
@@ -373,6 +548,8 @@ class Canvas(QtWidgets.QWidget):
         if shape is None or index is None or point is None:
             return
         shape.insertPoint(index, point)
+        self._shapeIndex.update([shape])
+        self._pendingCommands.append(InsertPointCommand(shape, index, point))
         shape.highlightVertex(index, shape.MOVE_VERTEX)
         self.hShape = shape
         self.hVertex = index
@@ -384,7 +561,11 @@ class Canvas(QtWidgets.QWidget):
         index = self.prevhVertex
         if shape is None or index is None:
             return
+        point, n_points = shape[index], len(shape)
         shape.removePoint(index)
+        self._shapeIndex.update([shape])
+        if len(shape) < n_points:
+            self.undoStack.push(RemovePointCommand(shape, index, point))
         shape.highlightClear()
         self.hShape = shape
         self.prevhVertex = None
@@ -399,8 +580,7 @@ class Canvas(QtWidgets.QWidget):
             if self.selectedShapes[0].getClass() not in [ShapeClass.LETTER, ShapeClass.ROW]:
                 self.parentShape = self.selectedShapes[0]
                 self._parentShapeId = self.parentShape.getId()
-                self.visible.update((k, False) for k in self.visible)    
-                self.visible.update((shape.getId(), True) for shape in self.parentShape.getAllChildren())
+                self._invalidateStaticLayer()
                 self.parentShapeChanged.emit(self.parentShape)
         
     def unZoomParentShape(self):
@@ -411,11 +591,9 @@ class Canvas(QtWidgets.QWidget):
             self.parentShape = self.parentShape.parent
             if self.parentShape is not None:
                 self._parentShapeId = self.parentShape.getId()
-                self.visible.update((k, False) for k in self.visible)
-                self.visible.update((shape.getId(), True) for shape in self.parentShape.getAllChildren())
             else: 
                 self._parentShapeId = -1
-                self.visible.update((k, True) for k in self.visible)
+            self._invalidateStaticLayer()
             self.parentShapeChanged.emit(self.parentShape)
 
     def mousePressEvent(self, ev):
@@ -428,6 +606,8 @@ class Canvas(QtWidgets.QWidget):
 
         if ev.button() == QtCore.Qt.LeftButton:
             if self.drawing():
+                if self._aiFinalising is not None:
+                    return  # фигура ждёт многоугольник от модели
                 if self.current:
                     # Add point to existing shape.
                     if self.createMode in ["polygon"]:
@@ -437,14 +617,14 @@ class Canvas(QtWidgets.QWidget):
                             self.finalise()
                     elif self.createMode in ["rectangle"]:
                         assert len(self.current.points) == 1
-                        self.current.points = self.line.points
+                        self.current.points = list(self.line.points)
                         self.finalise()
                     elif self.createMode in ["ai_polygon"]:
                         self.current.addPoint(
                             self.line.points[1],
                             label=self.line.point_labels[1],
                         )
-                        self.line.points[0] = self.current.points[-1]
+                        self.line[0] = self.current.points[-1]
                         self.line.point_labels[0] = self.current.point_labels[-1]
                         if ev.modifiers() & QtCore.Qt.ControlModifier:
                             self.finalise()
@@ -454,7 +634,8 @@ class Canvas(QtWidgets.QWidget):
                         shape_type="points"
                         if self.createMode in ["ai_polygon"]
                         else self.createMode,
-                        parent = self.parentShape
+                        parent = self.parentShape,
+                        tree=self.shapeTree,
                     )
                     self.current.addPoint(pos, label=0 if is_shift_pressed else 1)
                     if (
@@ -487,6 +668,7 @@ class Canvas(QtWidgets.QWidget):
                 group_mode = int(ev.modifiers()) == QtCore.Qt.ControlModifier
                 self.selectShapePoint(pos, multiple_selection_mode=group_mode)
                 self.prevPoint = pos
+                self._beginMove()
                 self.repaint()
         elif ev.button() == QtCore.Qt.RightButton and self.editing():
             group_mode = int(ev.modifiers()) == QtCore.Qt.ControlModifier
@@ -523,9 +705,7 @@ class Canvas(QtWidgets.QWidget):
             self.overrideCursor(CURSOR_GRAB) # Панорамирование окончено. Возвращение курсора к обычному виду.
 
         if self.movingShape and self.hShape:
-            index = self.shapes.index(self.hShape)
-            if self.shapesBackups[-1][index].points != self.shapes[index].points:
-                self.storeShapes()
+            if self._endMove():
                 self.shapeMoved.emit()
 
             self.movingShape = False
@@ -536,14 +716,23 @@ class Canvas(QtWidgets.QWidget):
         if copy:
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.shapes.append(shape)
+                self._shapeIndex.insert(shape)
                 self.selectedShapes[i].selected = False
                 self.selectedShapes[i] = shape
+            command = CreateShapesCommand(self.selectedShapesCopy, self.shapes)
         else:
+            commands = []
             for i, shape in enumerate(self.selectedShapesCopy):
+                selected = self.selectedShapes[i]
+                commands.append(
+                    SetPointsCommand(selected, selected.points, shape.points)
+                )
                 self.selectedShapes[i].points = shape.points
+            self._shapeIndex.update(self.selectedShapes)
+            command = MacroCommand(commands)
+        self.undoStack.push(command)
         self.selectedShapesCopy = []
         self.repaint()
-        self.storeShapes()
         return True
 
     def hideBackroundShapes(self, value):
@@ -582,7 +771,7 @@ class Canvas(QtWidgets.QWidget):
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
         else:
-            for shape in reversed(self.shapes):
+            for shape in self._shapeIndex.query(point):
                 if self.isVisible(shape) and shape.containsPoint(point):
                     self.setHiding()
                     if shape not in self.selectedShapes:
@@ -601,9 +790,9 @@ class Canvas(QtWidgets.QWidget):
         """ Вычисление смещения координат, когда выбрана конкретная метка. """
         x0, y0 = self.image_offsets
         # Вычисление границ
-        left = x0 + self.cropped_image.width() - 1
+        left = x0 + self.imageSize().width() - 1
         right = x0
-        top = y0 + self.cropped_image.height() - 1
+        top = y0 + self.imageSize().height() - 1
         bottom = y0
         for s in self.selectedShapes:
             rect = s.boundingRect()
@@ -667,9 +856,10 @@ class Canvas(QtWidgets.QWidget):
         pos = self._moveVertexInside(pos, maxBounds)
         
         shape.moveVertexBy(index, pos - point)
+        self._shapeIndex.update([shape])
 
     def _outOfPixmapClear(self, p : QtCore.QPointF):
-        w, h = self.cropped_image.width(), self.cropped_image.height()
+        w, h = self.imageSize().width(), self.imageSize().height()
         return not (0 <= p.x() <= w - 1 and 0 <= p.y() <= h - 1)
 
     def boundedMoveShapes(self, shapes : List[Shape], pos):
@@ -678,7 +868,7 @@ class Canvas(QtWidgets.QWidget):
         """
         
         x0, y0 = self.image_offsets
-        w, h = self.cropped_image.width(), self.cropped_image.height()
+        w, h = self.imageSize().width(), self.imageSize().height()
         pic_bounds = (x0, y0, x0 + w, y0 + h)
         
         o1 = pos + self.offsets[0] 
@@ -703,6 +893,8 @@ class Canvas(QtWidgets.QWidget):
         if dp:
             for shape in shapes:
                 shape.moveBy(dp)
+                # moveBy сдвигает и всех потомков фигуры
+                self._shapeIndex.update([shape] + shape.getAllChildren())
             self.prevPoint = pos
             return True
         return False
@@ -717,18 +909,13 @@ class Canvas(QtWidgets.QWidget):
     def deleteSelected(self):
         deleted_shapes = []
         if self.selectedShapes:
-            for shape in self.selectedShapes:
-                if shape in self.shapes:
-                    self.shapes.remove(shape)
-                    deleted_shapes.append(shape)
-                children = shape.getAllChildren()
-                for child in children:
-                    if child in self.shapes:
-                        self.shapes.remove(child)
-                        deleted_shapes.append(child)
-                    child.delete()
-                shape.delete()
-            self.storeShapes()
+            command = DeleteShapesCommand(self.selectedShapes, self.shapes)
+            command.redo()
+            self._invalidateStaticLayer()
+            for shape, _, _ in command.entries:
+                self._shapeIndex.remove(shape)
+            self.undoStack.push(command)
+            deleted_shapes = command.shapes
             self.selectedShapes = []
             self.update()
         return deleted_shapes
@@ -736,10 +923,12 @@ class Canvas(QtWidgets.QWidget):
     def deleteShape(self, shape:Shape):
         if shape in self.selectedShapes:
             self.selectedShapes.remove(shape)
-        if shape in self.shapes:
-            self.shapes.remove(shape)
-        shape.delete()
-        self.storeShapes()
+        command = DeleteShapesCommand([shape], self.shapes)
+        command.redo()
+        self._invalidateStaticLayer()
+        for s, _, _ in command.entries:
+            self._shapeIndex.remove(s)
+        self.undoStack.push(command)
         self.update()
 
     def boundedShiftShapes(self, shapes):
@@ -753,15 +942,120 @@ class Canvas(QtWidgets.QWidget):
             self.boundedMoveShapes(shapes, point + offset)
 
     def paintEvent(self, event):
-        if not self.cropped_image:
+        if self._image.isNull():
             return super(Canvas, self).paintEvent(event)
+        if (
+            self.isPreview()
+            and self._pyramid.source is None
+            and self._pyramid.levelFor(self.scale) < self._pyramid.base_level
+        ):
+            # Уменьшенной копии для такого масштаба мало, а читать тайлы
+            # не из чего
+            self._requestFullImage()
 
         p = self._painter
         p.begin(self)
+        self._setRenderHints(p)
+
+        Shape.scale = self.scale
+        rect = event.rect()
+        if self._moveOrigin is not None and self.movingShape:
+            # Перетаскивание: неподвижная часть сцены берётся из кэша,
+            # заново рисуются только перемещаемые фигуры
+            visible = self.visibleRegion().boundingRect()
+            if not visible.isEmpty():
+                rect = rect.intersected(visible)
+            layer, active = self._staticLayer(rect)
+            p.drawPixmap(rect.topLeft(), layer)
+            self._paintImage(p, rect, draw_image=False)
+            self._paintShapes(
+                p, [s for s in self._exposedShapes(rect) if s in active]
+            )
+        else:
+            self._invalidateStaticLayer()
+            self._paintImage(p, rect)
+            self._paintCrosshair(p)
+            self._paintShapes(p, self._exposedShapes(rect))
+
+        if self.current:
+            self.current.paint(p)
+            assert len(self.line.points) == len(self.line.point_labels)
+            self.line.paint(p)
+        if self.selectedShapesCopy:
+            for s in self.selectedShapesCopy:
+                if s is not None:
+                    s.paint(p)
+
+        if (
+            self.createMode == "ai_polygon"
+            and self.current is not None
+            and self._aiPreview is not None
+        ):
+            # Последний готовый результат фонового расчёта
+            points = self._aiPreview[2]
+            if len(points) > 2:
+                drawing_shape = Shape(shape_type="polygon")
+                drawing_shape.points = [
+                    QtCore.QPointF(point[0], point[1]) for point in points
+                ]
+                drawing_shape.point_labels = [1] * len(points)
+                drawing_shape.fill = self.fillDrawing()
+                drawing_shape.selected = True
+                drawing_shape.paint(p)
+        p.end()
+
+    def _requestAiPreview(self):
+        """
+            Запрашивает у фонового потока многоугольник для вершин текущей
+            фигуры и положения курсора. Более старый незавершённый запрос
+            при этом отменяется.
+        """
+        if (
+            self._aiWorker is None
+            or self.current is None
+            or self._aiFinalising is not None
+        ):
+            return
+        points = [[point.x(), point.y()] for point in self.current.points]
+        points.append([self.line.points[1].x(), self.line.points[1].y()])
+        point_labels = list(self.current.point_labels) + [self.line.point_labels[1]]
+        request_id = self._aiWorker.request(points, point_labels)
+        self._aiRequest = (request_id, points, point_labels)
+
+    def _aiPredicted(self, request_id, polygon):
+        if self._aiRequest is None or self._aiRequest[0] != request_id:
+            return
+        if request_id == self._aiFinalising:
+            self._finishShape(polygon)
+            return
+        _, points, point_labels = self._aiRequest
+        self._aiPreview = (points, point_labels, polygon)
+        self.update()
+
+    def _aiFailed(self, request_id):
+        if request_id == self._aiFinalising:
+            # Фигура остаётся недорисованной, завершение можно повторить
+            self._aiFinalising = None
+            self._aiRequest = None
+
+    def _cancelAiPreview(self):
+        if self._aiWorker is not None:
+            self._aiWorker.cancel()
+        self._aiRequest = None
+        self._aiPreview = None
+        self._aiFinalising = None
+
+    def _setRenderHints(self, p: QtGui.QPainter):
         p.setRenderHint(QtGui.QPainter.Antialiasing)
         p.setRenderHint(QtGui.QPainter.HighQualityAntialiasing)
         p.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
 
+    def _paintImage(self, p: QtGui.QPainter, rect: QtCore.QRect, draw_image=True):
+        """
+            Рисует часть изображения, попадающую в rect (в координатах
+            виджета), и оставляет painter в экранном масштабе со сдвигом,
+            в котором рисуются фигуры.
+        """
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
         
@@ -769,11 +1063,21 @@ class Canvas(QtWidgets.QWidget):
         # неоходимость возникает из-за обрезания картинки по "переходу" к элементу 
         p.translate(-self.image_offsets[0],-self.image_offsets[1])
      
-        p.drawPixmap(self.image_offsets[0], self.image_offsets[1], self.cropped_image)
+        if draw_image:
+            top_left = self.transformPos(QtCore.QPointF(rect.topLeft()))
+            bottom_right = self.transformPos(
+                QtCore.QPointF(rect.bottomRight()) + QtCore.QPointF(1, 1)
+            )
+            visible = QtCore.QRectF(top_left, bottom_right)
+            if self._cropRect is not None:
+                visible = visible.intersected(QtCore.QRectF(self._cropRect))
+            for level, row in self._pyramid.draw(p, visible, self.scale):
+                rect, size = self._pyramid.stripRegion(level, row)
+                self._tileReader.read(self._pyramid.source, (level, row), rect, size)
 
         p.scale(1 / self.scale, 1 / self.scale)
 
-        # draw crosshair
+    def _paintCrosshair(self, p: QtGui.QPainter):
         if (
             self._crosshair[self._createMode]
             and self.drawing()
@@ -795,40 +1099,95 @@ class Canvas(QtWidgets.QWidget):
                 inf,
             )
 
-        Shape.scale = self.scale
-        for shape in self.shapes:
-            if (shape.selected or not self._hideBackround) and self.isVisible(shape):
+    def _paintShapes(self, p: QtGui.QPainter, shapes: List[Shape]):
+        for shape in self._visibleShapes(shapes):
+            if shape.selected or not self._hideBackround:
                 shape.fill = shape.selected or shape == self.hShape
-                shape.paint(p)
-        if self.current:
-            self.current.paint(p)
-            assert len(self.line.points) == len(self.line.point_labels)
-            self.line.paint(p)
-        if self.selectedShapesCopy:
-            for s in self.selectedShapesCopy:
-                if s is not None:
-                    s.paint(p)
+                self._paintShape(p, shape)
 
-        if self.createMode == "ai_polygon" and self.current is not None:
-            drawing_shape = self.current.copy()
-            drawing_shape.addPoint(
-                point=self.line.points[1],
-                label=self.line.point_labels[1],
-            )
-            points = self._ai_model.predict_polygon_from_points(
-                points=[[point.x(), point.y()] for point in drawing_shape.points],
-                point_labels=drawing_shape.point_labels,
-            )
-            if len(points) > 2:
-                drawing_shape.setShapeRefined(
-                    shape_type="polygon",
-                    points=[QtCore.QPointF(point[0], point[1]) for point in points],
-                    point_labels=[1] * len(points),
-                )
-                drawing_shape.fill = self.fillDrawing()
-                drawing_shape.selected = True
-                drawing_shape.paint(p)
+    def _activeShapes(self) -> set:
+        """
+            Фигуры, которые меняются во время текущего перетаскивания:
+            перемещаемые (вместе с потомками), выделенные и подсвеченная.
+        """
+        active = set(self.selectedShapes)
+        if self.hShape is not None:
+            active.add(self.hShape)
+        if self._moveOrigin is not None:
+            shapes, index, _ = self._moveOrigin
+            for shape in shapes:
+                active.add(shape)
+                if index is None:
+                    active.update(shape.getAllChildren())
+        return active
+
+    def _staticLayer(self, rect: QtCore.QRect):
+        """
+            Возвращает (pixmap, active): изображение и все неподвижные фигуры,
+            отрисованные для области виджета rect, и множество фигур, которые
+            в слой не вошли.
+
+            Слой строится при первом кадре перетаскивания и живёт до его
+            окончания. Он пересобирается при изменении масштаба, области,
+            обрезки или видимости фигур (см. _invalidateStaticLayer).
+        """
+        key = (
+            rect.x(),
+            rect.y(),
+            rect.width(),
+            rect.height(),
+            self.scale,
+            self.image_offsets,
+            self._hideBackround,
+        )
+        cache = self._staticLayerCache
+        if cache is not None and cache[0] == key:
+            return cache[1], cache[2]
+
+        active = self._activeShapes()
+        ratio = self.devicePixelRatioF()
+        layer = QtGui.QPixmap(rect.size() * ratio)
+        layer.setDevicePixelRatio(ratio)
+        layer.fill(QtCore.Qt.transparent)
+        p = QtGui.QPainter(layer)
+        self._setRenderHints(p)
+        p.translate(-rect.x(), -rect.y())
+        self._paintImage(p, rect)
+        self._paintShapes(
+            p, [s for s in self._exposedShapes(rect) if s not in active]
+        )
         p.end()
+        self._staticLayerCache = (key, layer, active)
+        return layer, active
+
+    def _invalidateStaticLayer(self):
+        self._staticLayerCache = None
+
+    def _exposedShapes(self, rect: QtCore.QRect) -> List[Shape]:
+        """
+            Фигуры, попадающие в перерисовываемую область виджета rect,
+            в порядке отрисовки.
+        """
+        # Запас на толщину линий и маркеры вершин, которые выходят за границы
+        margin = (Shape.point_size * 2 + Shape.PEN_WIDTH) / self.scale
+        top_left = self.transformPos(QtCore.QPointF(rect.topLeft()))
+        bottom_right = self.transformPos(QtCore.QPointF(rect.bottomRight()))
+        return self._shapeIndex.intersecting(
+            top_left.x() - margin,
+            top_left.y() - margin,
+            bottom_right.x() + margin,
+            bottom_right.y() + margin,
+        )
+
+    def _paintShape(self, painter: QtGui.QPainter, shape: Shape):
+        """Рисует фигуру с детализацией, зависящей от масштаба."""
+        active = shape.selected or shape is self.hShape
+        if not active and shape.mask is None:
+            xmin, ymin, xmax, ymax = shape.getBounds()
+            if max(xmax - xmin, ymax - ymin) * self.scale < LOD_MIN_SHAPE_SIZE:
+                shape.paintBounds(painter)
+                return
+        shape.paint(painter, vertices=active or self.scale >= LOD_VERTEX_SCALE)
 
     def transformPos(self, point):
         """Convert from widget-logical coordinates to painter-logical ones."""
@@ -838,35 +1197,57 @@ class Canvas(QtWidgets.QWidget):
     def offsetToCenter(self):
         s = self.scale
         area = super(Canvas, self).size()
-        w, h = self.cropped_image.width() * s, self.cropped_image.height() * s
+        w, h = self.imageSize().width() * s, self.imageSize().height() * s
         aw, ah = area.width(), area.height()
         x = (aw - w) / (2 * s) if aw > w else 0
         y = (ah - h) / (2 * s) if ah > h else 0
         return QtCore.QPointF(x, y)
 
     def outOfPixmap(self, p):
-        w, h = self.cropped_image.width(), self.cropped_image.height()
+        w, h = self.imageSize().width(), self.imageSize().height()
         x,y = self.image_offsets
         return not (x <= p.x() <= x + w - 1 and y <= p.y() <= y + h - 1)
 
     def finalise(self):
         assert self.current
         if self.createMode == "ai_polygon":
+            if self._aiFinalising is not None:
+                return  # многоугольник для этой фигуры уже считается
             # convert points to polygon by an AI model
             assert self.current.shape_type == "points"
-            points = self._ai_model.predict_polygon_from_points(
-                points=[[point.x(), point.y()] for point in self.current.points],
-                point_labels=self.current.point_labels,
-            )
+            points = [[point.x(), point.y()] for point in self.current.points]
+            point_labels = list(self.current.point_labels)
+            preview = self._aiPreview
+            if preview is not None and preview[:2] == (points, point_labels):
+                # Предпросмотр уже посчитан для этих же вершин
+                self._finishShape(preview[2])
+                return
+            # Клик опередил фоновый расчёт: фигура завершится в _aiPredicted,
+            # UI-поток модель не ждёт
+            self._cancelAiPreview()
+            request_id = self._aiWorker.request(points, point_labels)
+            self._aiRequest = (request_id, points, point_labels)
+            self._aiFinalising = request_id
+            return
+        self._finishShape()
+
+    def _finishShape(self, polygon=None):
+        """
+            Закрывает текущую фигуру и добавляет её на холст. polygon -
+            многоугольник, построенный моделью для фигуры ai_polygon.
+        """
+        if polygon is not None:
+            self._cancelAiPreview()
             self.current.setShapeRefined(
-                points=[QtCore.QPointF(point[0], point[1]) for point in points],
-                point_labels=[1] * len(points),
+                points=[QtCore.QPointF(point[0], point[1]) for point in polygon],
+                point_labels=[1] * len(polygon),
                 shape_type="polygon",
             )
         self.current.close()
 
         self.shapes.append(self.current)
-        self.storeShapes()
+        self._shapeIndex.insert(self.current)
+        self.undoStack.push(CreateShapesCommand([self.current], self.shapes))
         self.current = None
         self.setHiding(False)
         self.newShape.emit()
@@ -883,7 +1264,7 @@ class Canvas(QtWidgets.QWidget):
         # Cycle through each image edge in clockwise fashion,
         # and find the one intersecting the current line segment.
         # http://paulbourke.net/geometry/lineline2d/
-        size = self.cropped_image.size()
+        size = self.imageSize()
         x0, y0 =  self.image_offsets
         
         points = [
@@ -941,9 +1322,25 @@ class Canvas(QtWidgets.QWidget):
     def sizeHint(self):
         return self.minimumSizeHint()
 
+    def imageSize(self) -> QtCore.QSize:
+        """Размер показываемой части изображения."""
+        if self._cropRect is not None:
+            return self._cropRect.size()
+        return self.pageSize()
+
+    def pageSize(self) -> QtCore.QSize:
+        """Размер полного изображения, даже если показана его копия."""
+        if self._pyramid is None:
+            return QtCore.QSize()
+        return QtCore.QSize(self._pyramid.width(), self._pyramid.height())
+
+    def isPreview(self):
+        """Показана уменьшенная копия изображения (см. loadImage)."""
+        return self._pyramid is not None and self._pyramid.base_level > 0
+
     def minimumSizeHint(self):
-        if self.cropped_image:
-            return self.scale * self.cropped_image.size()
+        if not self._image.isNull():
+            return self.scale * self.imageSize()
         return super(Canvas, self).minimumSizeHint()
 
     def wheelEvent(self, ev):
@@ -977,6 +1374,8 @@ class Canvas(QtWidgets.QWidget):
 
     def moveByKeyboard(self, offset):
         if self.selectedShapes:
+            if not self.movingShape:
+                self._beginMove(self.selectedShapes)
             self.boundedMoveShapes(self.selectedShapes, self.prevPoint + offset)
             self.repaint()
             self.movingShape = True
@@ -987,6 +1386,7 @@ class Canvas(QtWidgets.QWidget):
         if self.drawing():
             if key == QtCore.Qt.Key_Escape and self.current:
                 self.current = None
+                self._cancelAiPreview()
                 self.drawingPolygon.emit(False)
                 self.update()
             elif key == QtCore.Qt.Key_Return and self.canCloseShape():
@@ -1010,18 +1410,16 @@ class Canvas(QtWidgets.QWidget):
                 self.snapping = True
         elif self.editing():
             if self.movingShape and self.selectedShapes:
-                index = self.shapes.index(self.selectedShapes[0])
-                if self.shapesBackups[-1][index].points != self.shapes[index].points:
-                    self.storeShapes()
+                if self._endMove():
                     self.shapeMoved.emit()
 
                 self.movingShape = False
 
     def setLastLabel(self, text, diacritical = ""):
+        # Метка хранится в самой фигуре, поэтому команда создания,
+        # записанная в finalise, восстановит фигуру уже с меткой
         self.shapes[-1].label = text
         self.shapes[-1].diacritical = diacritical
-        self.shapesBackups.pop()
-        self.storeShapes()
         return self.shapes[-1]
     
     
@@ -1033,7 +1431,9 @@ class Canvas(QtWidgets.QWidget):
 
     def undoLastLine(self):
         assert self.shapes
+        self.undoStack.pop()  # команда создания из finalise
         self.current = self.shapes.pop()
+        self._shapeIndex.remove(self.current)
         self.current.setOpen()
         self.current.restoreShapeRaw()
         if self.createMode in ["polygon"]:
@@ -1045,49 +1445,124 @@ class Canvas(QtWidgets.QWidget):
     def undoLastPoint(self):
         if not self.current or self.current.isClosed():
             return
+        if self._aiFinalising is not None:
+            self._cancelAiPreview()
         self.current.popPoint()
         if len(self.current) > 0:
             self.line[0] = self.current[-1]
         else:
             self.current = None
+            self._cancelAiPreview()
             self.drawingPolygon.emit(False)
         self.update()
 
     def crop(self, parentShape: Shape):
         """
-            Образает картинку соответственно текущему выбранному элементу
+            Образает картинку соответственно текущему выбранному элементу:
+            запоминает показываемую область, изображение не копируется
         """
-        if self.cropped_image:
+        self._invalidateStaticLayer()
+        if not self._image.isNull():
             if parentShape is None:
-                self.cropped_image = self.full_image.copy()
+                self._cropRect = None
                 self.image_offsets = (0,0)
             else:
                 shape = parentShape
                 rect = shape.getCropBox()
                 self.image_offsets = (rect.x(),rect.y())
-                self.cropped_image.convertFromImage(self.full_image.copy(rect).toImage())
+                self._cropRect = rect
             point = QtCore.QPoint(0, 0)
             self.zoomRequest.emit(0, point)
             self.update()
         
         
     def loadPixmap(self, pixmap, clear_shapes=True):
-        self.full_image = pixmap
-        self.cropped_image = pixmap.copy()
+        self.loadImage(pixmap.toImage(), clear_shapes=clear_shapes)
+
+    def loadImage(
+        self, image: QtGui.QImage, clear_shapes=True, size=None, source=None
+    ):
+        """
+            Показывает изображение целиком. Уменьшенные копии для мелких
+            масштабов строятся по тайлам при отрисовке.
+
+            size - размер полного изображения, если image - его уменьшенная
+            копия. Координаты фигур при этом остаются в пикселях полного
+            изображения. Когда копии для масштаба становится мало, более
+            подробные тайлы читаются в фоне из source (ImageSource) и
+            вытесняются из кэша, как остальные, а полное изображение не
+            хранится. Без source канвас отправляет fullImageRequested, и
+            полное изображение передаётся в setFullImage.
+        """
+        self._invalidateStaticLayer()
+        self._tileReader.cancel()
+        self._image = image
+        self._pyramid = ImagePyramid(
+            image,
+            tile_size=self.tile_size,
+            budget=self.tile_cache,
+            size=size,
+            source=source,
+        )
+        self._fullImageRequested = False
+        self._cropRect = None
+        self.image_offsets = (0, 0)
+        self._cancelAiPreview()
         if self._ai_model:
-            self._ai_model.set_image(
-                image=labelme.utils.img_qt_to_arr(self.cropped_image.toImage())
-            )
+            if self.isPreview():
+                self._requestFullImage()
+            else:
+                self._setAiImage()
         if clear_shapes:
             self.shapes = []
         self.update()
 
+    def setFullImage(self, image: QtGui.QImage):
+        """
+            Полное изображение, запрошенное через fullImageRequested.
+
+            Если тайлы читаются из source, изображение только передаётся
+            модели и канвасом не хранится. Иначе оно заменяет уменьшенную
+            копию, не трогая фигуры, переход к элементу и масштаб.
+        """
+        if image.size() != self.pageSize():
+            logger.warning("Full image size does not match the preview")
+            return
+        self._fullImageRequested = False
+        if self._pyramid.source is None:
+            self._invalidateStaticLayer()
+            self._image = image
+            self._pyramid = ImagePyramid(
+                image, tile_size=self.tile_size, budget=self.tile_cache
+            )
+            self.update()
+        if self._ai_model:
+            self._setAiImage(image)
+
+    def _tileLoaded(self, source, key, image):
+        if self._pyramid is None or self._pyramid.source is not source:
+            return
+        self._pyramid.addStrip(*key, image)
+        self._invalidateStaticLayer()
+        self.update()
+
+    def _requestFullImage(self):
+        if not self._fullImageRequested:
+            self._fullImageRequested = True
+            self.fullImageRequested.emit()
+
     def loadShapes(self, shapes, replace=True):
+        self._invalidateStaticLayer()
         if replace:
             self.shapes = list(shapes)
+            self.undoStack.clear()
         else:
             self.shapes.extend(shapes)
-        self.storeShapes()
+            for shape in shapes:
+                if shape.parent is None:
+                    self.shapeTree.adopt(shape)
+                self._shapeIndex.insert(shape)
+            self.undoStack.push(CreateShapesCommand(shapes, self.shapes))
         self.current = None
         self.hShape = None
         self.hVertex = None
@@ -1095,8 +1570,15 @@ class Canvas(QtWidgets.QWidget):
         self.update()
 
     def setShapeVisible(self, shape, value):
-        self.visible[shape.getId()] = value
-        self.update()
+        # Изменение других данных элемента списка тоже приходит сюда,
+        # перерисовка нужна только при смене видимости
+        if value != (shape not in self._hiddenShapes):
+            if value:
+                self._hiddenShapes.discard(shape)
+            else:
+                self._hiddenShapes.add(shape)
+            self._invalidateStaticLayer()
+            self.update()
 
     def overrideCursor(self, cursor):
         self.restoreCursor()
@@ -1108,13 +1590,21 @@ class Canvas(QtWidgets.QWidget):
 
     def resetState(self):
         self.restoreCursor()
-        self.cropped_image = None
-        self.shapesBackups = []
+        self._image = QtGui.QImage()
+        self._pyramid = None
+        self._tileReader.cancel()
+        self._cropRect = None
+        self.image_offsets = (0, 0)
+        self.undoStack.clear()
+        self._moveOrigin = None
+        self._pendingCommands = []
+        self._invalidateStaticLayer()
+        self._cancelAiPreview()
         self.shapes = []
         self.parentShape = None
         self._parentShapeId = -1
         self.parentShapeChanged.emit(self.parentShape)
         self.image_offsets = (0, 0)
         IdController.resetCount()
-        self.visible = {}        
+        self._hiddenShapes = set()
         self.update()
@@ -47,8 +47,39 @@ class FileDialogPreview(QtWidgets.QFileDialog):
         self.setFixedSize(self.width() + 300, self.height())
         self.layout().addLayout(box, 1, 3, 1, 1)
         self.currentChanged.connect(self.onChange)
+        self._thumbnails = None
+        self._path = None
+
+    def setThumbnailLoader(self, loader):
+        """
+            loader - ThumbnailLoader: превью изображений берутся из кэша
+            миниатюр и готовятся в фоне, а не декодируются целиком.
+        """
+        self._thumbnails = loader
+        loader.ready.connect(self._thumbnailReady)
+
+    def _thumbnailReady(self, path):
+        if path == self._path:
+            self.onChange(path)
+
+    def _setPreview(self, pixmap):
+        if pixmap is None or pixmap.isNull():
+            self.labelPreview.clear()
+            self.labelPreview.setHidden(True)
+            return
+        self.labelPreview.setPixmap(
+            pixmap.scaled(
+                self.labelPreview.width() - 30,
+                self.labelPreview.height() - 30,
+                QtCore.Qt.KeepAspectRatio,
+                QtCore.Qt.SmoothTransformation,
+            )
+        )
+        self.labelPreview.label.setAlignment(QtCore.Qt.AlignCenter)
+        self.labelPreview.setHidden(False)
 
     def onChange(self, path):
+        self._path = path
         if path.lower().endswith(".json"):
             with open(path, "r") as f:
                 data = json.load(f)
@@ -57,19 +88,9 @@ class FileDialogPreview(QtWidgets.QFileDialog):
                 QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop
             )
             self.labelPreview.setHidden(False)
+        elif self._thumbnails is not None:
+            icon = self._thumbnails.icon(path)
+            size = self._thumbnails.size
+            self._setPreview(None if icon is None else icon.pixmap(size, size))
         else:
-            pixmap = QtGui.QPixmap(path)
-            if pixmap.isNull():
-                self.labelPreview.clear()
-                self.labelPreview.setHidden(True)
-            else:
-                self.labelPreview.setPixmap(
-                    pixmap.scaled(
-                        self.labelPreview.width() - 30,
-                        self.labelPreview.height() - 30,
-                        QtCore.Qt.KeepAspectRatio,
-                        QtCore.Qt.SmoothTransformation,
-                    )
-                )
-                self.labelPreview.label.setAlignment(QtCore.Qt.AlignCenter)
-                self.labelPreview.setHidden(False)
+            self._setPreview(QtGui.QPixmap(path))
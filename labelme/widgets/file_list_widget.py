@@ -0,0 +1,256 @@
+import re
+
+from qtpy import QtCore
+from qtpy import QtWidgets
+from qtpy.QtCore import Qt
+
+
+class FileListModel(QtCore.QAbstractListModel):
+    """
+        Список файлов изображений с отметкой о наличии разметки.
+
+        Кроме списка хранит словарь путь -> строка, поэтому поиск файла,
+        отметка его размеченным и переход к соседнему файлу не требуют
+        перебора всех строк.
+    """
+
+    def __init__(self, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self._filenames = []
+        self._checked = []
+        self._rows = {}
+        # ThumbnailLoader, если показываются миниатюры
+        self._thumbnails = None
+
+    def setThumbnailLoader(self, loader):
+        """
+            Включает миниатюры (loader - ThumbnailLoader) или выключает их
+            (None). Миниатюры запрашиваются только для отрисовываемых строк.
+        """
+        if self._thumbnails is not None:
+            self._thumbnails.ready.disconnect(self._thumbnailReady)
+        self._thumbnails = loader
+        if loader is not None:
+            loader.ready.connect(self._thumbnailReady)
+        if self._filenames:
+            self.dataChanged.emit(
+                self.index(0), self.index(len(self._filenames) - 1), [Qt.DecorationRole]
+            )
+
+    def _thumbnailReady(self, filename):
+        row = self.row(filename)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._filenames)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self._filenames[index.row()]
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if self._checked[index.row()] else Qt.Unchecked
+        if role == Qt.DecorationRole and self._thumbnails is not None:
+            return self._thumbnails.icon(self._filenames[index.row()])
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        self._checked[index.row()] = value == Qt.Checked
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsUserCheckable
+
+    def clear(self):
+        self.beginResetModel()
+        self._filenames = []
+        self._checked = []
+        self._rows = {}
+        self.endResetModel()
+
+    def addFiles(self, files):
+        """
+            Добавляет в конец списка пары (путь, размечен ли),
+            пропуская уже добавленные пути.
+        """
+        files = [(filename, checked) for filename, checked in files]
+        new_files = []
+        seen = set()
+        for filename, checked in files:
+            if filename not in self._rows and filename not in seen:
+                seen.add(filename)
+                new_files.append((filename, checked))
+        if not new_files:
+            return
+        first = len(self._filenames)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(new_files) - 1)
+        for row, (filename, checked) in enumerate(new_files, first):
+            self._filenames.append(filename)
+            self._checked.append(bool(checked))
+            self._rows[filename] = row
+        self.endInsertRows()
+
+    def row(self, filename) -> int:
+        """Номер строки файла или -1, если его нет в списке."""
+        return self._rows.get(filename, -1)
+
+    def filename(self, row):
+        return self._filenames[row]
+
+    def filenames(self):
+        return list(self._filenames)
+
+    def isChecked(self, filename):
+        row = self.row(filename)
+        return row >= 0 and self._checked[row]
+
+    def setChecked(self, filename, checked):
+        row = self.row(filename)
+        if row < 0:
+            return
+        self.setData(
+            self.index(row), Qt.Checked if checked else Qt.Unchecked, Qt.CheckStateRole
+        )
+
+
+class FileFilterProxyModel(QtCore.QSortFilterProxyModel):
+    """Фильтрация списка файлов по регулярному выражению Python (re.search)."""
+
+    def __init__(self, parent=None):
+        super(FileFilterProxyModel, self).__init__(parent)
+        self._pattern = None
+
+    def setPattern(self, pattern):
+        """
+            pattern - регулярное выражение или пустая строка/None, чтобы
+            показать все файлы. Некорректное выражение ничего не фильтрует.
+        """
+        regex = None
+        if pattern:
+            try:
+                regex = re.compile(pattern)
+            except re.error:
+                pass
+        self._pattern = regex
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._pattern is None:
+            return True
+        return self._pattern.search(self.sourceModel().filename(source_row)) is not None
+
+
+class FileListWidget(QtWidgets.QListView):
+    """
+        Список файлов изображений на основе FileListModel.
+
+        Номера строк в методах - номера среди показанных (прошедших фильтр)
+        файлов: по ним идёт переход к следующему и предыдущему изображению.
+        Без фильтра номер строки находится по словарю модели, с фильтром -
+        через отображение QSortFilterProxyModel, без перебора строк.
+    """
+
+    itemSelectionChanged = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(FileListWidget, self).__init__(parent)
+        self._model = FileListModel(self)
+        self._proxy = FileFilterProxyModel(self)
+        self._proxy.setSourceModel(self._model)
+        self.setModel(self._proxy)
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.selectionModel().selectionChanged.connect(
+            lambda selected, deselected: self.itemSelectionChanged.emit()
+        )
+        # Настройки списка, изменённые режимом миниатюр, для возврата к нему
+        self._listState = None
+
+    def fileModel(self) -> FileListModel:
+        return self._model
+
+    def setThumbnailLoader(self, loader, icon_size=128):
+        """
+            Режим миниатюр: сетка миниатюр от loader (ThumbnailLoader)
+            с подписями. loader=None возвращает обычный список.
+        """
+        self._model.setThumbnailLoader(loader)
+        if loader is None:
+            if self._listState is not None:
+                self.setViewMode(QtWidgets.QListView.ListMode)
+                resize_mode, movement, icon_size, grid_size, elide_mode = (
+                    self._listState
+                )
+                self.setResizeMode(resize_mode)
+                self.setMovement(movement)
+                self.setIconSize(icon_size)
+                self.setGridSize(grid_size)
+                self.setTextElideMode(elide_mode)
+                self._listState = None
+            return
+        if self._listState is None:
+            self._listState = (
+                self.resizeMode(),
+                self.movement(),
+                self.iconSize(),
+                self.gridSize(),
+                self.textElideMode(),
+            )
+        self.setViewMode(QtWidgets.QListView.IconMode)
+        self.setResizeMode(QtWidgets.QListView.Adjust)
+        self.setMovement(QtWidgets.QListView.Static)
+        self.setIconSize(QtCore.QSize(icon_size, icon_size))
+        self.setGridSize(QtCore.QSize(icon_size + 16, icon_size + 40))
+        # Подпись - конец пути, то есть имя файла
+        self.setTextElideMode(Qt.ElideLeft)
+
+    def clear(self):
+        self._model.clear()
+
+    def addFiles(self, files):
+        self._model.addFiles(files)
+
+    def setFilter(self, pattern):
+        self._proxy.setPattern(pattern)
+
+    def count(self):
+        return self._proxy.rowCount()
+
+    def row(self, filename) -> int:
+        source_row = self._model.row(filename)
+        if source_row < 0:
+            return -1
+        return self._proxy.mapFromSource(self._model.index(source_row)).row()
+
+    def filename(self, row):
+        source = self._proxy.mapToSource(self._proxy.index(row, 0))
+        return self._model.filename(source.row())
+
+    def filenames(self):
+        return [self.filename(row) for row in range(self.count())]
+
+    def currentRow(self):
+        index = self.currentIndex()
+        return index.row() if index.isValid() else -1
+
+    def setCurrentRow(self, row):
+        self.setCurrentIndex(self._proxy.index(row, 0))
+
+    def selectedFilenames(self):
+        return [
+            self._model.filename(self._proxy.mapToSource(index).row())
+            for index in self.selectedIndexes()
+        ]
+
+    def setChecked(self, filename, checked):
+        self._model.setChecked(filename, checked)
@@ -8,7 +8,13 @@ from PyQt5.QtCore import (
 )
 from qtpy import QtCore, QtWidgets 
 
-import labelme.widgets.helper_text.help
+
+def _register_help_resources():
+    """
+        Регистрирует ресурсы справки (тексты и картинки) при первом
+        обращении к ним, а не при запуске программы.
+    """
+    import labelme.widgets.helper_text.help  # noqa: F401
 
 # --- Класс для отображения Markdown-подсказок ---
 
@@ -24,6 +30,7 @@ class Helper(QtWidgets.QDialog):
             Qt.WindowSystemMenuHint | Qt.WindowTitleHint | Qt.WindowCloseButtonHint
         )
         self.setWindowTitle("Справка")
+        _register_help_resources()
         
         # 1. Настройка размеров окна
         desktop = QDesktopWidget()
@@ -77,24 +84,25 @@ class HelperString:
     """
     Извлекает текст справки из ресурсов Qt. 
     Использует оригинальные имена файлов с расширением .md.
+    Каждый текст читается при первом запросе.
     """
     def __init__(self):
         # Префикс ресурса для организации файлов справки
-        resource_prefix = ":/" 
-        
-        try:
-            # Используем оригинальные названия файлов, заменяя .txt на .md
-            self.keyboard = self.__read_resource_file(resource_prefix + "keyboard.md")
-            self.letter = self.__read_resource_file(resource_prefix + "letter.md")
-            self.line = self.__read_resource_file(resource_prefix + "line.md")
-            self.main = self.__read_resource_file(resource_prefix + "main.md")
-        except Exception as e:
-            # Обработка ошибки загрузки ресурсов
-            print(f"Ошибка загрузки файлов справки: {e}") 
-            self.keyboard = "**Ошибка загрузки:** keyboard.md"
-            self.letter = "**Ошибка загрузки:** letter.md"
-            self.line = "**Ошибка загрузки:** line.md"
-            self.main = "**Ошибка загрузки:** main.md"
+        self.resource_prefix = ":/"
+        self._texts = {}
+
+    def __get_text(self, name):
+        if name not in self._texts:
+            _register_help_resources()
+            try:
+                self._texts[name] = self.__read_resource_file(
+                    self.resource_prefix + name
+                )
+            except Exception as e:
+                # Обработка ошибки загрузки ресурсов
+                print(f"Ошибка загрузки файлов справки: {e}")
+                self._texts[name] = "**Ошибка загрузки:** " + name
+        return self._texts[name]
 
     def __read_resource_file(self, path):
         """Считывает содержимое файла из ресурсов Qt с кодировкой UTF-8."""
@@ -111,13 +119,13 @@ class HelperString:
         
     # Оригинальные методы-геттеры
     def get_letter_helper(self):
-        return self.letter
+        return self.__get_text("letter.md")
     
     def get_keyboard_helper(self):
-        return self.keyboard
+        return self.__get_text("keyboard.md")
     
     def get_line_helper(self):
-        return self.line 
+        return self.__get_text("line.md")
     
     def get_main_helper(self):
-        return self.main
\ No newline at end of file
+        return self.__get_text("main.md")
\ No newline at end of file
@@ -1,3 +1,5 @@
+import collections
+
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
@@ -8,9 +10,50 @@ from qtpy.QtWidgets import QStyle
 
 # https://stackoverflow.com/a/2039745/4158863
 class HTMLDelegate(QtWidgets.QStyledItemDelegate):
-    def __init__(self, parent=None):
+    """
+        Отрисовка строк с HTML-разметкой.
+
+        Разобранные и размеченные QTextDocument хранятся в кэше по тексту
+        строки и шрифту (переноса строк нет, поэтому ширина на раскладку не
+        влияет): при прокрутке и пересчёте размеров HTML не разбирается
+        заново. Изменённый текст строки - это новый ключ, старый документ
+        вытесняется из кэша, когда тот переполнится.
+    """
+
+    def __init__(self, parent=None, cache_size=4096):
         super(HTMLDelegate, self).__init__()
-        self.doc = QtGui.QTextDocument(self)
+        self.cache_size = cache_size
+        # (текст, шрифт) -> (QTextDocument, размер строки)
+        self._documents = collections.OrderedDict()
+
+    def _document(self, text, font):
+        key = (text, font.key())
+        cached = self._documents.get(key)
+        if cached is not None:
+            self._documents.move_to_end(key)
+            return cached
+        doc = QtGui.QTextDocument()
+        doc.setDefaultFont(font)
+        doc.setHtml(text)
+
+        # 1. Для Скроллера (No Wrap)
+        # Возвращаем идеальную ширину (ширина одной строки без переноса).
+        width = int(doc.idealWidth())
+
+        # Для высоты нам нужно, чтобы она была высотой одной строки (если NoWrap)
+        # Если вы используете HTML, убедитесь, что ваш HTML не принуждает к переносу!
+        height = int(doc.size().height())
+
+        thefuckyourshitup_constant = 4
+        size = QtCore.QSize(width, height - thefuckyourshitup_constant)
+
+        cached = self._documents[key] = (doc, size)
+        if len(self._documents) > self.cache_size:
+            self._documents.popitem(last=False)
+        return cached
+
+    def clearCache(self):
+        self._documents.clear()
 
     def paint(self, painter, option, index):
         painter.save()
@@ -18,7 +61,7 @@ class HTMLDelegate(QtWidgets.QStyledItemDelegate):
         options = QtWidgets.QStyleOptionViewItem(option)
 
         self.initStyleOption(options, index)
-        self.doc.setHtml(options.text)
+        doc, _ = self._document(options.text, options.font)
         options.text = ""
 
         style = (
@@ -53,31 +96,15 @@ class HTMLDelegate(QtWidgets.QStyledItemDelegate):
 
         painter.translate(textRect.topLeft())
         painter.setClipRect(textRect.translated(-textRect.topLeft()))
-        self.doc.documentLayout().draw(painter, ctx)
+        doc.documentLayout().draw(painter, ctx)
 
         painter.restore()
 
     def sizeHint(self, option, index):
         # Получаем текст текущего элемента
-        item_text = index.data(QtCore.Qt.DisplayRole)
-        
-        # ВРЕМЕННО устанавливаем текст в QТextDocument для расчета
-        # Если этого не сделать, doc будет содержать текст предыдущего элемента
-        self.doc.setHtml(item_text)
-
-        # 1. Для Скроллера (No Wrap)
-        # Возвращаем идеальную ширину (ширина одной строки без переноса).
-        width = int(self.doc.idealWidth())
-
-        # Для высоты нам нужно, чтобы она была высотой одной строки (если NoWrap)
-        # Если вы используете HTML, убедитесь, что ваш HTML не принуждает к переносу!
-        height = int(self.doc.size().height())
-        
-        thefuckyourshitup_constant = 4
-        return QtCore.QSize(
-            width, 
-            height - thefuckyourshitup_constant
-        )
+        item_text = index.data(QtCore.Qt.DisplayRole) or ""
+        _, size = self._document(item_text, option.font)
+        return QtCore.QSize(size)
 
 
 class LabelListWidgetItem(QtGui.QStandardItem):
@@ -123,16 +150,28 @@ class LabelListWidget(QtWidgets.QListView):
     def __init__(self):
         super(LabelListWidget, self).__init__()
         self._selectedItems = []
+        # Фигура -> строка списка. Поддерживается по сигналам модели, поэтому
+        # учитывает и перетаскивание строк (модель при этом клонирует
+        # элементы: вставляет копии и удаляет старые строки).
+        self._itemsByShape = {}
 
         self.setWindowFlags(Qt.Window)
         self.setModel(StandardItemModel())
         self.model().setItemPrototype(LabelListWidgetItem())
+        self.model().rowsInserted.connect(self._rowsInserted)
+        self.model().rowsAboutToBeRemoved.connect(self._rowsAboutToBeRemoved)
+        self.model().modelReset.connect(self._rebuildShapeIndex)
         self.setItemDelegate(HTMLDelegate())
 
         self.setWordWrap(False)
         self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
         self.setResizeMode(QtWidgets.QListView.Fixed)
+        # Строки разной ширины (горизонтальная прокрутка без переноса), так
+        # что setUniformItemSizes не подходит. Вместо этого длинный список
+        # раскладывается порциями, не задерживая первую отрисовку.
+        self.setLayoutMode(QtWidgets.QListView.Batched)
+        self.setBatchSize(200)
 
         self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
@@ -173,42 +212,82 @@ class LabelListWidget(QtWidgets.QListView):
     def scrollToItem(self, item):
         self.scrollTo(self.model().indexFromItem(item))
 
+    def _rowsInserted(self, parent, first, last):
+        for row in range(first, last + 1):
+            item = self.model().item(row)
+            if item is not None and item.shape() is not None:
+                self._itemsByShape[item.shape()] = item
+
+    def _rowsAboutToBeRemoved(self, parent, first, last):
+        for row in range(first, last + 1):
+            item = self.model().item(row)
+            if item is None:
+                continue
+            # При перетаскивании копия строки уже вставлена и записана в
+            # словарь, её не трогаем
+            if self._itemsByShape.get(item.shape()) is item:
+                del self._itemsByShape[item.shape()]
+
+    def _rebuildShapeIndex(self):
+        self._itemsByShape = {
+            item.shape(): item for item in self if item.shape() is not None
+        }
+
     def addItem(self, item):
         if not isinstance(item, LabelListWidgetItem):
             raise TypeError("item must be LabelListWidgetItem")
         
-        # 1. Добавляем элемент в модель
-        self.model().setItem(self.model().rowCount(), 0, item)
-        
-        # 2. Получаем корректный QModelIndex для только что добавленного элемента
-        index = self.model().indexFromItem(item)
-        
-        # 3. Создаем пустой QStyleOptionViewItem (это требуется для sizeHint)
-        option = QtWidgets.QStyleOptionViewItem()
-        # NOTE: Обычно QListView сам устанавливает правильную ширину в option.rect,
-        # но для ручного вызова мы можем использовать текущую ширину view
-        option.rect.setWidth(self.viewport().width()) 
-        
-        # 4. Вызываем sizeHint, передавая ему корректный индекс и опцию
-        size_hint = self.itemDelegate().sizeHint(option, index)
-        
-        # 5. Устанавливаем размер
-        item.setSizeHint(size_hint)
+        self.addItems([item])
+
+    def addItems(self, items):
+        """
+            Добавляет строки в конец списка одной вставкой в модель: вид
+            пересчитывает раскладку один раз, а не после каждой строки.
+            Элементы должны быть заполнены заранее - изменения уже
+            добавленных строк вызывают itemChanged.
+
+            Размер строк не задаётся: его всё равно считает
+            HTMLDelegate.sizeHint.
+        """
+        for item in items:
+            if not isinstance(item, LabelListWidgetItem):
+                raise TypeError("item must be LabelListWidgetItem")
+        if items:
+            self.model().invisibleRootItem().appendRows(items)
 
     def removeItem(self, item):
         index = self.model().indexFromItem(item)
         self.model().removeRows(index.row(), 1)
 
+    def removeItems(self, items):
+        """Удаляет строки, объединяя соседние в один вызов removeRows."""
+        rows = sorted({item.row() for item in items}, reverse=True)
+        while rows:
+            last = first = rows.pop(0)
+            while rows and rows[0] == first - 1:
+                first = rows.pop(0)
+            self.model().removeRows(first, last - first + 1)
+
     def selectItem(self, item):
         index = self.model().indexFromItem(item)
         self.selectionModel().select(index, QtCore.QItemSelectionModel.Select)
 
+    def selectItems(self, items):
+        """
+            Выделяет строки одним обновлением модели выделения, т.е. с одним
+            сигналом itemSelectionChanged.
+        """
+        selection = QtCore.QItemSelection()
+        for item in items:
+            index = self.model().indexFromItem(item)
+            selection.select(index, index)
+        self.selectionModel().select(selection, QtCore.QItemSelectionModel.Select)
+
     def findItemByShape(self, shape):
-        for row in range(self.model().rowCount()):
-            item = self.model().item(row, 0)
-            if item.shape() == shape:
-                return item
-        raise ValueError("cannot find shape: {}".format(shape))
+        item = self._itemsByShape.get(shape)
+        if item is None:
+            raise ValueError("cannot find shape: {}".format(shape))
+        return item
 
     def clear(self):
         self.model().clear()
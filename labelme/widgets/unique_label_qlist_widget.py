@@ -11,16 +11,26 @@ from .escapable_qlist_widget import EscapableQListWidget
 class UniqueLabelQListWidget(EscapableQListWidget):
     ADDING = 10
 
+    def __init__(self, *args, **kwargs):
+        super(UniqueLabelQListWidget, self).__init__(*args, **kwargs)
+        # Метка -> строка списка
+        self._items = {}
+
+    def addItem(self, item):
+        super(UniqueLabelQListWidget, self).addItem(item)
+        self._items[item.data(Qt.UserRole)] = item
+
+    def clear(self):
+        super(UniqueLabelQListWidget, self).clear()
+        self._items = {}
+
     def mousePressEvent(self, event):
         super(UniqueLabelQListWidget, self).mousePressEvent(event)
         if not self.indexAt(event.pos()).isValid():
             self.clearSelection()
 
     def findItemByLabel(self, label):
-        for row in range(self.count()):
-            item = self.item(row)
-            if item.data(Qt.UserRole) == label:
-                return item
+        return self._items.get(label)
 
     def createItemFromLabel(self, label):
         if self.findItemByLabel(label):
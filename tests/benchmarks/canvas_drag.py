@@ -0,0 +1,76 @@
+"""
+    Замер времени кадра при перетаскивании строки внутри плотного блока текста.
+
+    Запуск: QT_QPA_PLATFORM=offscreen python tests/benchmarks/canvas_drag.py
+"""
+import random
+import time
+
+from canvas_paint import N_SHAPES
+from canvas_paint import make_shapes
+from canvas_paint import page_pixmap
+from canvas_paint import set_colors
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+from labelme.widgets.canvas import Canvas
+
+
+def mouse_event(type, canvas, point, button):
+    """Событие мыши в точке point изображения."""
+    pos = (point + canvas.offsetToCenter()) * canvas.scale
+    return QtGui.QMouseEvent(type, pos, button, button, QtCore.Qt.NoModifier)
+
+
+def select(canvas, selected):
+    for shape in canvas.selectedShapes:
+        shape.selected = False
+    canvas.selectedShapes = selected
+    for shape in selected:
+        shape.selected = True
+
+
+def main():
+    app = QtWidgets.QApplication([])  # noqa: F841
+    set_colors()
+    canvas = Canvas()
+    canvas.loadPixmap(page_pixmap())
+    canvas.setEditing(True)
+    shapes = make_shapes(N_SHAPES, random.Random(0))
+    canvas.loadShapes(shapes)
+    canvas.selectionChanged.connect(lambda selected: select(canvas, selected))
+    canvas.resize(1000, 800)
+    canvas.show()
+
+    row = shapes[2]
+    start_point = row.boundingRect().center()
+    canvas.mouseMoveEvent(
+        mouse_event(QtCore.QEvent.MouseMove, canvas, start_point, QtCore.Qt.NoButton)
+    )
+    canvas.mousePressEvent(
+        mouse_event(
+            QtCore.QEvent.MouseButtonPress, canvas, start_point, QtCore.Qt.LeftButton
+        )
+    )
+    assert canvas._moveOrigin is not None, "nothing to drag under the cursor"
+    n_frames = 50
+    start = time.perf_counter()
+    for i in range(1, n_frames + 1):
+        point = start_point + QtCore.QPointF(i, 0)
+        canvas.mouseMoveEvent(
+            mouse_event(QtCore.QEvent.MouseMove, canvas, point, QtCore.Qt.LeftButton)
+        )
+        canvas.grab()
+    elapsed = (time.perf_counter() - start) / n_frames * 1000
+    print("{} shapes: {:.1f} ms/drag frame".format(len(canvas.shapes), elapsed))
+
+    # Кадр из кэша должен совпадать с полной перерисовкой
+    cached = canvas.grab().toImage()
+    canvas.movingShape = False
+    full = canvas.grab().toImage()
+    print("cached frame matches full repaint:", cached == full)
+
+
+if __name__ == "__main__":
+    main()
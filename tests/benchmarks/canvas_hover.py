@@ -0,0 +1,62 @@
+"""
+    Замер времени наведения мыши на холст при разном количестве фигур.
+
+    Запуск: QT_QPA_PLATFORM=offscreen python tests/benchmarks/canvas_hover.py
+"""
+import random
+import time
+
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+from labelme.shape import Shape
+from labelme.widgets.canvas import Canvas
+
+WIDTH, HEIGHT = 4000, 6000
+
+
+def make_shapes(n_rows, rng):
+    text = Shape(shape_type="rectangle")
+    text.addPoint(QtCore.QPointF(0, 0))
+    text.addPoint(QtCore.QPointF(WIDTH - 1, HEIGHT - 1))
+    shapes = [text]
+    for _ in range(n_rows):
+        x, y = rng.uniform(0, WIDTH - 300), rng.uniform(0, HEIGHT - 40)
+        row = Shape(shape_type="rectangle", parent=text)
+        row.addPoint(QtCore.QPointF(x, y))
+        row.addPoint(QtCore.QPointF(x + rng.uniform(50, 300), y + 30))
+        shapes.append(row)
+    return shapes
+
+
+def bench(canvas, n_rows, n_moves=2000):
+    rng = random.Random(n_rows)
+    canvas.loadShapes(make_shapes(n_rows, rng))
+    events = [
+        QtGui.QMouseEvent(
+            QtCore.QEvent.MouseMove,
+            QtCore.QPointF(rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT)),
+            QtCore.Qt.NoButton,
+            QtCore.Qt.NoButton,
+            QtCore.Qt.NoModifier,
+        )
+        for _ in range(n_moves)
+    ]
+    start = time.perf_counter()
+    for event in events:
+        canvas.mouseMoveEvent(event)
+    return (time.perf_counter() - start) / n_moves * 1e6
+
+
+def main():
+    app = QtWidgets.QApplication([])  # noqa: F841
+    canvas = Canvas()
+    canvas.loadPixmap(QtGui.QPixmap(WIDTH, HEIGHT))
+    canvas.setEditing(True)
+    for n_rows in [100, 1000, 5000, 20000]:
+        print("{:>6} shapes: {:8.1f} us/move".format(n_rows, bench(canvas, n_rows)))
+
+
+if __name__ == "__main__":
+    main()
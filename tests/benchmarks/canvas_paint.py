@@ -0,0 +1,87 @@
+"""
+    Замер времени перерисовки холста на синтетической странице.
+
+    Запуск: QT_QPA_PLATFORM=offscreen python tests/benchmarks/canvas_paint.py
+"""
+import random
+import time
+
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+from labelme.shape import Shape
+from labelme.widgets.canvas import Canvas
+
+WIDTH, HEIGHT = 2000, 3000
+N_SHAPES = 2000
+
+
+def make_shapes(n_shapes, rng):
+    """Блоки текста со строками-прямоугольниками и многоугольниками."""
+    shapes = []
+    n_texts = n_shapes // 100
+    block_height = HEIGHT / n_texts
+    for t in range(n_texts):
+        top = t * block_height
+        text = Shape(shape_type="rectangle")
+        text.addPoint(QtCore.QPointF(10, top + 5))
+        text.addPoint(QtCore.QPointF(WIDTH - 10, top + block_height - 5))
+        shapes.append(text)
+        for r in range(99):
+            x = rng.uniform(20, WIDTH - 400)
+            y = top + 10 + r * (block_height - 20) / 99
+            row = Shape(shape_type="rectangle" if r % 2 else "polygon", parent=text)
+            if row.shape_type == "rectangle":
+                row.addPoint(QtCore.QPointF(x, y))
+                row.addPoint(QtCore.QPointF(x + 300, y + 5))
+            else:
+                for dx, dy in [(0, 0), (150, -2), (300, 0), (300, 5), (0, 5)]:
+                    row.addPoint(QtCore.QPointF(x + dx, y + dy))
+                row.close()
+            shapes.append(row)
+    return shapes
+
+
+def page_pixmap():
+    pixmap = QtGui.QPixmap(WIDTH, HEIGHT)
+    pixmap.fill(QtGui.QColor(255, 255, 255))
+    return pixmap
+
+
+def set_colors():
+    Shape.line_color = QtGui.QColor(0, 255, 0, 128)
+    Shape.fill_color = QtGui.QColor(0, 255, 0, 64)
+    Shape.select_line_color = QtGui.QColor(255, 255, 255)
+    Shape.select_fill_color = QtGui.QColor(0, 255, 0, 155)
+    Shape.vertex_fill_color = QtGui.QColor(0, 255, 0, 255)
+    Shape.hvertex_fill_color = QtGui.QColor(255, 255, 255)
+
+
+def main():
+    app = QtWidgets.QApplication([])  # noqa: F841
+    set_colors()
+    canvas = Canvas()
+    canvas.loadPixmap(page_pixmap())
+    canvas.setEditing(True)
+    canvas.loadShapes(make_shapes(N_SHAPES, random.Random(0)))
+
+    # Окно просмотра фиксированного размера, как у области прокрутки
+    viewport = QtCore.QRect(0, 0, 1000, 800)
+    for scale in [0.1, 0.3, 1.0, 4.0]:
+        canvas.scale = scale
+        canvas.resize(canvas.sizeHint().expandedTo(viewport.size()))
+        canvas.grab(viewport)  # прогрев
+        n_frames = 20
+        start = time.perf_counter()
+        for _ in range(n_frames):
+            canvas.grab(viewport)
+        elapsed = (time.perf_counter() - start) / n_frames * 1000
+        print(
+            "{} shapes, scale {:.1f}: {:6.1f} ms/paintEvent".format(
+                len(canvas.shapes), scale, elapsed
+            )
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import threading
+
+from qtpy import QtCore
+
+from labelme.autosave import AutoSaver
+from labelme.label_file import LabelFile
+from labelme.label_file import LabelFileError
+from labelme.label_file import ShapesSnapshot
+from labelme.shape import Shape
+from labelme.shape import ShapeTree
+
+
+def _save_kwargs(filename, label="a"):
+    row = {"label": label, "points": [[0, 0], [10, 10]], "shapes": []}
+    text = {"label": "", "points": [[0, 0], [20, 20]], "shapes": [row] * 500}
+    return dict(
+        filename=filename,
+        shapes=[text],
+        imagePath="page.jpg",
+        imageHeight=100,
+        imageWidth=100,
+    )
+
+
+class _RecordingLabelFile(LabelFile):
+    """LabelFile, который считает записи и может задержать первую из них."""
+
+    def __init__(self, gate=None):
+        super(_RecordingLabelFile, self).__init__()
+        self.gate = gate
+        self.saved = []
+
+    def save(self, **kwargs):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.saved.append(kwargs["shapes"][0]["shapes"][0]["label"])
+        super(_RecordingLabelFile, self).save(**kwargs)
+
+
+def test_background_save_writes_valid_json(qtbot, tmp_path):
+    saver = AutoSaver()
+    filename = str(tmp_path / "page.json")
+    label_file = LabelFile()
+    with qtbot.waitSignal(saver.saved) as blocker:
+        saver.enqueue(label_file, "page.jpg", _save_kwargs(filename))
+    assert blocker.args == [filename, "page.jpg", label_file]
+    assert saver.flush(timeout=5)
+
+    with open(filename, encoding="utf-8") as f:
+        data = json.load(f)
+    assert len(data["shapes"][0]["shapes"]) == 500
+    assert label_file.filename == filename
+    assert list(tmp_path.iterdir()) == [tmp_path / "page.json"]
+
+
+def test_burst_is_coalesced(qtbot, tmp_path):
+    saver = AutoSaver()
+    gate = threading.Event()
+    # Первая запись занимает поток, пока следующие правки стоят в очереди
+    blocker_file = _RecordingLabelFile(gate)
+    saver.enqueue(blocker_file, "other.jpg", _save_kwargs(str(tmp_path / "o.json")))
+
+    label_file = _RecordingLabelFile()
+    filename = str(tmp_path / "page.json")
+    for label in "abcde":
+        saver.enqueue(label_file, "page.jpg", _save_kwargs(filename, label))
+    assert saver.depth() == 2
+    gate.set()
+    assert saver.flush(timeout=5)
+
+    assert label_file.saved == ["e"]
+    with open(filename, encoding="utf-8") as f:
+        assert json.load(f)["shapes"][0]["shapes"][0]["label"] == "e"
+
+
+def test_failed_save_is_reported(qtbot, tmp_path):
+    class FailingLabelFile(LabelFile):
+        def save(self, **kwargs):
+            raise LabelFileError("disk full")
+
+    saver = AutoSaver()
+    filename = str(tmp_path / "page.json")
+    with qtbot.assertNotEmitted(saver.saved):
+        with qtbot.waitSignal(saver.failed) as blocker:
+            saver.enqueue(FailingLabelFile(), "page.jpg", _save_kwargs(filename))
+    assert blocker.args == [filename, "disk full"]
+    assert saver.flush(timeout=5)
+    assert saver.depth() == 0
+
+
+def test_snapshot_is_serialized_in_worker(qtbot, tmp_path):
+    tree = ShapeTree()
+    text = Shape(shape_type="polygon", tree=tree)
+    text.addPoints([(0, 0), (100, 0), (100, 50)])
+    text.other_data = {"note": ["a"]}
+    row = Shape(label="row", shape_type="polygon", parent=text)
+    row.addPoints([(10, 10), (90, 10), (90, 20)])
+
+    snapshot = ShapesSnapshot([text])
+    # Правки после снимка в файл не попадают
+    row.label = "changed"
+    row.moveBy(QtCore.QPointF(1, 1))
+    text.other_data["note"].append("b")
+
+    saver = AutoSaver()
+    filename = str(tmp_path / "page.json")
+    kwargs = dict(_save_kwargs(filename), shapes=snapshot)
+    with qtbot.waitSignal(saver.saved):
+        saver.enqueue(LabelFile(), "page.jpg", kwargs)
+    with open(filename, encoding="utf-8") as f:
+        shapes = json.load(f)["shapes"]
+    assert shapes == [
+        {
+            "note": ["a"],
+            "shapes": [
+                {
+                    "label": "row",
+                    "shapes": [],
+                    "points": [[10, 10], [90, 10], [90, 20]],
+                    "shape_type": "polygon",
+                }
+            ],
+            "points": [[0, 0], [100, 0], [100, 50]],
+            "shape_type": "polygon",
+        }
+    ]
@@ -0,0 +1,45 @@
+import os
+import re
+
+from labelme.dir_scanner import DirScanner
+from labelme.dir_scanner import scan_images
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+
+
+def test_scan_images_order_and_labels(tmp_path):
+    for name in ["10.jpg", "2.jpg", "2.json", "notes.txt", "sub/1.PNG"]:
+        _touch(tmp_path / name)
+
+    found = list(scan_images(str(tmp_path), [".jpg", ".png"]))
+    assert found == [
+        (str(tmp_path / "2.jpg"), True),
+        (str(tmp_path / "10.jpg"), False),
+        (str(tmp_path / "sub" / "1.PNG"), False),
+    ]
+
+    output_dir = tmp_path / "out"
+    _touch(output_dir / "10.json")
+    found = list(scan_images(str(tmp_path), [".jpg"], output_dir=str(output_dir)))
+    assert found == [
+        (str(tmp_path / "2.jpg"), False),
+        (str(tmp_path / "10.jpg"), True),
+    ]
+
+
+def test_scanner_streams_batches(qtbot, tmp_path):
+    for i in range(10):
+        _touch(tmp_path / "{}.jpg".format(i))
+    scanner = DirScanner(batch_size=4)
+    batches = []
+    scanner.found.connect(lambda scan_id, batch: batches.append(batch))
+
+    with qtbot.waitSignal(scanner.finished) as blocker:
+        scanner.scan(str(tmp_path), [".jpg"], pattern=re.compile(r"[^9]\.jpg$"))
+    assert blocker.args[1] == 9
+    # первое изображение отправляется сразу, отдельной пачкой
+    assert [len(batch) for batch in batches] == [1, 4, 4]
+    assert [os.path.basename(f) for f, _ in batches[0]] == ["0.jpg"]
@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+
+from labelme.ai import EfficientSam
+from labelme.ai.embedding_cache import EmbeddingCache
+
+
+def _embedding(value):
+    return np.full((1, 256), value, dtype=np.float32)  # 1024 байта
+
+
+def test_key_depends_on_content_model_and_crop():
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    key = EmbeddingCache.make_key(image, "model")
+    assert key == EmbeddingCache.make_key(image.copy(), "model")
+    assert key != EmbeddingCache.make_key(image, "other")
+    assert key != EmbeddingCache.make_key(image, "model", (0, 0, 10, 10))
+    changed = image.copy()
+    changed[5, 5, 0] = 1
+    assert key != EmbeddingCache.make_key(changed, "model")
+
+    # вид с другими шагами (как у img_qt_to_rgb) даёт тот же ключ
+    bgra = np.random.RandomState(0).randint(0, 255, (10, 12, 4)).astype(np.uint8)
+    rgb = bgra[:, 1:11, 2::-1]
+    assert EmbeddingCache.make_key(rgb, "model") == EmbeddingCache.make_key(
+        rgb.copy(), "model"
+    )
+
+
+def test_memory_budget_evicts_least_recently_used():
+    cache = EmbeddingCache(memory_budget=2048)
+    cache.put("a", _embedding(1))
+    cache.put("b", _embedding(2))
+    assert cache.get("a") is not None  # "b" становится самым старым
+    cache.put("c", _embedding(3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.memorySize() == 2048
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    cache = EmbeddingCache(memory_budget=1024, cache_dir=str(tmp_path))
+    cache.put("a", _embedding(1))
+    cache.put("b", _embedding(2))
+
+    cache = EmbeddingCache(memory_budget=1024, cache_dir=str(tmp_path))
+    loaded = cache.get("a")
+    assert isinstance(loaded, np.memmap)
+    np.testing.assert_array_equal(loaded, _embedding(1))
+    assert cache.get("missing") is None
+
+
+def test_disk_budget_removes_oldest_files(tmp_path):
+    cache = EmbeddingCache(cache_dir=str(tmp_path), disk_budget=2500)
+    for key in "abc":
+        cache.put(key, _embedding(1))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.npy", "c.npy"]
+
+
+def test_model_reuses_cached_embedding(monkeypatch):
+    cache = EmbeddingCache()
+    monkeypatch.setattr("labelme.ai.efficient_sam.get_embedding_cache", lambda: cache)
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    cache.put(EmbeddingCache.make_key(image, EfficientSam.name), _embedding(7))
+
+    model = EfficientSam(encoder_path=None, decoder_path=None)
+    model.set_image(image)
+    # Эмбеддинг ждут одновременно UI-поток и поток предпросмотра
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(model.wait_for_image_embedding())
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    for result in results:
+        np.testing.assert_array_equal(result, _embedding(7))
+    assert model._thread is None
@@ -0,0 +1,182 @@
+import numpy as np
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme.image_pyramid import ImagePyramid
+from labelme.utils import img_arr_to_qt
+from labelme.utils import img_qt_to_rgb
+
+
+def _image(width, height):
+    rng = np.random.RandomState(0)
+    arr = rng.randint(0, 256, size=(height, width, 3), dtype=np.uint8)
+    return img_arr_to_qt(arr).convertToFormat(QtGui.QImage.Format_RGB32)
+
+
+def test_levels():
+    pyramid = ImagePyramid(_image(1000, 300), tile_size=128)
+    assert pyramid.levelSize(0) == (1000, 300)
+    assert pyramid.levelSize(1) == (500, 150)
+    assert pyramid.levelSize(3) == (125, 38)
+    assert pyramid.max_level == 3
+
+    assert pyramid.levelFor(2.0) == 0
+    assert pyramid.levelFor(0.5) == 0
+    assert pyramid.levelFor(0.3) == 1
+    assert pyramid.levelFor(0.25) == 2
+    assert pyramid.levelFor(0.01) == 3
+
+
+def test_tiles_match_downscaled_image(qapp):
+    image = _image(1000, 300)
+    pyramid = ImagePyramid(image, tile_size=128)
+    for level in (1, 2, 3):
+        width, height = pyramid.levelSize(level)
+        columns = -(-width // 128)
+        rows = -(-height // 128)
+        # Собранные вместе тайлы совпадают по размеру с уровнем и близки
+        # к уменьшенному целиком изображению
+        canvas = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+        painter = QtGui.QPainter(canvas)
+        for row in range(rows):
+            for column in range(columns):
+                tile = pyramid.tile(level, column, row)
+                assert tile.width() == min(128, width - column * 128)
+                assert tile.height() == min(128, height - row * 128)
+                painter.drawImage(column * 128, row * 128, tile)
+        painter.end()
+        expected = image.scaled(
+            width, height, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+        )
+        diff = np.abs(
+            img_qt_to_rgb(canvas).astype(int) - img_qt_to_rgb(expected).astype(int)
+        )
+        assert diff[2:-2, 2:-2].mean() < 8
+
+
+def test_budget_evicts_least_recently_used(qapp):
+    pyramid = ImagePyramid(_image(1024, 1024), tile_size=128)
+    tile_bytes = pyramid.tile(1, 0, 0).sizeInBytes()
+    pyramid.budget = tile_bytes * 2
+    pyramid.tile(1, 1, 0)
+    pyramid.tile(1, 0, 0)
+    pyramid.tile(1, 2, 0)  # вытесняет (1, 1, 0)
+    assert pyramid.memorySize() <= pyramid.budget
+    assert set(pyramid._tiles) == {(1, 0, 0), (1, 2, 0)}
+
+    pyramid.clear()
+    assert pyramid.memorySize() == 0
+
+
+def test_draw_uses_only_visible_tiles(qapp):
+    image = _image(1024, 1024)
+    pyramid = ImagePyramid(image, tile_size=128)
+    target = QtGui.QImage(64, 64, QtGui.QImage.Format_RGB32)
+    painter = QtGui.QPainter(target)
+    painter.scale(0.25, 0.25)
+    pyramid.draw(painter, QtCore.QRectF(0, 0, 256, 256), scale=0.25)
+    painter.end()
+    # Область 256x256 на уровне 2 - один тайл
+    assert set(pyramid._tiles) == {
+        (1, 0, 0), (1, 1, 0), (1, 0, 1), (1, 1, 1), (2, 0, 0)
+    }
+    expected = image.copy(0, 0, 256, 256).scaled(
+        64, 64, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+    )
+    diff = np.abs(
+        img_qt_to_rgb(target).astype(int) - img_qt_to_rgb(expected).astype(int)
+    )
+    assert diff[2:-2, 2:-2].mean() < 8
+
+    # При масштабе от 1/2 рисуется само изображение, тайлы не строятся
+    pyramid.clear()
+    painter = QtGui.QPainter(target)
+    pyramid.draw(painter, QtCore.QRectF(0, 0, 64, 64), scale=1.0)
+    painter.end()
+    assert pyramid.memorySize() == 0
+    np.testing.assert_array_equal(
+        img_qt_to_rgb(target), img_qt_to_rgb(image.copy(0, 0, 64, 64))
+    )
+
+
+def test_preview_is_base_level(qapp):
+    image = _image(1000, 300)
+    preview = image.scaled(
+        250, 75, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+    )
+    pyramid = ImagePyramid(preview, tile_size=128, size=image.size())
+    assert (pyramid.width(), pyramid.height()) == (1000, 300)
+    assert pyramid.base_level == 2
+    assert pyramid.max_level == 3
+    assert pyramid.tile(3, 0, 0).size() == QtCore.QSize(125, 38)
+
+    # При крупном масштабе рисуется растянутая копия
+    target = QtGui.QImage(100, 100, QtGui.QImage.Format_RGB32)
+    painter = QtGui.QPainter(target)
+    pyramid.draw(painter, QtCore.QRectF(0, 0, 100, 100), scale=1.0)
+    painter.end()
+    expected = preview.copy(0, 0, 25, 25).scaled(100, 100)
+    diff = np.abs(
+        img_qt_to_rgb(target).astype(int) - img_qt_to_rgb(expected).astype(int)
+    )
+    assert diff.mean() < 8
+
+
+class _Source(object):
+    """Источник областей из изображения в памяти, с учётом запросов."""
+
+    def __init__(self, image):
+        self.image = image
+        self.reads = []
+
+    def read(self, rect, size=None):
+        self.reads.append(rect)
+        region = self.image.copy(rect)
+        if size is None or size == rect.size():
+            return region
+        return region.scaled(
+            size, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+        )
+
+
+def test_detail_tiles_are_read_from_source(qapp):
+    image = _image(1000, 600)
+    preview = image.scaled(
+        250, 150, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+    )
+    source = _Source(image)
+    pyramid = ImagePyramid(preview, tile_size=128, size=image.size(), source=source)
+    assert pyramid.base_level == 2
+
+    def draw():
+        target = QtGui.QImage(200, 200, QtGui.QImage.Format_RGB32)
+        painter = QtGui.QPainter(target)
+        painter.translate(-300, -200)
+        missing = pyramid.draw(painter, QtCore.QRectF(300, 200, 200, 200), 1.0)
+        painter.end()
+        return target, missing
+
+    # Пока полос нет, рисуется копия, а полосы запрашиваются один раз
+    _, missing = draw()
+    assert missing == [(0, 1), (0, 2), (0, 3)]
+    assert draw()[1] == []
+    for level, row in missing:
+        rect, size = pyramid.stripRegion(level, row)
+        assert rect == QtCore.QRect(0, row * 128, 1000, 128)
+        pyramid.addStrip(level, row, source.read(rect, size))
+    assert len(pyramid._tiles) == 3 * 8
+
+    target, missing = draw()
+    assert missing == []
+    np.testing.assert_array_equal(
+        img_qt_to_rgb(target), img_qt_to_rgb(image.copy(300, 200, 200, 200))
+    )
+
+    # Тайлы из источника вытесняются из того же кэша и читаются заново
+    pyramid.budget = 4 * 128 * 128 * 4
+    rect, size = pyramid.stripRegion(1, 0)
+    assert size == QtCore.QSize(500, 128)
+    pyramid.addStrip(1, 0, source.read(rect, size))
+    assert pyramid.memorySize() <= pyramid.budget
+    assert set(pyramid._tiles) == {(1, column, 0) for column in range(4)}
+    assert draw()[1] == [(0, 1), (0, 2), (0, 3)]
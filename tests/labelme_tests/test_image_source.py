@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme.image_source import ImageSource
+from labelme.image_source import TileReader
+from labelme.utils import img_arr_to_qt
+from labelme.utils import img_qt_to_rgb
+
+
+def _encoded(fmt, width=700, height=500):
+    yy, xx = np.mgrid[0:height, 0:width]
+    arr = np.stack([xx % 256, yy % 256, (xx + yy) // 4 % 256], axis=-1)
+    image = img_arr_to_qt(arr.astype(np.uint8)).copy()
+    data = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(data)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, fmt, 95)
+    return bytes(data)
+
+
+def _diff(a, b):
+    return np.abs(img_qt_to_rgb(a).astype(int) - img_qt_to_rgb(b).astype(int))
+
+
+@pytest.mark.parametrize("fmt", ["JPG", "PNG"])
+def test_read_matches_full_decode(qapp, fmt):
+    data = _encoded(fmt)
+    full = QtGui.QImage.fromData(data)
+    source = ImageSource(data)
+    assert source.isValid()
+    assert source.size() == QtCore.QSize(700, 500)
+    # Частичное декодирование есть только у JPEG
+    assert source._clip == (fmt == "JPG")
+
+    rect = QtCore.QRect(300, 200, 256, 256)
+    region = source.read(rect)
+    assert region.size() == rect.size()
+    assert _diff(region, full.copy(rect)).max() == 0
+
+    rect = QtCore.QRect(0, 256, 700, 244)
+    size = QtCore.QSize(175, 61)
+    region = source.read(rect, size)
+    assert region.size() == size
+    expected = full.copy(rect).scaled(
+        size, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+    )
+    assert _diff(region, expected)[2:-2, 2:-2].mean() < 4
+
+
+def test_invalid_data(qapp):
+    source = ImageSource(b"not an image")
+    assert not source.isValid()
+    assert source.read(QtCore.QRect(0, 0, 10, 10)).isNull()
+
+
+def test_tile_reader(qtbot):
+    source = ImageSource(_encoded("JPG"))
+    reader = TileReader()
+    rect = QtCore.QRect(0, 0, 700, 256)
+    with qtbot.waitSignal(reader.loaded) as blocker:
+        reader.read(source, (0, 0), rect)
+    assert blocker.args[:2] == [source, (0, 0)]
+    assert blocker.args[2].size() == rect.size()
@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+
+from labelme.ai import PredictionWorker
+
+
+class _FakeModel:
+    """Модель, декодер которой ждёт разрешения из теста."""
+
+    def __init__(self):
+        self.decoded = []
+        self.release = threading.Event()
+
+    def wait_for_image_embedding(self):
+        return None
+
+    def predict_mask_from_points(self, points, point_labels):
+        self.release.wait(timeout=5)
+        self.decoded.append(points)
+        mask = np.zeros((20, 20), dtype=bool)
+        x, y = points[-1]
+        mask[y : y + 5, x : x + 5] = True
+        return mask
+
+
+def test_only_latest_request_is_delivered(qtbot):
+    model = _FakeModel()
+    worker = PredictionWorker(model)
+    results = []
+    worker.predicted.connect(lambda request_id, polygon: results.append(request_id))
+
+    worker.request([[1, 1]], [1])
+    request_ids = [worker.request([[i, i]], [1]) for i in range(2, 6)]
+    model.release.set()
+
+    qtbot.waitUntil(lambda: request_ids[-1] in results)
+    # Первый запрос мог уже начаться, но его результат устарел
+    assert results == [request_ids[-1]]
+    assert model.decoded[-1] == [[5, 5]]
+    assert len(model.decoded) <= 2
+
+    stats = worker.latency()
+    assert stats["decoder"][0] == len(model.decoded)
+    assert stats["cancelled"] >= 4
+
+
+def test_cancel_drops_result(qtbot):
+    model = _FakeModel()
+    worker = PredictionWorker(model)
+    results = []
+    worker.predicted.connect(lambda request_id, polygon: results.append(request_id))
+
+    worker.request([[3, 3]], [1])
+    worker.cancel()
+    model.release.set()
+    request_id = worker.request([[4, 4]], [1])
+    qtbot.waitUntil(lambda: request_id in results)
+    assert results == [request_id]
@@ -0,0 +1,121 @@
+import os
+import os.path as osp
+import shutil
+
+from labelme.label_file import LabelFile
+from labelme.label_file import LabelFileError
+from labelme.prefetch import PagePrefetcher
+from labelme.prefetch import read_page
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "data")
+
+
+def _copy_pages(tmp_path, count):
+    image_file = osp.join(data_dir, "raw/2011_000003.jpg")
+    filenames = []
+    for i in range(count):
+        filename = str(tmp_path / "{}.jpg".format(i))
+        shutil.copy(image_file, filename)
+        filenames.append(filename)
+    return filenames
+
+
+def _label_file(filename):
+    return osp.splitext(filename)[0] + ".json"
+
+
+def _wait_idle(prefetcher):
+    with prefetcher._condition:
+        prefetcher._condition.wait_for(
+            lambda: not prefetcher._pending and not prefetcher._loading, 5
+        )
+
+
+def test_read_page_with_label_file(tmp_path):
+    (filename,) = _copy_pages(tmp_path, 1)
+    LabelFile().save(
+        filename=_label_file(filename),
+        shapes=[],
+        imagePath=osp.basename(filename),
+        imageHeight=1,
+        imageWidth=1,
+    )
+    page = read_page(filename, _label_file(filename))
+    assert page.error is None
+    assert page.label_file is not None
+    assert not page.image.isNull()
+
+    with open(_label_file(filename), "w") as f:
+        f.write("{")
+    page = read_page(filename, _label_file(filename))
+    assert isinstance(page.error, LabelFileError)
+
+
+def test_prefetched_page_is_taken_once(tmp_path):
+    filenames = _copy_pages(tmp_path, 3)
+    prefetcher = PagePrefetcher()
+    prefetcher.prefetch([(f, _label_file(f)) for f in filenames])
+    _wait_idle(prefetcher)
+
+    for filename in filenames:
+        page = prefetcher.take(filename, _label_file(filename))
+        assert page is not None
+        assert page.label_file is None
+        assert not page.image.isNull()
+    assert prefetcher.take(filenames[0], _label_file(filenames[0])) is None
+
+
+def test_changed_file_is_not_taken(tmp_path):
+    (filename,) = _copy_pages(tmp_path, 1)
+    prefetcher = PagePrefetcher()
+    prefetcher.prefetch([(filename, _label_file(filename))])
+    _wait_idle(prefetcher)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert prefetcher.take(filename, _label_file(filename)) is None
+
+
+def test_budget_and_cancel(tmp_path):
+    filenames = _copy_pages(tmp_path, 4)
+    page_size = read_page(filenames[0], _label_file(filenames[0])).nbytes
+    prefetcher = PagePrefetcher(workers=1, budget=2 * page_size)
+
+    prefetcher.prefetch([(f, _label_file(f)) for f in filenames])
+    _wait_idle(prefetcher)
+    assert list(prefetcher._pages) == filenames[2:]
+
+    prefetcher.clear()
+    prefetcher.cancel()
+    prefetcher.prefetch([])
+    assert not prefetcher._pending
+
+
+def test_read_page_draft(tmp_path):
+    (filename,) = _copy_pages(tmp_path, 1)
+    full = read_page(filename, _label_file(filename))
+    assert not full.isPreview()
+
+    page = read_page(filename, _label_file(filename), draft_size=(100, 100))
+    assert page.isPreview()
+    assert page.size == full.image.size()
+    assert page.image.width() < full.image.width()
+    assert page.image_data == full.image_data
+    assert page.source.size() == page.size
+
+
+def test_read_page_reduced(tmp_path):
+    (filename,) = _copy_pages(tmp_path, 1)
+    full = read_page(filename, _label_file(filename))
+    assert full.source is None
+
+    # Страница больше max_image_size читается уменьшенной в 2**k раз
+    nbytes = full.image.width() * full.image.height() * 4
+    page = read_page(filename, _label_file(filename), max_image_size=nbytes // 5)
+    assert page.isPreview()
+    assert page.size == full.image.size()
+    assert page.image.width() == -(-full.image.width() // 4)
+    assert page.source.size() == page.size
+
+    page = read_page(filename, _label_file(filename), max_image_size=nbytes)
+    assert not page.isPreview()
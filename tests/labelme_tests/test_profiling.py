@@ -0,0 +1,41 @@
+import subprocess
+import sys
+
+from labelme.profiling import StartupProfiler
+
+
+def test_startup_profiler(tmp_path, monkeypatch):
+    (tmp_path / "profiled_module.py").write_text("import json\nVALUE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "profiled_module", raising=False)
+
+    profiler = StartupProfiler()
+    profiler.install()
+    try:
+        with profiler.stage("imports"):
+            import profiled_module  # noqa: F401
+    finally:
+        profiler.uninstall()
+    assert profiler._imports["profiled_module"][1] == 1
+
+    # После uninstall импорты не замеряются
+    monkeypatch.delitem(sys.modules, "profiled_module")
+    import profiled_module  # noqa: F401,F811
+
+    assert profiler._imports["profiled_module"][1] == 1
+
+    report = profiler.report()
+    assert "imports" in report
+    assert "total" in report
+    assert "profiled_module" in report
+
+
+def test_app_import_defers_heavy_modules():
+    # Модули моделей и их зависимости загружаются при первом использовании
+    code = (
+        "import sys, labelme.app; "
+        "print(sorted(m for m in ('labelme.ai', 'gdown', 'imgviz', 'natsort') "
+        "if m in sys.modules))"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == "[]"
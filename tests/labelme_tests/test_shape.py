@@ -0,0 +1,188 @@
+import numpy as np
+import pytest
+from qtpy import QtCore
+from qtpy import QtGui
+
+import labelme.utils
+from labelme.shape import Shape
+from labelme.shape import ShapeClass
+from labelme.shape import ShapeTree
+
+
+def _polygon(points):
+    shape = Shape(shape_type="polygon")
+    for x, y in points:
+        shape.addPoint(QtCore.QPointF(x, y))
+    shape.close()
+    return shape
+
+
+def test_cached_geometry_is_invalidated():
+    shape = _polygon([(0, 0), (10, 0), (10, 10)])
+    assert shape.getBounds() == (0, 0, 10, 10)
+    assert shape.containsPoint(QtCore.QPointF(8, 2))
+
+    shape.moveBy(QtCore.QPointF(100, 0))
+    assert shape.getBounds() == (100, 0, 110, 10)
+    assert not shape.containsPoint(QtCore.QPointF(8, 2))
+
+    shape[2] = QtCore.QPointF(110, 50)
+    assert shape.boundingRect().bottom() == 50
+
+    shape.insertPoint(1, QtCore.QPointF(50, -20))
+    assert shape.getBounds()[1] == -20
+
+    shape.moveVertexBy(1, QtCore.QPointF(0, -10))
+    assert shape.getBounds()[1] == -30
+
+    shape.removePoint(1)
+    assert shape.getBounds() == (100, 0, 110, 50)
+
+
+def test_paint_paths_follow_scale():
+    shape = _polygon([(0, 0), (10, 0), (10, 10)])
+    line_path, _ = shape._paintPaths()
+    assert shape._paintPaths()[0] is line_path
+
+    shape.scale = 2.0
+    assert shape._paintPaths()[0].boundingRect().right() == 20
+
+
+def test_mask_paint_cache():
+    fill_color, select_fill_color = Shape.fill_color, Shape.select_fill_color
+    Shape.fill_color = QtGui.QColor(0, 255, 0, 64)
+    Shape.select_fill_color = QtGui.QColor(0, 255, 0, 155)
+    try:
+        mask = np.zeros((20, 30), dtype=bool)
+        mask[5:15, 10:20] = True
+        shape = Shape(shape_type="mask", mask=mask)
+        shape.scale = 1.0
+        shape.addPoint(QtCore.QPointF(0, 0))
+        shape.addPoint(QtCore.QPointF(30, 20))
+
+        image, path = shape._maskPaintCache()
+        assert shape._maskPaintCache()[0] is image
+        assert image.pixelColor(15, 10).alpha() == 64
+        assert path.boundingRect().contains(QtCore.QPointF(15, 10))
+
+        shape.selected = True
+        assert shape._maskPaintCache()[0].pixelColor(15, 10).alpha() == 155
+
+        shape.mask = np.zeros((20, 30), dtype=bool)
+        assert shape._maskPaintCache()[0].pixelColor(15, 10).alpha() == 0
+    finally:
+        Shape.fill_color = fill_color
+        Shape.select_fill_color = select_fill_color
+
+
+def _nearest_reference(shape, point, epsilon):
+    # Прежний перебор вершин и рёбер по одной точке
+    scale = shape.scale
+    p = QtCore.QPointF(point.x() * scale, point.y() * scale)
+    points = [QtCore.QPointF(q.x() * scale, q.y() * scale) for q in shape.points]
+    vertex = edge = None
+    min_vertex = min_edge = float("inf")
+    for i, q in enumerate(points):
+        dist = labelme.utils.distance(q - p)
+        if dist <= epsilon and dist < min_vertex:
+            min_vertex, vertex = dist, i
+        dist = labelme.utils.distancetoline(p, [points[i - 1], q])
+        if dist <= epsilon and dist < min_edge:
+            min_edge, edge = dist, i
+    return vertex, edge
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_nearest_vertex_and_edge_match_reference():
+    rng = np.random.RandomState(0)
+    shape = _polygon(rng.uniform(0, 100, size=(12, 2)).tolist())
+    shape.insertPoint(3, shape[3])  # вырожденное ребро
+    shape.scale = 1.5
+    for x, y in rng.uniform(-10, 110, size=(200, 2)).tolist():
+        point = QtCore.QPointF(x, y)
+        assert (
+            shape.nearestVertex(point, 10),
+            shape.nearestEdge(point, 10),
+        ) == _nearest_reference(shape, point, 10)
+
+
+def test_points_view():
+    shape = _polygon([(0, 0), (10, 0), (10, 10)])
+    assert isinstance(shape.coords, np.ndarray)
+    assert shape.coords.tolist() == [[0, 0], [10, 0], [10, 10]]
+    assert shape.points[1:] == [QtCore.QPointF(10, 0), QtCore.QPointF(10, 10)]
+
+    point = shape[0]
+    point.setX(5)  # копия, фигура не меняется
+    assert shape[0] == QtCore.QPointF(0, 0)
+
+    shape.points.append(QtCore.QPointF(0, 20))
+    assert shape.getBounds() == (0, 0, 10, 20)
+    assert shape.popPoint() == QtCore.QPointF(0, 20)
+    assert shape.getBounds() == (0, 0, 10, 10)
+
+    other = Shape(shape_type="polygon")
+    other.points = shape.points  # массив не копируется, он неизменяемый
+    raw = shape.coords
+    shape.moveBy(QtCore.QPointF(1, 2))
+    assert other.coords is raw
+    assert shape.coords.tolist() == [[1, 2], [11, 2], [11, 12]]
+
+
+def test_add_points_matches_add_point():
+    points = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+    expected = _polygon(points)
+    shape = Shape(shape_type="polygon")
+    shape.addPoints(points)
+    # Повтор первой вершины замыкает фигуру и не добавляется
+    assert shape.isClosed()
+    assert shape.coords.tolist() == expected.coords.tolist()
+    assert shape.point_labels == expected.point_labels == [1] * 4
+
+    shape = Shape(shape_type="polygon")
+    shape.addPoints(np.array(points[:2], dtype=float))
+    shape.addPoints([(10, 10), (0, 0)])
+    assert shape.isClosed()
+    assert shape.coords.tolist() == [[0, 0], [10, 0], [10, 10]]
+    assert shape.getBounds() == (0, 0, 10, 10)
+
+
+def test_shape_tree():
+    tree = ShapeTree()
+    text = Shape(tree=tree)
+    rows = [Shape(parent=text) for _ in range(3)]
+    other = Shape()
+    other_row = Shape(parent=other)
+
+    assert text.tree is tree and rows[0].tree is tree
+    assert rows[1].parent is text and text.parent is None
+    assert text.getChildren() == rows
+    assert text.getAllChildren() == rows
+    assert tree.parents().tolist() == [-1, 0, 0, 0]
+    assert tree.classes().tolist() == [ShapeClass.TEXT.value] + [
+        ShapeClass.ROW.value
+    ] * 3
+
+    rows[1].delete()  # родитель запоминается для отмены
+    assert text.getChildren() == [rows[0], rows[2]]
+    assert rows[1].parent is text
+    text._insertChild(1, rows[1])
+    assert text.getChildren() == rows
+
+    tree.adopt(other)
+    assert other.tree is tree and other_row.tree is tree
+    assert other_row.parent is other and other_row.getClass() == ShapeClass.ROW
+    assert ShapeTree.of([text, other, other_row] + rows) is tree
+    assert other_row.isDescendantOf(other) and not other_row.isDescendantOf(text)
+    assert tree.filterDescendants([other_row, text] + rows, text) == rows
+
+
+def test_style_defaults_and_overrides():
+    shape = Shape()
+    assert not hasattr(shape, "__dict__")
+    Shape.line_color = QtGui.QColor(1, 2, 3)
+    assert shape.line_color == QtGui.QColor(1, 2, 3)
+    shape.line_color = QtGui.QColor(4, 5, 6)
+    assert Shape.line_color == QtGui.QColor(1, 2, 3)
+    assert shape.line_color == QtGui.QColor(4, 5, 6)
+    Shape.line_color = None
@@ -0,0 +1,73 @@
+import random
+
+from qtpy import QtCore
+
+from labelme.shape import Shape
+from labelme.spatial_index import ShapeGridIndex
+
+
+def _rectangle(x1, y1, x2, y2, parent=None):
+    shape = Shape(shape_type="rectangle", parent=parent)
+    shape.addPoint(QtCore.QPointF(x1, y1))
+    shape.addPoint(QtCore.QPointF(x2, y2))
+    return shape
+
+
+def _brute_force(shapes, point, margin):
+    found = []
+    for shape in reversed(shapes):
+        rect = shape.boundingRect()
+        if (
+            rect.left() - margin <= point.x() <= rect.right() + margin
+            and rect.top() - margin <= point.y() <= rect.bottom() + margin
+        ):
+            found.append(shape)
+    return found
+
+
+def test_query_matches_brute_force():
+    rng = random.Random(0)
+    text = _rectangle(0, 0, 4000, 4000)
+    shapes = [text]
+    for _ in range(500):
+        x, y = rng.uniform(0, 3900), rng.uniform(0, 3900)
+        shapes.append(_rectangle(x, y, x + rng.uniform(5, 100), y + 20, parent=text))
+
+    index = ShapeGridIndex(cell_size=128)
+    index.rebuild(shapes)
+    for _ in range(200):
+        point = QtCore.QPointF(rng.uniform(-50, 4050), rng.uniform(-50, 4050))
+        assert index.query(point, 3.0) == _brute_force(shapes, point, 3.0)
+
+
+def test_incremental_updates():
+    text = _rectangle(0, 0, 100, 100)
+    row = _rectangle(10, 10, 90, 20, parent=text)
+    shapes = [text, row]
+    index = ShapeGridIndex(cell_size=16)
+    index.rebuild(shapes)
+    assert index.query(QtCore.QPointF(50, 15)) == [row, text]
+
+    text.moveBy(QtCore.QPointF(500, 0))
+    index.update([text] + text.getAllChildren())
+    assert index.query(QtCore.QPointF(50, 15)) == []
+    assert index.query(QtCore.QPointF(550, 15)) == [row, text]
+
+    shapes.remove(row)
+    index.remove(row)
+    assert index.query(QtCore.QPointF(550, 15)) == [text]
+
+    extra = _rectangle(540, 10, 560, 20)
+    shapes.append(extra)
+    index.insert(extra)
+    assert index.query(QtCore.QPointF(550, 15)) == [extra, text]
+
+
+def test_intersecting_returns_paint_order():
+    text = _rectangle(0, 0, 1000, 1000)
+    rows = [_rectangle(10, 100 * i, 500, 100 * i + 50, parent=text) for i in range(10)]
+    shapes = [text] + rows
+    index = ShapeGridIndex(cell_size=64)
+    index.rebuild(shapes)
+    assert index.intersecting(0, 120, 1000, 260) == [text, rows[1], rows[2]]
+    assert index.intersecting(600, 0, 700, 1000) == [text]
@@ -0,0 +1,141 @@
+import json
+import os
+import os.path as osp
+import shutil
+import threading
+
+from labelme import utils
+from labelme.thumbnails import ThumbnailCache
+from labelme.thumbnails import ThumbnailLoader
+from labelme.thumbnails import make_thumbnail
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "data")
+
+
+def _copy_image(tmp_path):
+    filename = str(tmp_path / "page.jpg")
+    shutil.copy(osp.join(data_dir, "raw/2011_000003.jpg"), filename)
+    return filename
+
+
+def _write_labels(filename):
+    row = {"label": "a", "points": [[100, 100], [300, 150]], "shapes": []}
+    text = {"points": [[50, 50], [400, 300]], "shapes": [row]}
+    with open(osp.splitext(filename)[0] + ".json", "w") as f:
+        json.dump({"shapes": [text]}, f)
+
+
+def test_make_thumbnail(tmp_path):
+    filename = _copy_image(tmp_path)  # 500x338
+    image = make_thumbnail(filename, 100)
+    assert (image.width(), image.height()) == (100, 67)
+
+    _write_labels(filename)
+    overlay = make_thumbnail(filename, 100, osp.splitext(filename)[0] + ".json")
+    assert overlay.size() == image.size()
+    # Рамка текста проходит через (10, 20) на миниатюре
+    assert overlay.pixelColor(10, 20) != image.pixelColor(10, 20)
+
+    assert make_thumbnail(str(tmp_path / "missing.jpg"), 100).isNull()
+
+
+def test_cache_checks_stamp(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache" / "thumbnails.sqlite"))
+    cache.put("a.jpg", (1, 10), "256", b"data")
+    assert cache.get("a.jpg", (1, 10), "256") == b"data"
+    assert cache.get("a.jpg", (2, 10), "256") is None
+    assert cache.get("a.jpg", (1, 10), "128") is None
+    assert cache.get("b.jpg", (1, 10), "256") is None
+    cache.close()
+
+    # Записи сохраняются между запусками
+    cache = ThumbnailCache(str(tmp_path / "cache" / "thumbnails.sqlite"))
+    assert cache.get("a.jpg", (1, 10), "256") == b"data"
+
+    cache.disk_budget = 5
+    for i in range(100):
+        cache.put("{}.jpg".format(i), (1, 10), "256", b"data")
+    assert cache.get("99.jpg", (1, 10), "256") == b"data"
+    assert cache.get("a.jpg", (1, 10), "256") is None
+    cache.close()
+
+
+def test_loader_uses_cache(qtbot, tmp_path):
+    filename = _copy_image(tmp_path)
+    cache = ThumbnailCache(str(tmp_path / "thumbnails.sqlite"))
+    loader = ThumbnailLoader(cache, size=64)
+    assert loader.icon(filename) is None
+    with qtbot.waitSignal(loader.ready) as blocker:
+        pass
+    assert blocker.args == [filename]
+    assert not loader.icon(filename).isNull()
+
+    stat = os.stat(filename)
+    assert cache.get(filename, (stat.st_mtime_ns, stat.st_size), "64") is not None
+    assert loader.load(filename).width() == 64
+
+    # Разметка изменилась: миниатюра с рамками готовится заново
+    loader.overlay = True
+    _write_labels(filename)
+    loader.invalidate(filename)
+    assert loader.icon(filename) is not None  # старая, пока нет новой
+    with qtbot.waitSignal(loader.ready):
+        pass
+    assert filename not in loader._stale
+    cache.close()
+
+
+def test_failed_file_is_not_requested_again(qtbot, tmp_path):
+    filename = str(tmp_path / "page.jpg")
+    with open(filename, "wb") as f:
+        f.write(b"not an image")
+    loader = ThumbnailLoader(size=64)
+    loads = []
+    load = loader.load
+    loader.load = lambda path: loads.append(path) or load(path)
+
+    assert loader.icon(filename) is None
+    qtbot.waitUntil(lambda: filename in loader._failed)
+    for _ in range(3):  # перерисовки списка
+        assert loader.icon(filename) is None
+    assert not loader._pending and loads == [filename]
+
+    # Файл заменили: он читается заново
+    shutil.copy(osp.join(data_dir, "raw/2011_000003.jpg"), filename)
+    with qtbot.waitSignal(loader.ready):
+        assert loader.icon(filename) is None
+    assert loader.icon(filename) is not None
+    assert len(loads) == 2
+
+
+def test_invalidate_during_load_is_not_lost(qtbot, tmp_path):
+    filename = _copy_image(tmp_path)
+    label_file = osp.splitext(filename)[0] + ".json"
+    loader = ThumbnailLoader(size=64, overlay=True)
+    with qtbot.waitSignal(loader.ready):
+        loader.icon(filename)
+
+    started = threading.Event()
+    release = threading.Event()
+    label_stamps = []
+    load = loader.load
+
+    def slow_load(path):
+        label_stamps.append(utils.file_stamp(label_file))
+        started.set()
+        release.wait(5)
+        return load(path)
+
+    loader.load = slow_load
+    loader.invalidate(filename)
+    loader.icon(filename)
+    assert started.wait(5)
+    # Разметка сохранена, пока строится миниатюра по старой
+    _write_labels(filename)
+    loader.invalidate(filename)
+    release.set()
+
+    qtbot.waitUntil(lambda: filename not in loader._stale)
+    assert len(label_stamps) == 2
+    assert label_stamps[0] is None and label_stamps[1] is not None
@@ -0,0 +1,96 @@
+from qtpy import QtCore
+
+from labelme.shape import Shape
+from labelme.undo import CreateShapesCommand
+from labelme.undo import DeleteShapesCommand
+from labelme.undo import MoveShapesCommand
+from labelme.undo import MoveVertexCommand
+from labelme.undo import UndoStack
+
+
+def _rectangle(x1, y1, x2, y2, parent=None):
+    shape = Shape(shape_type="rectangle", parent=parent)
+    shape.addPoint(QtCore.QPointF(x1, y1))
+    shape.addPoint(QtCore.QPointF(x2, y2))
+    return shape
+
+
+def test_move_undo_redo():
+    text = _rectangle(0, 0, 100, 100)
+    row = _rectangle(10, 10, 90, 20, parent=text)
+    offset = QtCore.QPointF(5, 7)
+    text.moveBy(offset)
+
+    stack = UndoStack()
+    stack.push(MoveShapesCommand([text], offset))
+    stack.undo()
+    assert text[0] == QtCore.QPointF(0, 0)
+    assert row[0] == QtCore.QPointF(10, 10)
+    assert stack.canRedo()
+
+    stack.redo()
+    assert row[0] == QtCore.QPointF(15, 17)
+
+
+def test_delete_undo_restores_order():
+    text = _rectangle(0, 0, 100, 100)
+    rows = [_rectangle(10, 10 * i, 90, 10 * i + 5, parent=text) for i in range(3)]
+    shapes = rows + [text]
+
+    command = DeleteShapesCommand([rows[1]], shapes)
+    command.redo()
+    assert shapes == [rows[0], rows[2], text]
+    assert text.getChildren() == [rows[0], rows[2]]
+
+    command.undo()
+    assert shapes == rows + [text]
+    assert text.getChildren() == rows
+
+
+def test_delete_many_undo_restores_order():
+    texts = [_rectangle(0, 100 * i, 100, 100 * i + 90) for i in range(3)]
+    rows = [
+        [
+            _rectangle(10, 100 * i + 10 * j, 90, 100 * i + 10 * j + 5, parent=text)
+            for j in range(4)
+        ]
+        for i, text in enumerate(texts)
+    ]
+    shapes = [s for text, children in zip(texts, rows) for s in [text] + children]
+    original = list(shapes)
+
+    # Текст вместе со строками и отдельные строки других текстов
+    command = DeleteShapesCommand([texts[1], rows[0][1], rows[2][3]], shapes)
+    command.redo()
+    removed = [texts[1], rows[0][1], rows[2][3]] + rows[1]
+    assert shapes == [s for s in original if s not in removed]
+    assert texts[0].getChildren() == [rows[0][0], rows[0][2], rows[0][3]]
+
+    command.undo()
+    assert shapes == original
+    assert texts[0].getChildren() == rows[0]
+    assert texts[1].getChildren() == rows[1]
+    assert texts[2].getChildren() == rows[2]
+
+
+def test_create_undo():
+    shapes = []
+    shape = _rectangle(0, 0, 10, 10)
+    shapes.append(shape)
+
+    stack = UndoStack()
+    stack.push(CreateShapesCommand([shape], shapes))
+    stack.undo()
+    assert shapes == []
+    stack.redo()
+    assert shapes == [shape]
+
+
+def test_budget_drops_oldest():
+    shape = _rectangle(0, 0, 10, 10)
+    command = MoveVertexCommand(shape, 0, shape[0], shape[0])
+    stack = UndoStack(budget=command.size() * 3)
+    for _ in range(10):
+        stack.push(MoveVertexCommand(shape, 0, shape[0], shape[0]))
+    assert len(stack) == 3
+    assert stack.byteSize() <= stack.budget
@@ -0,0 +1,72 @@
+import gc
+import os.path as osp
+
+import numpy as np
+from qtpy import QtGui
+
+from labelme import utils
+from labelme.utils import qimage as qimage_module
+
+from .util import data_dir
+
+
+def _load_qimage():
+    img_file = osp.join(data_dir, "annotated_with_data/apc2016_obj3.jpg")
+    return QtGui.QImage(img_file)
+
+
+def test_img_qt_to_rgb_is_stride_correct_view():
+    img_qt = _load_qimage()
+    assert img_qt.format() == QtGui.QImage.Format_RGB32
+    expected = np.array(
+        [QtGui.QColor(img_qt.pixel(x, 10)).getRgb()[:3] for x in range(100)]
+    )
+
+    img_arr = qimage_module.img_qt_to_rgb(img_qt)
+    assert img_arr.shape == (img_qt.height(), img_qt.width(), 3)
+    assert not img_arr.flags.writeable
+    np.testing.assert_array_equal(img_arr[10, :100], expected)
+
+    # RGB888 с шириной, не кратной 4: строки выровнены bytesPerLine
+    img_rgb = img_qt.copy(0, 0, 99, 20).convertToFormat(QtGui.QImage.Format_RGB888)
+    assert img_rgb.bytesPerLine() != 99 * 3
+    np.testing.assert_array_equal(
+        qimage_module.img_qt_to_rgb(img_rgb)[10], expected[:99]
+    )
+    assert qimage_module.img_qt_to_arr(img_rgb).shape == (20, 99, 3)
+
+    del img_qt
+    gc.collect()  # массив держит изображение
+    np.testing.assert_array_equal(img_arr[10, :100], expected)
+
+
+def test_img_arr_to_qt_shares_memory():
+    img_arr = np.zeros((20, 30, 4), dtype=np.uint8)
+    img_qt = qimage_module.img_arr_to_qt(img_arr[:, 5:15])
+    assert (img_qt.width(), img_qt.height()) == (10, 20)
+    img_arr[3, 7] = (255, 0, 0, 255)
+    assert img_qt.pixelColor(2, 3) == QtGui.QColor(255, 0, 0, 255)
+
+    gray = qimage_module.img_arr_to_qt(np.full((5, 5), 7, dtype=np.uint8))
+    assert gray.format() == QtGui.QImage.Format_Grayscale8
+    assert qimage_module.img_qt_to_arr(gray)[4, 4, 0] == 7
+
+
+def test_img_data_to_qt_draft():
+    img_file = osp.join(data_dir, "raw/2011_000003.jpg")
+    with open(img_file, "rb") as f:
+        img_data = f.read()
+    full = QtGui.QImage.fromData(img_data)
+
+    img_qt, size = qimage_module.img_data_to_qt_draft(img_data, (100, 100))
+    assert size == (full.width(), full.height())
+    # JPEG уменьшается в 2**k раз с округлением вверх
+    assert (img_qt.width(), img_qt.height()) == (
+        -(-full.width() // 4),
+        -(-full.height() // 4),
+    )
+
+    # Уменьшать не нужно или не JPEG
+    assert qimage_module.img_data_to_qt_draft(img_data, (400, 400)) is None
+    png_data = utils.img_arr_to_data(qimage_module.img_qt_to_rgb(full)[:20, :20])
+    assert qimage_module.img_data_to_qt_draft(png_data, (5, 5)) is None
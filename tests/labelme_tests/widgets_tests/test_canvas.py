@@ -0,0 +1,174 @@
+import threading
+
+import numpy as np
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme.ai import PredictionWorker
+from labelme.image_source import ImageSource
+from labelme.shape import Shape
+from labelme.widgets.canvas import Canvas
+
+
+def _rectangle(x, y, parent=None, tree=None):
+    shape = Shape(shape_type="rectangle", parent=parent, tree=tree)
+    shape.addPoint(QtCore.QPointF(x, y))
+    shape.addPoint(QtCore.QPointF(x + 10, y + 10))
+    return shape
+
+
+def test_focus_visibility(qtbot):
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    canvas.loadPixmap(QtGui.QPixmap(100, 100))
+    text = _rectangle(0, 0)
+    rows = [_rectangle(0, 0, parent=text), _rectangle(0, 20, parent=text)]
+    other = _rectangle(50, 50)
+    canvas.loadShapes([text] + rows + [other])
+    assert text.tree is canvas.shapeTree and other.tree is canvas.shapeTree
+
+    canvas.setShapeVisible(rows[1], False)
+    assert not canvas.isVisible(rows[1]) and canvas.isHidden(rows[1])
+
+    canvas.selectedShapes = [text]
+    canvas.zoomParentShape()
+    assert [canvas.isVisible(s) for s in [text, rows[0], other]] == [
+        False,
+        True,
+        False,
+    ]
+    assert not canvas.isVisible(rows[1])  # скрытие пользователем сохраняется
+    assert canvas._visibleShapes(canvas.shapes) == [rows[0]]
+
+    canvas.unZoomParentShape()
+    assert canvas.parentShape is None
+    assert canvas.isVisible(text) and canvas.isVisible(other)
+    assert not canvas.isVisible(rows[1])
+
+
+def test_focus_crops_without_copying(qtbot):
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    image = QtGui.QImage(200, 100, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(255, 0, 0))
+    canvas.loadImage(image)
+    text = _rectangle(40, 30)
+    canvas.loadShapes([text])
+
+    canvas.selectedShapes = [text]
+    canvas.zoomParentShape()
+    assert canvas.image_offsets == (40, 30)
+    assert canvas.imageSize() == QtCore.QSize(10, 10)
+    assert canvas._image.cacheKey() == image.cacheKey()
+    point = canvas.transformPos(QtCore.QPointF(0, 0))
+    assert canvas.transformPos(QtCore.QPointF(canvas.scale, canvas.scale)) == (
+        point + QtCore.QPointF(1, 1)
+    )
+    assert not canvas.outOfPixmap(QtCore.QPointF(45, 35))
+    assert canvas.outOfPixmap(QtCore.QPointF(20, 20))
+
+    # Рисуется только показываемая область, в центре виджета
+    target = QtGui.QImage(canvas.size(), QtGui.QImage.Format_RGB32)
+    target.fill(QtGui.QColor(255, 255, 255))
+    canvas.render(target)
+    center = canvas.rect().center()
+    assert target.pixelColor(center) == QtGui.QColor(255, 0, 0)
+    assert target.pixelColor(center + QtCore.QPoint(10, 10)) != QtGui.QColor(
+        255, 0, 0
+    )
+
+    canvas.unZoomParentShape()
+    assert canvas.image_offsets == (0, 0)
+    assert canvas.imageSize() == image.size()
+
+
+def test_preview_is_upgraded(qtbot):
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    image = QtGui.QImage(800, 400, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(0, 0, 255))
+    canvas.loadImage(image.scaled(200, 100), size=image.size())
+    assert canvas.isPreview()
+    assert canvas.imageSize() == image.size() == canvas.pageSize()
+
+    target = QtGui.QImage(canvas.size(), QtGui.QImage.Format_RGB32)
+    canvas.scale = 0.25  # копии хватает
+    with qtbot.assertNotEmitted(canvas.fullImageRequested):
+        canvas.render(target)
+    canvas.scale = 1.0
+    with qtbot.waitSignal(canvas.fullImageRequested):
+        canvas.render(target)
+
+    canvas.setFullImage(image)
+    assert not canvas.isPreview()
+    assert canvas._image is image
+
+
+def test_preview_reads_tiles_from_source(qtbot):
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    canvas.resize(200, 200)
+    image = QtGui.QImage(800, 400, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(0, 0, 255))
+    data = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(data)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    preview = image.scaled(200, 100)
+    canvas.loadImage(preview, size=image.size(), source=ImageSource(bytes(data)))
+    assert canvas.isPreview()
+
+    # Подробные тайлы читаются в фоне, полное изображение не нужно
+    target = QtGui.QImage(canvas.size(), QtGui.QImage.Format_RGB32)
+    canvas.scale = 1.0
+    with qtbot.assertNotEmitted(canvas.fullImageRequested):
+        with qtbot.waitSignal(canvas._tileReader.loaded):
+            canvas.render(target)
+        qtbot.waitUntil(lambda: not canvas._pyramid._requested)
+    assert {key[0] for key in canvas._pyramid._tiles} == {0}
+    assert canvas._image is preview
+
+    # Полное изображение для модели не заменяет копию
+    canvas.setFullImage(image)
+    assert canvas.isPreview()
+    assert canvas._image is preview
+
+
+class _SlowModel:
+    """Модель, декодер которой ждёт разрешения из теста."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def wait_for_image_embedding(self):
+        return None
+
+    def predict_mask_from_points(self, points, point_labels):
+        self.release.wait(timeout=5)
+        mask = np.zeros((40, 40), dtype=bool)
+        mask[10:30, 10:30] = True
+        return mask
+
+
+def test_ai_finalise_does_not_block(qtbot):
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    canvas.loadImage(QtGui.QImage(40, 40, QtGui.QImage.Format_RGB32))
+    model = _SlowModel()
+    canvas._aiWorker = PredictionWorker(model, canvas)
+    canvas._aiWorker.predicted.connect(canvas._aiPredicted)
+    canvas.createMode = "ai_polygon"
+    canvas.current = Shape(shape_type="points", tree=canvas.shapeTree)
+    canvas.current.addPoint(QtCore.QPointF(20, 20))
+
+    # Предпросмотра нет: finalise возвращается сразу, не дожидаясь модели
+    canvas.finalise()
+    canvas.finalise()  # повторное завершение не ставит второй запрос
+    assert canvas.shapes == [] and canvas.current is not None
+
+    with qtbot.waitSignal(canvas.newShape):
+        model.release.set()
+    assert len(canvas.shapes) == 1
+    assert canvas.shapes[0].shape_type == "polygon"
+    assert canvas.shapes[0].getBounds() == (10.5, 10.5, 30.5, 30.5)
+    assert canvas.current is None
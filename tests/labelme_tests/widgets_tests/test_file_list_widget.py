@@ -0,0 +1,86 @@
+import os.path as osp
+import shutil
+
+from qtpy import QtWidgets
+from qtpy.QtCore import Qt
+
+from labelme.thumbnails import ThumbnailLoader
+from labelme.widgets import FileListWidget
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "..", "data")
+
+
+def _widget(qtbot, filenames):
+    widget = FileListWidget()
+    qtbot.addWidget(widget)
+    widget.addFiles([(f, i % 2 == 0) for i, f in enumerate(filenames)])
+    return widget
+
+
+def test_rows_and_checked(qtbot):
+    widget = _widget(qtbot, ["a.jpg", "b.jpg", "c.jpg"])
+    widget.addFiles([("b.jpg", True), ("d.jpg", False)])  # b.jpg уже есть
+
+    assert widget.filenames() == ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    assert widget.row("c.jpg") == 2
+    assert widget.row("missing.jpg") == -1
+    assert widget.filename(1) == "b.jpg"
+
+    model = widget.fileModel()
+    assert model.isChecked("a.jpg") and not model.isChecked("b.jpg")
+    widget.setChecked("b.jpg", True)
+    assert model.data(model.index(1), Qt.CheckStateRole) == Qt.Checked
+
+
+def test_filter_keeps_rows_consistent(qtbot):
+    widget = _widget(qtbot, ["page1.jpg", "cover.jpg", "page2.jpg"])
+    widget.setFilter(r"page\d")
+    assert widget.filenames() == ["page1.jpg", "page2.jpg"]
+    assert widget.row("page2.jpg") == 1
+    assert widget.row("cover.jpg") == -1
+
+    widget.setFilter("[")  # некорректное выражение ничего не скрывает
+    assert widget.count() == 3
+
+
+def test_selection_signal(qtbot):
+    widget = _widget(qtbot, ["a.jpg", "b.jpg"])
+    with qtbot.waitSignal(widget.itemSelectionChanged):
+        widget.setCurrentRow(1)
+    assert widget.currentRow() == 1
+    assert widget.selectedFilenames() == ["b.jpg"]
+
+
+def test_thumbnail_mode(qtbot, tmp_path):
+    filename = str(tmp_path / "page.jpg")
+    shutil.copy(osp.join(data_dir, "raw/2011_000003.jpg"), filename)
+    widget = _widget(qtbot, [filename])
+    model = widget.fileModel()
+    index = model.index(0)
+    assert model.data(index, Qt.DecorationRole) is None
+
+    list_state = (
+        widget.resizeMode(),
+        widget.movement(),
+        widget.iconSize(),
+        widget.gridSize(),
+        widget.textElideMode(),
+    )
+    loader = ThumbnailLoader(size=64)
+    widget.setThumbnailLoader(loader)
+    assert widget.viewMode() == QtWidgets.QListView.IconMode
+    with qtbot.waitSignal(model.dataChanged):
+        model.data(index, Qt.DecorationRole)
+    assert not model.data(index, Qt.DecorationRole).isNull()
+
+    widget.setThumbnailLoader(None)
+    assert widget.viewMode() == QtWidgets.QListView.ListMode
+    assert (
+        widget.resizeMode(),
+        widget.movement(),
+        widget.iconSize(),
+        widget.gridSize(),
+        widget.textElideMode(),
+    ) == list_state
+    assert model.data(index, Qt.DecorationRole) is None
@@ -1,7 +1,9 @@
 # -*- encoding: utf-8 -*-
 
 import pytest
+from qtpy import QtWidgets
 
+from labelme.shape import Shape
 from labelme.widgets import LabelListWidget
 from labelme.widgets import LabelListWidgetItem
 
@@ -18,3 +20,72 @@ def test_LabelListWidget(qtbot):
     widget.show()
     qtbot.addWidget(widget)
     qtbot.waitExposed(widget)
+
+
+def _widget_with_shapes(n):
+    widget = LabelListWidget()
+    shapes = [Shape(label=str(i)) for i in range(n)]
+    for shape in shapes:
+        widget.addItem(LabelListWidgetItem(text=shape.label, shape=shape))
+    return widget, shapes
+
+
+def test_LabelListWidget_findItemByShape(qtbot):
+    widget, shapes = _widget_with_shapes(5)
+    qtbot.addWidget(widget)
+    assert widget.findItemByShape(shapes[3]).text() == "3"
+
+    widget.removeItems([widget.findItemByShape(s) for s in shapes[1:3] + shapes[4:]])
+    assert [item.text() for item in widget] == ["0", "3"]
+    with pytest.raises(ValueError):
+        widget.findItemByShape(shapes[1])
+
+    # перемещение строки: модель вставляет копию и удаляет старую строку
+    item = widget.findItemByShape(shapes[3])
+    widget.model().insertRow(0, item.clone())
+    widget.model().removeRows(item.row(), 1)
+    assert widget.findItemByShape(shapes[3]).row() == 0
+
+    widget.clear()
+    with pytest.raises(ValueError):
+        widget.findItemByShape(shapes[0])
+
+
+def test_LabelListWidget_selectItems(qtbot):
+    widget, shapes = _widget_with_shapes(5)
+    qtbot.addWidget(widget)
+    signals = []
+    widget.itemSelectionChanged.connect(lambda s, d: signals.append(s))
+
+    widget.selectItems([widget.findItemByShape(s) for s in shapes[1:4]])
+    assert len(signals) == 1
+    assert sorted(item.text() for item in widget.selectedItems()) == ["1", "2", "3"]
+
+
+def test_LabelListWidget_addItems(qtbot):
+    widget = LabelListWidget()
+    qtbot.addWidget(widget)
+    inserted = []
+    widget.model().rowsInserted.connect(lambda *args: inserted.append(args[1:]))
+
+    shapes = [Shape(label=str(i)) for i in range(3)]
+    widget.addItems([LabelListWidgetItem(s.label, s) for s in shapes])
+    assert inserted == [(0, 2)]
+    assert widget.findItemByShape(shapes[2]).text() == "2"
+
+
+def test_HTMLDelegate_caches_documents(qtbot):
+    widget, shapes = _widget_with_shapes(3)
+    qtbot.addWidget(widget)
+    delegate = widget.itemDelegate()
+    option = QtWidgets.QStyleOptionViewItem()
+    index = widget.model().index(0, 0)
+
+    size = delegate.sizeHint(option, index)
+    assert len(delegate._documents) == 1
+    assert delegate.sizeHint(option, index) == size
+    assert len(delegate._documents) == 1
+
+    widget.findItemByShape(shapes[0]).setText("<b>{}</b>".format("0" * 20))
+    assert delegate.sizeHint(option, index).width() > size.width()
+    assert len(delegate._documents) == 2